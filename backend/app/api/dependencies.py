@@ -1,22 +1,40 @@
 """Shared dependencies for API routes."""
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+from fastapi import Request
+from app.config import settings
 from app.services.vector_store import VectorStoreService
 from app.services.qa_service import QAService
 from app.services.pdf_parser import PDFParser
 from app.services.chunking import ChunkingService
 
 
+logger = logging.getLogger(__name__)
+
 # Global service instances (singletons)
 _vector_store_service: VectorStoreService | None = None
 _qa_service: QAService | None = None
 _pdf_parser: PDFParser | None = None
 _chunking_service: ChunkingService | None = None
 
+# Guards singleton creation so concurrent first requests build one instance.
+# Reentrant because get_qa_service builds the vector store under the lock.
+_services_lock = threading.RLock()
+
+# Readiness: set once startup warm-up has finished
+_ready = threading.Event()
+_warmup_error: str | None = None
+
 
 def get_vector_store_service() -> VectorStoreService:
     """Get or create vector store service instance."""
     global _vector_store_service
     if _vector_store_service is None:
-        _vector_store_service = VectorStoreService()
+        with _services_lock:
+            if _vector_store_service is None:
+                _vector_store_service = VectorStoreService()
     return _vector_store_service
 
 
@@ -24,8 +42,10 @@ def get_qa_service() -> QAService:
     """Get or create QA service instance."""
     global _qa_service
     if _qa_service is None:
-        vector_store = get_vector_store_service()
-        _qa_service = QAService(vector_store)
+        with _services_lock:
+            if _qa_service is None:
+                vector_store = get_vector_store_service()
+                _qa_service = QAService(vector_store)
     return _qa_service
 
 
@@ -33,7 +53,9 @@ def get_pdf_parser() -> PDFParser:
     """Get or create PDF parser instance."""
     global _pdf_parser
     if _pdf_parser is None:
-        _pdf_parser = PDFParser()
+        with _services_lock:
+            if _pdf_parser is None:
+                _pdf_parser = PDFParser()
     return _pdf_parser
 
 
@@ -41,6 +63,87 @@ def get_chunking_service() -> ChunkingService:
     """Get or create chunking service instance."""
     global _chunking_service
     if _chunking_service is None:
-        _chunking_service = ChunkingService()
+        with _services_lock:
+            if _chunking_service is None:
+                _chunking_service = ChunkingService()
     return _chunking_service
 
+
+def get_client_id(request: Request) -> Optional[str]:
+    """
+    Identify the client for fair LLM admission.
+
+    Uses the X-Client-ID header when the client (or a proxy in front of the
+    API) sets one, otherwise the peer address.
+    """
+    client_id = request.headers.get("x-client-id")
+    if client_id:
+        return client_id
+    return request.client.host if request.client else None
+
+
+def warm_up_services(
+    get_vector_store: Callable[[], VectorStoreService] = get_vector_store_service,
+    get_qa: Callable[[], QAService] = get_qa_service
+):
+    """
+    Build the query services and exercise them once so the first user request is fast.
+
+    Opens the vector store, builds the QA service, runs one embedding and one
+    search, and optionally loads chunks into the chunk cache. Marks the
+    worker ready when done; on failure the error is kept for the readiness
+    endpoint and the worker stays not ready.
+
+    Args:
+        get_vector_store: Provider of the vector store service
+        get_qa: Provider of the QA service
+
+    Returns:
+        True if the warm-up succeeded
+    """
+    global _warmup_error
+    try:
+        vector_store = get_vector_store()
+        get_qa()
+        if settings.warmup_query:
+            vector_store.search_with_embeddings(settings.warmup_query, k=1)
+        if settings.warmup_preload_chunks:
+            vector_store.chunk_storage.preload(settings.warmup_preload_chunks)
+        _warmup_error = None
+        _ready.set()
+        return True
+    except Exception as e:
+        _warmup_error = str(e)
+        logger.exception("Service warm-up failed")
+        return False
+
+
+async def warm_up_until_ready(
+    get_vector_store: Callable[[], VectorStoreService] = get_vector_store_service,
+    get_qa: Callable[[], QAService] = get_qa_service
+):
+    """
+    Run the warm-up in a thread, retrying with exponential backoff until it succeeds.
+
+    A transient failure at startup (vector store or embedding provider not
+    reachable yet) would otherwise leave the worker not ready for good.
+
+    Args:
+        get_vector_store: Provider of the vector store service
+        get_qa: Provider of the QA service
+    """
+    delay = 1.0
+    while not await asyncio.to_thread(warm_up_services, get_vector_store, get_qa):
+        logger.warning("Retrying service warm-up in %.0fs", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.warmup_retry_max_s)
+
+
+def readiness() -> tuple[bool, str | None]:
+    """
+    Report whether startup warm-up has completed.
+
+    Returns:
+        Tuple of (ready, warm-up error if it failed)
+    """
+    return _ready.is_set(), _warmup_error
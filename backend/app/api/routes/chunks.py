@@ -1,17 +1,191 @@
-"""Chunk retrieval endpoint."""
-from fastapi import APIRouter, HTTPException, Depends
-from app.models.response import ChunkResponse
+"""Chunk retrieval endpoints."""
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Depends, Header, Query
+from pydantic import BaseModel
+from app.config import settings
+from app.models.response import ChunkBatchResponse, ChunkResponse, HighlightResponse, PageHighlight
 from app.api.dependencies import get_vector_store_service
 from app.services.vector_store import VectorStoreService
-from app.models.chunk import Atom
+from app.models.chunk import Atom, Chunk
+from app.services.highlights import resolve_highlight
+from app.utils.serialization import encode_response
 
 
 router = APIRouter(prefix="/api/chunks", tags=["chunks"])
 
+# Fields a batch request may select; chunk_id is always returned
+CHUNK_FIELDS = ("text", "pdf_id", "page_start", "page_end", "section_title", "atoms")
+
+# Fields of ChunkResponse, dumped straight from the stored chunk
+CHUNK_RESPONSE_FIELDS = {"chunk_id", *CHUNK_FIELDS}
+
+
+class ChunkBatchRequest(BaseModel):
+    """Request model for batch chunk retrieval."""
+    ids: list[str]
+    fields: Optional[list[str]] = None  # Subset of CHUNK_FIELDS; all when omitted
+    page: Optional[int] = None  # Only return atoms on this page (0-indexed)
+
+
+def _chunk_to_dict(chunk: Chunk, fields: tuple, page: Optional[int]) -> dict:
+    """
+    Serialize the selected fields of a chunk.
+    
+    Args:
+        chunk: Chunk to serialize
+        fields: Fields to include besides chunk_id
+        page: If set, only atoms on this page are included
+        
+    Returns:
+        Dict with chunk_id and the selected fields
+    """
+    data = {"chunk_id": chunk.chunk_id}
+    for field in fields:
+        if field == "atoms":
+            atoms = chunk.atoms if page is None else [a for a in chunk.atoms if a.page_num == page]
+            data["atoms"] = [atom.model_dump() for atom in atoms]
+        else:
+            data[field] = getattr(chunk, field)
+    return data
+
+
+def _get_chunk_batch(
+    vector_store: VectorStoreService,
+    ids: list[str],
+    fields: Optional[list[str]],
+    page: Optional[int]
+) -> dict:
+    """
+    Fetch and serialize several chunks in one storage pass.
+    
+    Args:
+        vector_store: Vector store service
+        ids: Chunk IDs to retrieve
+        fields: Fields to include, or None for all
+        page: If set, only atoms on this page are included
+        
+    Returns:
+        ChunkBatchResponse fields: found chunks in request order and missing IDs
+    """
+    ids = [chunk_id for chunk_id in dict.fromkeys(ids) if chunk_id]
+    if not ids:
+        raise HTTPException(status_code=400, detail="At least one chunk ID is required")
+    if len(ids) > settings.chunk_batch_max_ids:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many chunk IDs: {len(ids)} (limit {settings.chunk_batch_max_ids})"
+        )
+    
+    selected = tuple(fields) if fields else CHUNK_FIELDS
+    unknown = [field for field in selected if field not in CHUNK_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown chunk fields: {', '.join(unknown)}")
+    
+    try:
+        found = vector_store.get_chunks_by_ids(ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving chunks: {str(e)}")
+    
+    return {
+        "chunks": [_chunk_to_dict(found[chunk_id], selected, page) for chunk_id in ids if chunk_id in found],
+        "missing": [chunk_id for chunk_id in ids if chunk_id not in found]
+    }
+
+
+@router.get("", response_model=ChunkBatchResponse)
+def get_chunks(
+    ids: str = Query(..., description="Comma-separated chunk IDs"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to include"),
+    page: Optional[int] = Query(None, description="Only include atoms on this page (0-indexed)"),
+    accept: Optional[str] = Header(None),
+    vector_store: VectorStoreService = Depends(get_vector_store_service)
+):
+    """
+    Retrieve several chunks by ID.
+    
+    Args:
+        ids: Comma-separated chunk IDs
+        fields: Comma-separated fields to include (default all)
+        page: Only include atoms on this page
+        accept: Accept header; application/msgpack selects MessagePack
+        vector_store: Vector store service
+        
+    Returns:
+        ChunkBatchResponse with found chunks and missing IDs
+    """
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    batch = _get_chunk_batch(vector_store, [i.strip() for i in ids.split(",")], field_list, page)
+    return encode_response(batch, accept)
+
+
+@router.post("", response_model=ChunkBatchResponse)
+def post_chunks(
+    request: ChunkBatchRequest,
+    accept: Optional[str] = Header(None),
+    vector_store: VectorStoreService = Depends(get_vector_store_service)
+):
+    """
+    Retrieve several chunks by ID (for ID lists too long for a query string).
+    
+    Args:
+        request: Batch request with IDs, fields and page
+        accept: Accept header; application/msgpack selects MessagePack
+        vector_store: Vector store service
+        
+    Returns:
+        ChunkBatchResponse with found chunks and missing IDs
+    """
+    batch = _get_chunk_batch(vector_store, request.ids, request.fields, request.page)
+    return encode_response(batch, accept)
+
+
+@router.get("/{chunk_id}/highlight", response_model=HighlightResponse)
+def get_chunk_highlight(
+    chunk_id: str,
+    start: int = Query(..., ge=0, description="Quote start position in chunk text"),
+    end: int = Query(..., ge=0, description="Quote end position in chunk text"),
+    vector_store: VectorStoreService = Depends(get_vector_store_service)
+):
+    """
+    Resolve a quote span in a chunk to PDF highlight rectangles.
+    
+    Args:
+        chunk_id: Chunk containing the quote
+        start: Quote start position in chunk text
+        end: Quote end position in chunk text
+        vector_store: Vector store service
+        
+    Returns:
+        HighlightResponse with merged per-line rectangles grouped by page
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be greater than start")
+    
+    try:
+        chunk = vector_store.get_chunk_by_id(chunk_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error retrieving chunk: {str(e)}")
+    if chunk is None:
+        raise HTTPException(status_code=404, detail=f"Chunk {chunk_id} not found")
+    
+    by_page = resolve_highlight(chunk, start, end)
+    return HighlightResponse(
+        chunk_id=chunk.chunk_id,
+        pdf_id=chunk.pdf_id,
+        highlights=[
+            PageHighlight(
+                page_num=page_num,
+                bboxes=[[round(box.x0, 2), round(box.y0, 2), round(box.x1, 2), round(box.y1, 2)] for box in boxes]
+            )
+            for page_num, boxes in by_page.items()
+        ]
+    )
+
 
 @router.get("/{chunk_id}", response_model=ChunkResponse)
-async def get_chunk(
+def get_chunk(
     chunk_id: str,
+    accept: Optional[str] = Header(None),
     vector_store: VectorStoreService = Depends(get_vector_store_service)
 ):
     """
@@ -19,6 +193,7 @@ async def get_chunk(
     
     Args:
         chunk_id: Chunk ID to retrieve
+        accept: Accept header; application/msgpack selects MessagePack
         vector_store: Vector store service
         
     Returns:
@@ -30,18 +205,8 @@ async def get_chunk(
         if chunk is None:
             raise HTTPException(status_code=404, detail=f"Chunk {chunk_id} not found")
         
-        # Convert atoms to dict for JSON serialization
-        atoms_dict = [atom.model_dump() for atom in chunk.atoms]
-        
-        return ChunkResponse(
-            chunk_id=chunk.chunk_id,
-            text=chunk.text,
-            pdf_id=chunk.pdf_id,
-            page_start=chunk.page_start,
-            page_end=chunk.page_end,
-            section_title=chunk.section_title,
-            atoms=atoms_dict
-        )
+        # The stored chunk is already validated; dump it once and encode
+        return encode_response(chunk.model_dump(include=CHUNK_RESPONSE_FIELDS), accept)
     except HTTPException:
         raise
     except Exception as e:
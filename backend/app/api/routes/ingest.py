@@ -3,10 +3,12 @@ import uuid
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
 from app.models.response import IngestionResponse
 from app.api.dependencies import get_pdf_parser, get_chunking_service, get_vector_store_service
+from app.config import settings
 from app.services.pdf_parser import PDFParser
 from app.services.chunking import ChunkingService
 from app.services.vector_store import VectorStoreService
 from app.services.pdf_registry import PDFRegistry
+from app.utils.metrics import INGEST_STAGE_SECONDS
 import tempfile
 import os
 from pathlib import Path
@@ -16,7 +18,7 @@ router = APIRouter(prefix="/api/ingest", tags=["ingest"])
 
 
 @router.post("", response_model=IngestionResponse)
-async def ingest_pdf(
+def ingest_pdf(
     file: UploadFile = File(...),
     pdf_parser: PDFParser = Depends(get_pdf_parser),
     chunking_service: ChunkingService = Depends(get_chunking_service),
@@ -34,6 +36,12 @@ async def ingest_pdf(
     Returns:
         IngestionResponse with status and chunk count
     """
+    if settings.worker_role == "reader":
+        raise HTTPException(
+            status_code=403,
+            detail="This worker is read-only; send ingest requests to the writer"
+        )
+    
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="File must be a PDF")
     
@@ -47,7 +55,7 @@ async def ingest_pdf(
     try:
         # Save uploaded file
         saved_path = storage_dir / f"{pdf_id}.pdf"
-        content = await file.read()
+        content = file.file.read()
         with open(saved_path, 'wb') as f:
             f.write(content)
         
@@ -56,15 +64,18 @@ async def ingest_pdf(
         registry.register_pdf(pdf_id, saved_path, file.filename or "uploaded.pdf")
         
         # Parse PDF
-        metadata, atoms = pdf_parser.parse_pdf(str(saved_path), pdf_id=pdf_id)
+        with INGEST_STAGE_SECONDS.labels("parse").time():
+            metadata, atoms = pdf_parser.parse_pdf(str(saved_path), pdf_id=pdf_id)
         
         # Chunk atoms
-        chunks = chunking_service.group_atoms_into_chunks(
-            atoms=atoms,
-            pdf_id=pdf_id
-        )
+        with INGEST_STAGE_SECONDS.labels("chunk").time():
+            chunks = chunking_service.group_atoms_into_chunks(
+                atoms=atoms,
+                pdf_id=pdf_id
+            )
         
-        # Add chunks to vector store (this also saves full chunks with atoms)
+        # Add chunks to vector store (this also saves full chunks with atoms;
+        # embed and store stages are timed there)
         if chunks:
             vector_store.add_chunks(chunks)
         
@@ -1,11 +1,20 @@
 """Query endpoint for Q&A."""
+import asyncio
 import json
-from fastapi import APIRouter, HTTPException, Depends
+from typing import AsyncIterator, Optional
+import anyio
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from app.config import settings
+from app.models.chunk import RetrievalFilter
 from app.models.response import QueryResponse, SourceReference
-from app.api.dependencies import get_qa_service
+from app.api.dependencies import get_client_id, get_qa_service
+from app.services.admission import AdmissionRejected
 from app.services.qa_service import QAService
+from app.utils.metrics import STREAM_FRAMES
+from app.utils.serialization import dumps, encode_response
+from app.utils.sse import TokenCoalescer, format_sse_event
 
 
 router = APIRouter(prefix="/api/query", tags=["query"])
@@ -22,91 +31,400 @@ class QueryRequest(BaseModel):
     question: str
     k: int = 5  # Number of chunks to retrieve
     conversation_history: list[ConversationMessage] = []  # Previous messages for context
+    conversation_id: Optional[str] = None  # Stable per chat session; keys the history summary cache
+    filters: Optional[RetrievalFilter] = None  # Restrict retrieval by PDF, page range or section
+    stream_flush_bytes: Optional[int] = None  # Streaming only: token frame size threshold (0 = every token)
+    stream_flush_ms: Optional[float] = None  # Streaming only: token frame delay threshold
+    include_geometry: bool = False  # Streaming only: attach atom geometry to the retrieved event
+
+
+class BatchQueryRequest(BaseModel):
+    """Request model for batch query endpoint."""
+    questions: list[str]
+    k: int = 5  # Number of chunks to retrieve per question
+    filters: Optional[RetrievalFilter] = None  # Applied to every question
+    max_concurrency: Optional[int] = None  # Concurrent LLM calls, capped by BATCH_MAX_CONCURRENCY
+
+
+def _too_many_requests(error: AdmissionRejected) -> HTTPException:
+    """429 response telling the client when to retry."""
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def _admit(qa_service: QAService):
+    """Reject the request up front if the LLM queue is already full."""
+    try:
+        qa_service.admission.check()
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
 
 
 @router.post("", response_model=QueryResponse)
 async def query(
     request: QueryRequest,
-    qa_service: QAService = Depends(get_qa_service)
+    accept: Optional[str] = Header(None),
+    qa_service: QAService = Depends(get_qa_service),
+    client_id: Optional[str] = Depends(get_client_id)
 ):
     """
     Answer a question about Catan rules.
     
     Args:
         request: Query request with question
+        accept: Accept header; application/msgpack selects MessagePack
         qa_service: QA service instance
+        client_id: Client identifier for fair LLM admission
         
     Returns:
         QueryResponse with answer and sources
     """
     try:
-        response = qa_service.answer_question(
+        # In a thread, so identical concurrent questions can wait on one answer
+        response = await asyncio.to_thread(
+            qa_service.answer_question,
             question=request.question,
-            k=request.k
+            k=request.k,
+            filters=request.filters,
+            client_id=client_id
         )
-        return response
+        return encode_response(response.model_dump(), accept)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
 
 
-def generate_sse_events(qa_service: QAService, question: str, k: int, conversation_history: list = None):
+async def generate_batch_results(
+    qa_service: QAService,
+    request: BatchQueryRequest,
+    max_concurrency: int,
+    client_id: Optional[str] = None
+):
     """
-    Generator function for SSE events.
+    Generator function for NDJSON batch results.
 
     Args:
         qa_service: QA service instance
-        question: User's question
-        k: Number of chunks to retrieve
-        conversation_history: Previous conversation messages
+        request: Batch query request
+        max_concurrency: Maximum number of concurrent LLM calls
+        client_id: Client identifier for fair LLM admission
+
+    Yields:
+        One JSON line per question, in completion order: its answer, or an
+        error and retry_after (seconds) if no LLM slot could be obtained
+    """
+    try:
+        async for index, response in qa_service.answer_questions_batch(
+            request.questions, request.k, request.filters, max_concurrency, client_id
+        ):
+            result = {"index": index, "question": request.questions[index]}
+            if isinstance(response, AdmissionRejected):
+                result.update(error=str(response), retry_after=response.retry_after)
+            else:
+                result.update(response.model_dump())
+            yield dumps(result) + b"\n"
+    except Exception as e:
+        yield dumps({"error": f"Error processing batch: {str(e)}"}) + b"\n"
+
+
+@router.post("/batch")
+async def query_batch(
+    request: BatchQueryRequest,
+    qa_service: QAService = Depends(get_qa_service),
+    client_id: Optional[str] = Depends(get_client_id)
+):
+    """
+    Answer many questions, streaming each result as NDJSON when it finishes.
+    
+    Args:
+        request: Batch query request with questions
+        qa_service: QA service instance
+        client_id: Client identifier for fair LLM admission
+        
+    Returns:
+        StreamingResponse with one JSON object per line
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="At least one question is required")
+    if len(request.questions) > settings.batch_max_questions:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size {len(request.questions)} exceeds limit of {settings.batch_max_questions}"
+        )
+    _admit(qa_service)
+    
+    max_concurrency = min(
+        request.max_concurrency or settings.batch_max_concurrency,
+        settings.batch_max_concurrency
+    )
+    
+    return StreamingResponse(
+        generate_batch_results(qa_service, request, max_concurrency, client_id),
+        media_type="application/x-ndjson"
+    )
+
+
+class SSEEventEncoder:
+    """Encodes QA stream events as SSE frames, coalescing answer tokens."""
+
+    def __init__(self, request: QueryRequest):
+        """
+        Initialize the encoder with the request's streaming options.
+
+        Args:
+            request: Query request with streaming options
+        """
+        self.coalescer = TokenCoalescer(
+            max_bytes=request.stream_flush_bytes if request.stream_flush_bytes is not None else settings.sse_flush_bytes,
+            max_delay_ms=request.stream_flush_ms if request.stream_flush_ms is not None else settings.sse_flush_ms
+        )
+        self.frames = 0
+        self.token_frames = 0
+
+    def encode(self, event_type: str, data) -> list[str]:
+        """
+        Encode one QA stream event.
+
+        Tokens are buffered until the byte or delay threshold is reached, and
+        flushed before any other event.
+
+        Args:
+            event_type: Event type from the QA service
+            data: Event payload
+
+        Returns:
+            SSE frames to send now (possibly none)
+        """
+        if event_type == "token":
+            text = self.coalescer.add(data)
+            if text is None:
+                return []
+            self.frames += 1
+            self.token_frames += 1
+            return [format_sse_event("token", text)]
+
+        # Keep event order: buffered text precedes whatever comes next
+        frames = self.flush()
+
+        self.frames += 1
+        if event_type == "sources":
+            # Convert SourceReference objects to dicts for JSON serialization
+            sources_data = [
+                {
+                    "chunk_id": src.chunk_id,
+                    "quote_char_start": src.quote_char_start,
+                    "quote_char_end": src.quote_char_end
+                }
+                for src in data
+            ]
+            frames.append(format_sse_event("sources", json.dumps(sources_data)))
+        elif event_type == "retrieved":
+            frames.append(format_sse_event(
+                "retrieved",
+                dumps([chunk.model_dump(exclude_none=True) for chunk in data]).decode("utf-8")
+            ))
+        elif event_type == "citation":
+            frames.append(format_sse_event("citation", json.dumps(data.model_dump())))
+        elif event_type == "usage":
+            frames.append(format_sse_event("usage", json.dumps(data.model_dump())))
+        elif event_type == "done":
+            STREAM_FRAMES.observe(self.token_frames)
+            frames.append(format_sse_event("done", json.dumps({"frames": self.frames})))
+        elif event_type == "error":
+            frames.append(format_sse_event("error", json.dumps({"error": data})))
+        return frames
+
+    def flush_timeout(self) -> Optional[float]:
+        """Seconds until buffered tokens are due, or None if nothing is buffered."""
+        return self.coalescer.time_until_flush()
+
+    def flush(self) -> list[str]:
+        """
+        Send whatever tokens are buffered.
+
+        Returns:
+            A token frame, or no frames if nothing is buffered
+        """
+        text = self.coalescer.flush()
+        if text is None:
+            return []
+        self.frames += 1
+        self.token_frames += 1
+        return [format_sse_event("token", text)]
+
+
+def _stream_arguments(request: QueryRequest) -> tuple:
+    """Positional arguments of the QA service's streaming methods for a request."""
+    history = [{"role": msg.role, "content": msg.content} for msg in request.conversation_history]
+    return (
+        request.question,
+        request.k,
+        history,
+        request.filters,
+        request.conversation_id,
+        request.include_geometry
+    )
+
+
+async def _close(events: AsyncIterator) -> None:
+    """Close an async generator, even while the response is being cancelled."""
+    with anyio.CancelScope(shield=True):
+        await events.aclose()
+
+
+async def _start_stream(events: AsyncIterator[tuple]) -> AsyncIterator[tuple]:
+    """
+    Take the first event of a QA stream, before any response is sent.
+
+    Args:
+        events: QA stream events
+
+    Returns:
+        The same events, including the first one
+
+    Raises:
+        AdmissionRejected: If no LLM slot could be obtained for the stream
+    """
+    try:
+        first = await events.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except AdmissionRejected:
+        raise
+    except Exception as e:
+        first = ("error", str(e))
+
+    async def chained():
+        try:
+            if first is None:
+                return
+            yield first
+            async for event in events:
+                yield event
+        finally:
+            await _close(events)
+
+    return chained()
+
+
+async def generate_sse_events(events: AsyncIterator[tuple], request: QueryRequest) -> AsyncIterator[str]:
+    """
+    Async generator function for SSE events.
+
+    While tokens are buffered, the next event is awaited only until their
+    delay threshold, so a slow token does not hold back the ones before it.
+    The read continues in a task across flushes, since cancelling it would
+    abort the stream.
+
+    Args:
+        events: QA stream events
+        request: Query request with streaming options
 
     Yields:
         SSE formatted event strings
     """
+    encoder = SSEEventEncoder(request)
+    pending: Optional[asyncio.Task] = None
     try:
-        for event_type, data in qa_service.stream_answer_question(question, k, conversation_history or []):
-            if event_type == "sources":
-                # Convert SourceReference objects to dicts for JSON serialization
-                sources_data = [
-                    {
-                        "chunk_id": src.chunk_id,
-                        "quote_char_start": src.quote_char_start,
-                        "quote_char_end": src.quote_char_end
-                    }
-                    for src in data
-                ]
-                yield f"event: sources\ndata: {json.dumps(sources_data)}\n\n"
-            elif event_type == "token":
-                # Escape newlines in token data for SSE format
-                escaped_data = data.replace("\n", "\\n")
-                yield f"event: token\ndata: {escaped_data}\n\n"
-            elif event_type == "done":
-                yield f"event: done\ndata: {{}}\n\n"
-            elif event_type == "error":
-                yield f"event: error\ndata: {json.dumps({'error': data})}\n\n"
+        while True:
+            timeout = encoder.flush_timeout()
+            try:
+                if pending is None and timeout is None:
+                    event_type, data = await events.__anext__()
+                else:
+                    if pending is None:
+                        pending = asyncio.ensure_future(events.__anext__())
+                    done, _ = await asyncio.wait({pending}, timeout=timeout)
+                    if not done:
+                        for frame in encoder.flush():
+                            yield frame
+                        continue
+                    read, pending = pending, None
+                    event_type, data = read.result()
+            except StopAsyncIteration:
+                break
+            for frame in encoder.encode(event_type, data):
+                yield frame
+        for frame in encoder.flush():
+            yield frame
     except Exception as e:
-        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+        yield format_sse_event("error", json.dumps({"error": str(e)}))
+    finally:
+        with anyio.CancelScope(shield=True):
+            if pending is not None:
+                # The stream cannot be closed while a read is in progress
+                pending.cancel()
+                await asyncio.wait({pending})
+                if not pending.cancelled():
+                    pending.exception()
+            await events.aclose()
+
+
+async def _stop_on_disconnect(http_request: Request, frames: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Forward SSE frames until the client goes away, then close the source.
+
+    Starlette cancels the response itself when the server reports the
+    disconnect as a message; checking before each frame also catches
+    servers that only report it through failed sends. Either way the
+    source is closed at once, which cancels the LLM generation.
+
+    Args:
+        http_request: Incoming HTTP request
+        frames: SSE frames
+
+    Yields:
+        The same frames
+    """
+    try:
+        async for frame in frames:
+            if await http_request.is_disconnected():
+                return
+            yield frame
+    finally:
+        await _close(frames)
 
 
 @router.post("/stream")
 async def query_stream(
     request: QueryRequest,
-    qa_service: QAService = Depends(get_qa_service)
+    http_request: Request,
+    qa_service: QAService = Depends(get_qa_service),
+    client_id: Optional[str] = Depends(get_client_id)
 ):
     """
     Stream an answer to a question about Catan rules using Server-Sent Events.
     
+    The response starts once the answer holds an LLM slot (identical
+    concurrent questions share one answer and one slot); if the queue is
+    full or the wait for a slot times out, the answer is a 429 instead. If
+    the client disconnects, the LLM generation is cancelled (unless an
+    identical request is still reading the same answer).
+    
     Args:
         request: Query request with question
+        http_request: Incoming HTTP request, watched for disconnects
         qa_service: QA service instance
+        client_id: Client identifier for fair LLM admission
         
     Returns:
         StreamingResponse with SSE events
     """
-    # Convert conversation history to list of dicts
-    history = [{"role": msg.role, "content": msg.content} for msg in request.conversation_history]
-
+    try:
+        # Only a request that starts a new answer takes an LLM slot; one that
+        # joins an identical answer in flight is never queued or rejected
+        events = qa_service.astream_answer_question(
+            *_stream_arguments(request), client_id=client_id, threaded=not settings.stream_async
+        )
+        events = await _start_stream(events)
+    except AdmissionRejected as e:
+        raise _too_many_requests(e)
     return StreamingResponse(
-        generate_sse_events(qa_service, request.question, request.k, history),
+        _stop_on_disconnect(http_request, generate_sse_events(events, request)),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -114,4 +432,3 @@ async def query_stream(
             "X-Accel-Buffering": "no",
         }
     )
-
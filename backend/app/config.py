@@ -1,8 +1,9 @@
 """Configuration management for the application."""
+from functools import lru_cache
 from pathlib import Path
-from typing import Literal
+from typing import List, Literal
 
-from pydantic import field_validator, model_validator
+from pydantic import model_validator
 from pydantic_settings import (
     BaseSettings,
     PydanticBaseSettingsSource,
@@ -13,6 +14,10 @@ from pydantic_settings import (
 BACKEND_DIR = Path(__file__).parent.parent
 ENV_FILE = BACKEND_DIR / ".env"
 
+# anyio's default worker thread limit; answers on the blocking /api/query
+# path hold one of these threads while they wait for and use an LLM slot
+WORKER_THREADS = 40
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -39,6 +44,7 @@ class Settings(BaseSettings):
     
     # LLM Provider Configuration
     llm_provider: Literal["openai", "vertex"] = "openai"
+    llm_providers: str = ""  # Chat providers to fail over through, in order (e.g. "openai,vertex"; "" = llm_provider only)
     
     # OpenAI Configuration
     openai_api_key: str = ""
@@ -59,28 +65,113 @@ class Settings(BaseSettings):
     openai_model: str = "gpt-4"
     vertex_model: str = "gemini-1.5-pro"
     
-    @field_validator("chroma_persist_dir")
-    @classmethod
-    def ensure_chroma_dir_exists(cls, v: str) -> str:
-        """Ensure Chroma directory exists."""
-        Path(v).mkdir(parents=True, exist_ok=True)
-        return v
+    # Retrieval Configuration
+    retrieval_fetch_multiplier: int = 3  # Candidates fetched per requested chunk before MMR
+    mmr_lambda: float = 0.7  # 1.0 = pure relevance, 0.0 = pure diversity
+    duplicate_similarity_threshold: float = 0.97  # Cosine similarity above which chunks are duplicates
+    context_token_budget: int = 3000  # Maximum prompt tokens spent on retrieved chunks
+    
+    # Conversation History Configuration
+    # Older turns are summarized by an extra LLM call before the answer prompt is built
+    history_max_turns: int = 3  # Most recent user/assistant turns kept verbatim
+    history_token_cap: int = 1000  # Maximum prompt tokens spent on conversation history
+    history_summary_cache_size: int = 1024  # Conversations whose summaries are kept in memory
+    
+    # Batch Query Configuration
+    batch_max_concurrency: int = 8  # Concurrent LLM calls per batch request
+    batch_max_questions: int = 5000  # Largest accepted batch
+    
+    # Chunk Retrieval Configuration
+    chunk_batch_max_ids: int = 200  # Most chunks returned by one batch request
+    
+    # Streaming Configuration
+    sse_flush_bytes: int = 64  # Coalesce tokens until a frame holds this many bytes
+    sse_flush_ms: float = 20  # ...or until the oldest buffered token is this old
+    stream_async: bool = False  # Serve /api/query/stream from the async QA path instead of a thread
+    
+    # LLM Admission Configuration
+    # llm_max_concurrency + llm_queue_size must stay below WORKER_THREADS
+    llm_max_concurrency: int = 16  # LLM calls in flight per worker
+    llm_queue_size: int = 16  # Requests allowed to wait for an LLM slot; more get 429
+    llm_queue_timeout_s: float = 30  # Longest wait for an LLM slot before giving up with 429
+    
+    # LLM Failover Configuration (used when llm_providers lists several providers)
+    llm_hedge_after_ms: float = 2000  # Time to first token after which the next provider is also tried (0 = never hedge)
+    llm_breaker_failures: int = 3  # Consecutive failures that open a provider's circuit breaker
+    llm_breaker_reset_s: float = 30  # Time a breaker stays open before a trial request
+    
+    # Request Coalescing Configuration
+    coalesce_queries: bool = True  # Identical concurrent questions share one retrieval and LLM call
+    
+    # Startup Configuration
+    warmup_query: str = "How do I set up the game?"  # Embedded and searched at startup ("" = skip)
+    warmup_preload_chunks: int = 0  # Chunks loaded into the chunk cache at startup (-1 = all)
+    warmup_retry_max_s: float = 30  # Longest wait between warm-up retries after a failure
+    
+    # Deployment Configuration
+    # standalone: one process serves everything; writer: the single ingesting
+    # process, publishes versions; reader: query-only, follows published versions
+    worker_role: Literal["standalone", "writer", "reader"] = "standalone"
+    version_check_interval_s: float = 1.0  # How often CURRENT is checked for a newer version
+    chunk_cache_size: int = 2048  # Decoded chunks kept in memory per process (0 = unlimited)
+    
+    # Ingest Write Configuration
+    write_batch_size: int = 1000  # Chunks per chunk-store write and Chroma upsert (keep below Chroma's max batch size)
+    
+    @property
+    def llm_provider_order(self) -> List[str]:
+        """Chat providers in order of preference."""
+        providers = [name.strip() for name in self.llm_providers.split(",") if name.strip()]
+        return providers or [self.llm_provider]
     
     @model_validator(mode="after")
     def validate_provider_settings(self) -> "Settings":
         """Validate provider-specific settings."""
-        if self.llm_provider == "openai" and not self.openai_api_key:
+        providers = set(self.llm_provider_order) | {self.llm_provider}
+        unknown = providers - {"openai", "vertex"}
+        if unknown:
+            raise ValueError(f"Unsupported LLM provider(s) in LLM_PROVIDERS: {', '.join(sorted(unknown))}")
+        
+        if "openai" in providers and not self.openai_api_key:
             raise ValueError("OPENAI_API_KEY is required when using OpenAI provider")
         
-        if self.llm_provider == "vertex":
+        if "vertex" in providers:
             if not self.google_application_credentials:
                 raise ValueError("GOOGLE_APPLICATION_CREDENTIALS is required when using Vertex provider")
             if not self.vertex_project_id:
                 raise ValueError("VERTEX_PROJECT_ID is required when using Vertex provider")
         
+        if self.llm_max_concurrency + self.llm_queue_size >= WORKER_THREADS:
+            raise ValueError(
+                f"LLM_MAX_CONCURRENCY + LLM_QUEUE_SIZE must be below {WORKER_THREADS}, "
+                "the worker threads that serve blocking answers"
+            )
+        
         return self
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Load and validate the settings on first use."""
+    return Settings()
+
+
+class LazySettings:
+    """
+    Proxy to the settings that loads them on first attribute access.
+
+    Importing the app does not read .env or validate provider credentials;
+    directories under chroma_persist_dir are created by the services that
+    write there.
+    """
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(get_settings(), name, value)
+
+
 # Global settings instance
-settings = Settings()
+settings = LazySettings()
 
@@ -1,13 +1,32 @@
 """FastAPI application entry point."""
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.api.routes import ingest, query, chunks, pdf
+from app.api import dependencies
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up services in the background, retrying on failure; /ready reports when they are done."""
+    overrides = app.dependency_overrides
+    warmup = asyncio.create_task(dependencies.warm_up_until_ready(
+        overrides.get(dependencies.get_vector_store_service, dependencies.get_vector_store_service),
+        overrides.get(dependencies.get_qa_service, dependencies.get_qa_service)
+    ))
+    yield
+    # Stops the retries; a warm-up thread already running cannot be interrupted
+    warmup.cancel()
 
 
 app = FastAPI(
     title="Catan Rules Q&A API",
     description="API for querying Catan board game rules with verified citations",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -37,3 +56,19 @@ async def health():
     """Health check endpoint."""
     return {"status": "healthy"}
 
+
+@app.get("/ready")
+async def ready():
+    """Readiness endpoint: 200 once startup warm-up has finished, 503 before."""
+    is_ready, error = dependencies.readiness()
+    if is_ready:
+        return {"status": "ready"}
+    if error is not None:
+        return JSONResponse(status_code=503, content={"status": "failed", "detail": error})
+    return JSONResponse(status_code=503, content={"status": "warming_up"})
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
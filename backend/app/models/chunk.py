@@ -1,5 +1,5 @@
 """Data models for PDF chunks and atoms."""
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel, Field
 
 
@@ -28,6 +28,24 @@ class PDFMetadata(BaseModel):
     title: Optional[str] = Field(default=None, description="PDF title if available")
 
 
+class HighlightLine(BaseModel):
+    """Merged highlight rectangle for a run of atoms on one line."""
+    page_num: int = Field(description="Page number (0-indexed)")
+    bbox: BBox = Field(description="Union of the atoms' bounding boxes")
+    char_start: int = Field(description="Character start position in chunk text")
+    char_end: int = Field(description="Character end position in chunk text")
+    atom_start: int = Field(description="Index of the line's first atom in the chunk")
+    atom_end: int = Field(description="Index after the line's last atom in the chunk")
+
+
+class SearchIndex(BaseModel):
+    """Normalized form of a chunk's text used to locate quotes."""
+    normalized_text: str = Field(description="Case-folded text with typography and whitespace normalized")
+    offset_breaks: List[Tuple[int, int]] = Field(
+        description="(normalized index, original index) breakpoints mapping back to the chunk text"
+    )
+
+
 class Chunk(BaseModel):
     """Represents a chunk of text with associated atoms."""
     chunk_id: str = Field(description="Unique identifier for the chunk")
@@ -37,4 +55,19 @@ class Chunk(BaseModel):
     page_start: int = Field(description="Starting page number (0-indexed)")
     page_end: int = Field(description="Ending page number (0-indexed)")
     section_title: Optional[str] = Field(default=None, description="Section title if available")
+    search_index: Optional[SearchIndex] = Field(default=None, description="Precomputed quote-matching index")
+    highlight_lines: Optional[List[HighlightLine]] = Field(
+        default=None, description="Per-line highlight rectangles ordered by character position"
+    )
+
+
+class RetrievalFilter(BaseModel):
+    """Metadata constraints applied to vector store searches."""
+    pdf_ids: Optional[List[str]] = Field(default=None, description="Only search chunks from these PDFs")
+    page_min: Optional[int] = Field(default=None, description="Lowest page (0-indexed) a chunk may overlap")
+    page_max: Optional[int] = Field(default=None, description="Highest page (0-indexed) a chunk may overlap")
+    section_prefix: Optional[str] = Field(default=None, description="Case-insensitive section title prefix")
 
+    def is_empty(self) -> bool:
+        """Return True if the filter places no constraints on the search."""
+        return not self.pdf_ids and self.page_min is None and self.page_max is None and not self.section_prefix
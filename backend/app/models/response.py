@@ -1,5 +1,5 @@
 """Response models for API endpoints."""
-from typing import List
+from typing import List, Optional, Union
 from pydantic import BaseModel, Field
 
 
@@ -10,10 +10,35 @@ class SourceReference(BaseModel):
     quote_char_end: int = Field(description="Character end position of the quote")
 
 
+class RetrievedChunk(BaseModel):
+    """Location of a retrieved chunk, sent before the answer streams."""
+    chunk_id: str = Field(description="Chunk ID")
+    pdf_id: str = Field(description="PDF ID")
+    page_start: int = Field(description="Starting page number")
+    page_end: int = Field(description="Ending page number")
+    section_title: Optional[str] = Field(default=None, description="Section title")
+    atoms: Optional[List[List[Union[int, float]]]] = Field(
+        default=None,
+        description="Compact atom geometry: [page_num, x0, y0, x1, y1, char_start, char_end] per atom"
+    )
+
+
+class ContextUsage(BaseModel):
+    """Token usage of the retrieved context placed in the prompt."""
+    context_tokens: int = Field(description="Tokens used by the context")
+    token_budget: int = Field(description="Configured context token budget")
+    chunks_retrieved: int = Field(description="Number of chunks retrieved")
+    chunks_included: int = Field(description="Number of chunks placed in the context")
+    chunks_truncated: int = Field(default=0, description="Number of included chunks cut at a sentence boundary")
+    prompt_tokens: Optional[int] = Field(default=None, description="Prompt tokens reported by the LLM provider, when known")
+    cached_prompt_tokens: Optional[int] = Field(default=None, description="Prompt tokens the provider served from its prompt cache, when known")
+
+
 class QueryResponse(BaseModel):
     """Response model for query endpoint."""
     answer: str = Field(description="Generated answer from LLM")
     sources: List[SourceReference] = Field(description="List of source references")
+    usage: Optional[ContextUsage] = Field(default=None, description="Context token usage for this request")
 
 
 class IngestionResponse(BaseModel):
@@ -34,3 +59,21 @@ class ChunkResponse(BaseModel):
     section_title: str | None = Field(default=None, description="Section title")
     atoms: List[dict] = Field(description="List of atoms with coordinates")
 
+
+class ChunkBatchResponse(BaseModel):
+    """Response model for batch chunk retrieval endpoint."""
+    chunks: List[dict] = Field(description="Found chunks with the selected fields, in request order")
+    missing: List[str] = Field(description="Requested chunk IDs that were not found")
+
+
+class PageHighlight(BaseModel):
+    """Highlight rectangles on one PDF page."""
+    page_num: int = Field(description="Page number (0-indexed)")
+    bboxes: List[List[float]] = Field(description="Rectangles as [x0, y0, x1, y1]")
+
+
+class HighlightResponse(BaseModel):
+    """Response model for quote highlight endpoint."""
+    chunk_id: str = Field(description="Chunk ID")
+    pdf_id: str = Field(description="PDF ID")
+    highlights: List[PageHighlight] = Field(description="Rectangles grouped by page, in reading order")
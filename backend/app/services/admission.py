@@ -0,0 +1,283 @@
+"""Admission control for LLM calls: a concurrency limit with a bounded, fair wait queue."""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Deque, Iterator, Optional
+from app.utils.metrics import (
+    LLM_ACTIVE_CALLS,
+    LLM_ADMISSION_REJECTED,
+    LLM_QUEUE_DEPTH,
+    LLM_QUEUE_WAIT_SECONDS,
+)
+
+
+# Clients without an identifier share one queue
+ANONYMOUS_CLIENT = "anonymous"
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM call cannot be admitted: the queue is full or the wait timed out."""
+
+    def __init__(self, message: str, retry_after: int):
+        """
+        Initialize the rejection.
+
+        Args:
+            message: Reason for the rejection
+            retry_after: Suggested seconds before retrying
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    """A waiting request; granted when a slot is handed to it."""
+
+    def __init__(self, client_id: str, wake: Callable[[], None]):
+        self.client_id = client_id
+        self.wake = wake
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Limits concurrent LLM calls and queues the excess fairly per client.
+
+    At most max_concurrent calls hold a slot. Further requests wait in a
+    queue of at most max_queue entries; when it is full they are rejected
+    at once. Each client has its own FIFO and freed slots go to clients in
+    round-robin order, so one client with many requests cannot starve the
+    others. Works from worker threads and from the event loop.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout_s: float):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrent: LLM calls allowed in flight
+            max_queue: Requests allowed to wait for a slot
+            queue_timeout_s: Longest wait for a slot before rejecting
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout_s = queue_timeout_s
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queued = 0
+        # Client ID -> waiting tickets; clients are served in insertion order
+        self._queues: "OrderedDict[str, Deque[_Ticket]]" = OrderedDict()
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_hold_s = 5.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests currently waiting for a slot."""
+        return self._queued
+
+    def _retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new request (call with the lock held)."""
+        rounds = (self._queued + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._avg_hold_s))
+
+    def check(self):
+        """
+        Fail fast when the queue is full, without taking a slot.
+
+        Raises:
+            AdmissionRejected: If a new request could not even be queued
+        """
+        with self._lock:
+            if self._active >= self.max_concurrent and self._queued >= self.max_queue:
+                LLM_ADMISSION_REJECTED.labels("queue_full").inc()
+                raise AdmissionRejected("Too many questions in progress; please retry shortly", self._retry_after())
+
+    def _enter(self, client_id: str, wake: Callable[[], None]) -> Optional[_Ticket]:
+        """
+        Take a free slot, or queue a ticket for one.
+
+        Returns:
+            None if a slot was taken, otherwise the queued ticket
+
+        Raises:
+            AdmissionRejected: If the queue is full
+        """
+        with self._lock:
+            if self._active < self.max_concurrent and self._queued == 0:
+                self._active += 1
+                LLM_ACTIVE_CALLS.set(self._active)
+                return None
+            if self._queued >= self.max_queue:
+                LLM_ADMISSION_REJECTED.labels("queue_full").inc()
+                raise AdmissionRejected("Too many questions in progress; please retry shortly", self._retry_after())
+            ticket = _Ticket(client_id, wake)
+            self._queues.setdefault(client_id, deque()).append(ticket)
+            self._queued += 1
+            LLM_QUEUE_DEPTH.set(self._queued)
+            return ticket
+
+    def _abandon(self, ticket: _Ticket) -> bool:
+        """
+        Take a ticket out of the queue after a timeout or cancellation.
+
+        Returns:
+            True if the ticket had already been granted a slot, which the caller now owns
+        """
+        with self._lock:
+            if ticket.granted:
+                return True
+            queue = self._queues.get(ticket.client_id)
+            if queue is not None:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.client_id]
+            self._queued -= 1
+            LLM_QUEUE_DEPTH.set(self._queued)
+            return False
+
+    def _timed_out(self) -> AdmissionRejected:
+        """Rejection for a request that waited too long."""
+        LLM_ADMISSION_REJECTED.labels("timeout").inc()
+        with self._lock:
+            retry_after = self._retry_after()
+        return AdmissionRejected("Timed out waiting for LLM capacity; please retry shortly", retry_after)
+
+    def _release(self, held_s: Optional[float]):
+        """Hand the slot to the next client in round-robin order, or free it."""
+        with self._lock:
+            if held_s is not None:
+                self._avg_hold_s = 0.9 * self._avg_hold_s + 0.1 * held_s
+            if not self._queues:
+                self._active -= 1
+                LLM_ACTIVE_CALLS.set(self._active)
+                return
+            client_id, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            # The client goes to the back of the rotation
+            del self._queues[client_id]
+            if queue:
+                self._queues[client_id] = queue
+            self._queued -= 1
+            LLM_QUEUE_DEPTH.set(self._queued)
+            ticket.granted = True
+        ticket.wake()
+
+    def _granted(self, enqueued: float) -> "Slot":
+        """Record the wait for a slot that has just been obtained."""
+        slot = Slot(self)
+        LLM_QUEUE_WAIT_SECONDS.observe(slot.acquired - enqueued)
+        return slot
+
+    def acquire(self, client_id: Optional[str] = None) -> "Slot":
+        """
+        Take an LLM slot, blocking the calling thread while queued.
+
+        Args:
+            client_id: Client the call is made for
+
+        Returns:
+            The held slot; the caller must release it
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        granted = threading.Event()
+        enqueued = time.perf_counter()
+        ticket = self._enter(client_id or ANONYMOUS_CLIENT, granted.set)
+        if ticket is not None:
+            if not granted.wait(self.queue_timeout_s) and not self._abandon(ticket):
+                LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued)
+                raise self._timed_out()
+        return self._granted(enqueued)
+
+    async def aacquire(self, client_id: Optional[str] = None) -> "Slot":
+        """
+        Async version of acquire(); waits without blocking the event loop or a worker thread.
+
+        Args:
+            client_id: Client the call is made for
+
+        Returns:
+            The held slot; the caller must release it
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        loop = asyncio.get_running_loop()
+        granted = asyncio.Event()
+        enqueued = time.perf_counter()
+        ticket = self._enter(client_id or ANONYMOUS_CLIENT, lambda: loop.call_soon_threadsafe(granted.set))
+        if ticket is not None:
+            try:
+                await asyncio.wait_for(granted.wait(), self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                if not self._abandon(ticket):
+                    LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - enqueued)
+                    raise self._timed_out()
+            except asyncio.CancelledError:
+                if self._abandon(ticket):
+                    # Granted just as the wait was cancelled: pass the slot on
+                    self._release(None)
+                raise
+        return self._granted(enqueued)
+
+    @contextmanager
+    def slot(self, client_id: Optional[str] = None) -> Iterator["Slot"]:
+        """
+        Hold an LLM slot for the duration of the block, waiting in the queue if needed.
+
+        Args:
+            client_id: Client the call is made for
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        with self.acquire(client_id) as slot:
+            yield slot
+
+    @asynccontextmanager
+    async def aslot(self, client_id: Optional[str] = None) -> AsyncIterator["Slot"]:
+        """
+        Async version of slot(); waits without blocking the event loop.
+
+        Args:
+            client_id: Client the call is made for
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        with await self.aacquire(client_id) as slot:
+            yield slot
+
+
+class Slot:
+    """
+    An LLM slot held by one request.
+
+    Released once, by whichever of its holders finishes first; it can be
+    taken on the event loop and handed to code running in a worker thread.
+    Usable as a context manager that releases it on exit.
+    """
+
+    def __init__(self, controller: AdmissionController):
+        self._controller = controller
+        self._lock = threading.Lock()
+        self._released = False
+        self.acquired = time.perf_counter()
+
+    def release(self):
+        """Give the slot back; later calls do nothing."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release(time.perf_counter() - self.acquired)
+
+    def __enter__(self) -> "Slot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,272 @@
+"""Versioned, memory-mapped chunk packs shared by worker processes.
+
+A pack is one immutable file holding every stored chunk as compact JSON,
+followed by an index of chunk offsets and a fixed-size footer:
+
+    [record bytes ...][index JSON][index offset: 8 bytes][MAGIC]
+
+The writer publishes a new pack per corpus version and then atomically
+replaces the CURRENT pointer file. Readers mmap the pack named by CURRENT,
+so the page cache holding the chunk data is shared by every worker on the
+host, and switch to a newer pack when CURRENT changes.
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from app.utils.serialization import dumps, loads
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not locked against each other
+    fcntl = None
+
+
+MAGIC = b"CPK1"
+FOOTER = struct.Struct("<Q4s")
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = ".publish.lock"
+
+# (chunk_id, pdf_id, chunk JSON bytes)
+PackRecord = Tuple[str, str, bytes]
+
+
+def _pack_name(version: int) -> str:
+    """File name of the pack for a version."""
+    return f"chunks-{version:08d}.pack"
+
+
+def write_pack(path: Path, records: Iterable[PackRecord], version: int):
+    """
+    Write a pack file.
+
+    Args:
+        path: Output path
+        records: Chunk records, written in order
+        version: Corpus version stored in the index
+    """
+    index = []
+    offset = 0
+    with open(path, "wb") as f:
+        for chunk_id, pdf_id, data in records:
+            f.write(data)
+            index.append([chunk_id, pdf_id, offset, len(data)])
+            offset += len(data)
+        f.write(dumps({"version": version, "chunks": index}))
+        f.write(FOOTER.pack(offset, MAGIC))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ChunkPack:
+    """Read-only view of one published pack."""
+
+    def __init__(self, path: Path):
+        """
+        Map a pack file into memory.
+
+        Args:
+            path: Pack file path
+
+        Raises:
+            ValueError: If the file is not a chunk pack
+        """
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._data) < FOOTER.size:
+            raise ValueError(f"Truncated chunk pack: {self.path}")
+        index_offset, magic = FOOTER.unpack(self._data[-FOOTER.size:])
+        if magic != MAGIC:
+            raise ValueError(f"Not a chunk pack: {self.path}")
+        index = loads(self._data[index_offset:-FOOTER.size])
+
+        self.version: int = index["version"]
+        # Offsets only; chunk data stays in the shared mapping until decoded
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._by_pdf: Dict[str, List[str]] = {}
+        self._pdf_ids: Dict[str, str] = {}
+        for chunk_id, pdf_id, offset, length in index["chunks"]:
+            self._offsets[chunk_id] = (offset, length)
+            self._pdf_ids[chunk_id] = pdf_id
+            self._by_pdf.setdefault(pdf_id, []).append(chunk_id)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._offsets
+
+    def get_bytes(self, chunk_id: str) -> Optional[bytes]:
+        """
+        Get the stored JSON of a chunk.
+
+        Args:
+            chunk_id: Chunk ID
+
+        Returns:
+            Chunk JSON bytes, or None if the chunk is not in the pack
+        """
+        location = self._offsets.get(chunk_id)
+        if location is None:
+            return None
+        offset, length = location
+        return self._data[offset:offset + length]
+
+    def get_many_bytes(self, chunk_ids: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Get the stored JSON of several chunks, read in file order.
+
+        Args:
+            chunk_ids: Chunk IDs
+
+        Returns:
+            Dict of chunk ID to JSON bytes for the chunks in the pack
+        """
+        located = sorted(
+            (self._offsets[chunk_id], chunk_id) for chunk_id in chunk_ids if chunk_id in self._offsets
+        )
+        return {chunk_id: self._data[offset:offset + length] for (offset, length), chunk_id in located}
+
+    def chunk_ids(self, pdf_id: Optional[str] = None) -> List[str]:
+        """
+        List chunk IDs in write order.
+
+        Args:
+            pdf_id: Only list chunks of this PDF
+
+        Returns:
+            Chunk IDs
+        """
+        if pdf_id is not None:
+            return list(self._by_pdf.get(pdf_id, []))
+        return list(self._offsets)
+
+    def records(self) -> Iterator[PackRecord]:
+        """Iterate over every record, for building the next version."""
+        for chunk_id in self._offsets:
+            yield chunk_id, self._pdf_ids[chunk_id], self.get_bytes(chunk_id)
+
+
+class ChunkPackStore:
+    """Directory of published packs plus the CURRENT pointer."""
+
+    def __init__(self, directory: Path, keep: int = 3):
+        """
+        Initialize the pack store.
+
+        Args:
+            directory: Directory holding packs and CURRENT
+            keep: Published packs kept on disk; older ones are deleted
+        """
+        self.directory = Path(directory)
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def current_version(self) -> int:
+        """
+        Read the version named by CURRENT.
+
+        Returns:
+            Published version, or 0 if nothing has been published
+        """
+        try:
+            return int(loads((self.directory / CURRENT_FILE).read_bytes())["version"])
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0
+
+    def open(self, version: int) -> Optional[ChunkPack]:
+        """
+        Open a published pack.
+
+        Args:
+            version: Version to open
+
+        Returns:
+            The pack, or None for version 0 or a pack that has been removed
+        """
+        if version <= 0:
+            return None
+        try:
+            return ChunkPack(self.directory / _pack_name(version))
+        except FileNotFoundError:
+            return None
+
+    @contextmanager
+    def _publish_lock(self):
+        """Serialize publishers in this process and, where supported, across processes."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.directory / LOCK_FILE, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(
+        self,
+        updates: Dict[str, Tuple[str, bytes]],
+        seed: Callable[[], Iterable[PackRecord]]
+    ) -> ChunkPack:
+        """
+        Publish a new version: the current pack with updates applied.
+
+        Args:
+            updates: Chunk ID to (pdf_id, chunk JSON bytes) added or replaced
+            seed: Records to start from when nothing has been published yet
+
+        Returns:
+            The newly published pack
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._publish_lock():
+            # Re-read under the lock: another process may have published
+            version = self.current_version()
+            base = self.open(version)
+            base_records = base.records() if base is not None else seed()
+
+            def merged() -> Iterator[PackRecord]:
+                for chunk_id, pdf_id, data in base_records:
+                    if chunk_id not in updates:
+                        yield chunk_id, pdf_id, data
+                for chunk_id, (pdf_id, data) in updates.items():
+                    yield chunk_id, pdf_id, data
+
+            new_version = version + 1
+            pack_path = self.directory / _pack_name(new_version)
+            tmp_path = pack_path.with_suffix(".tmp")
+            write_pack(tmp_path, merged(), new_version)
+            os.replace(tmp_path, pack_path)
+
+            current_tmp = self.directory / f"{CURRENT_FILE}.tmp"
+            with open(current_tmp, "wb") as f:
+                f.write(dumps({
+                    "version": new_version,
+                    "pack": pack_path.name,
+                    "published_at": time.time()
+                }))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(current_tmp, self.directory / CURRENT_FILE)
+
+            self._remove_old_packs(new_version)
+            return ChunkPack(pack_path)
+
+    def _remove_old_packs(self, newest: int):
+        """Delete packs older than the last `keep` versions (open mappings stay valid)."""
+        for version in range(newest - self.keep, 0, -1):
+            path = self.directory / _pack_name(version)
+            if not path.exists():
+                break
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped on a platform that forbids deleting it
+                break
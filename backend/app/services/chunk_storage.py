@@ -1,29 +1,116 @@
 """Service for storing and retrieving full chunks with atoms."""
-import json
 import os
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict
-from app.models.chunk import Chunk
+from typing import Iterator, Optional, Dict, Tuple
+from app.models.chunk import Chunk, SearchIndex
 from app.config import settings
+from app.services.chunk_pack import ChunkPack, ChunkPackStore, PackRecord
+from app.services.quote_locator import build_search_index
+from app.utils.metrics import CORPUS_VERSION, record_cache_lookup
+from app.utils.serialization import dumps, loads
+
+
+class ReadOnlyStorageError(RuntimeError):
+    """Raised when a read-only worker is asked to write."""
 
 
 class ChunkStorageService:
-    """Service for storing full chunks with atoms (separate from vector store)."""
+    """
+    Service for storing full chunks with atoms (separate from vector store).
+    
+    The writer keeps one JSON file per chunk and publishes every saved batch
+    as a new version of a memory-mapped chunk pack. Read-only workers serve
+    chunks from the published pack (falling back to the chunk files until
+    a first version exists) and switch to newer versions as they appear.
+    """
 
-    def __init__(self, storage_dir: str = None):
+    def __init__(self, storage_dir: str = None, read_only: Optional[bool] = None):
         """
         Initialize chunk storage service.
         
         Args:
             storage_dir: Directory to store chunks (defaults to chroma_persist_dir/chunks)
+            read_only: Serve published versions only and reject writes
+                (defaults to worker_role == "reader")
         """
         if storage_dir is None:
             storage_dir = os.path.join(settings.chroma_persist_dir, "chunks")
+        if read_only is None:
+            read_only = settings.worker_role == "reader"
         self.storage_dir = Path(storage_dir)
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
+        self.read_only = read_only
+        if not read_only:
+            self.storage_dir.mkdir(parents=True, exist_ok=True)
+        
+        # In-memory cache for quick access, bounded by chunk_cache_size
+        self._cache: "OrderedDict[str, Chunk]" = OrderedDict()
+        # Quote-matching indexes kept apart from the chunks, so citations
+        # don't need the chunk (atoms and all) once its index is known
+        self._search_indexes: "OrderedDict[str, SearchIndex]" = OrderedDict()
+        self._lock = threading.Lock()
         
-        # In-memory cache for quick access
-        self._cache: Dict[str, Chunk] = {}
+        self.packs = ChunkPackStore(self.storage_dir / "packs")
+        self._pack: Optional[ChunkPack] = None
+        self._checked_at = float("-inf")
+        # Chunks saved since the last publish: chunk ID -> (pdf_id, JSON bytes)
+        self._unpublished: Dict[str, Tuple[str, bytes]] = {}
+        self.refresh(force=True)
+
+    @property
+    def version(self) -> int:
+        """Published version this service is serving (0 before the first publish)."""
+        pack = self._pack
+        return pack.version if pack is not None else 0
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Switch to the newest published version if it changed.
+        
+        CURRENT is read at most once per version_check_interval_s unless forced.
+        
+        Args:
+            force: Check now regardless of the interval
+            
+        Returns:
+            True if a different version is now being served
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < settings.version_check_interval_s:
+            return False
+        self._checked_at = now
+        
+        version = self.packs.current_version()
+        if version == self.version:
+            return False
+        pack = self.packs.open(version)
+        with self._lock:
+            if pack is not None and pack.version == self.version:
+                return False
+            # In-flight readers keep their reference to the old mapping
+            self._pack = pack
+            self._cache.clear()
+            self._search_indexes.clear()
+        CORPUS_VERSION.set(self.version)
+        return True
+
+    def _serves_pack(self) -> Optional[ChunkPack]:
+        """The pack to read from, or None when reads go to the chunk files."""
+        pack = self._pack
+        return pack if self.read_only else None
+
+    def _remember(self, *chunks: Chunk):
+        """Put chunks in the cache, evicting the least recently used."""
+        with self._lock:
+            for chunk in chunks:
+                self._search_indexes.pop(chunk.chunk_id, None)
+                self._cache[chunk.chunk_id] = chunk
+                self._cache.move_to_end(chunk.chunk_id)
+            if settings.chunk_cache_size > 0:
+                while len(self._cache) > settings.chunk_cache_size:
+                    self._cache.popitem(last=False)
 
     def _get_chunk_path(self, chunk_id: str) -> Path:
         """Get file path for a chunk."""
@@ -35,17 +122,22 @@ class ChunkStorageService:
         
         Args:
             chunk: Chunk to save
+            
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
         """
+        if self.read_only:
+            raise ReadOnlyStorageError("Chunk storage is read-only on this worker")
         chunk_path = self._get_chunk_path(chunk.chunk_id)
         
-        # Convert to dict for JSON serialization
-        chunk_dict = chunk.model_dump()
-        
-        with open(chunk_path, 'w', encoding='utf-8') as f:
-            json.dump(chunk_dict, f, indent=2, ensure_ascii=False)
+        # Compact JSON; files written with indentation still load
+        data = dumps(chunk.model_dump())
+        with open(chunk_path, 'wb') as f:
+            f.write(data)
+        self._unpublished[chunk.chunk_id] = (chunk.pdf_id, data)
         
         # Update cache
-        self._cache[chunk.chunk_id] = chunk
+        self._remember(chunk)
 
     def save_chunks(self, chunks: list[Chunk]):
         """
@@ -57,6 +149,75 @@ class ChunkStorageService:
         for chunk in chunks:
             self.save_chunk(chunk)
 
+    def snapshot(self, chunk_ids: list[str]) -> Dict[str, Optional[str]]:
+        """
+        Read the stored JSON of chunks, so they can be restored later.
+        
+        Args:
+            chunk_ids: Chunk IDs to read
+            
+        Returns:
+            Dict of chunk ID to stored JSON, or None for chunks not stored
+        """
+        contents: Dict[str, Optional[str]] = {}
+        for chunk_id in chunk_ids:
+            chunk_path = self._get_chunk_path(chunk_id)
+            contents[chunk_id] = chunk_path.read_text(encoding="utf-8") if chunk_path.exists() else None
+        return contents
+
+    def restore(self, contents: Dict[str, Optional[str]]):
+        """
+        Put chunk files back to a snapshot, deleting chunks that were not stored.
+        
+        Args:
+            contents: Snapshot from snapshot()
+            
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
+        """
+        if self.read_only:
+            raise ReadOnlyStorageError("Chunk storage is read-only on this worker")
+        for chunk_id, content in contents.items():
+            chunk_path = self._get_chunk_path(chunk_id)
+            if content is None:
+                chunk_path.unlink(missing_ok=True)
+            else:
+                chunk_path.write_text(content, encoding="utf-8")
+            self._unpublished.pop(chunk_id, None)
+            with self._lock:
+                self._cache.pop(chunk_id, None)
+                self._search_indexes.pop(chunk_id, None)
+
+    def publish(self) -> int:
+        """
+        Publish the chunks saved since the last publish as a new version.
+        
+        Returns:
+            The published version
+            
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
+        """
+        if self.read_only:
+            raise ReadOnlyStorageError("Chunk storage is read-only on this worker")
+        pack = self.packs.publish(self._unpublished, self._file_records)
+        self._unpublished = {}
+        with self._lock:
+            self._pack = pack
+        self._checked_at = time.monotonic()
+        CORPUS_VERSION.set(pack.version)
+        return pack.version
+
+    def _file_records(self) -> Iterator[PackRecord]:
+        """Records for every chunk file, used to seed the first pack."""
+        for chunk_file in self.storage_dir.glob("*.json"):
+            try:
+                chunk_dict = loads(chunk_file.read_bytes())
+            except Exception:
+                continue
+            # Re-encode so files written with indentation are packed compactly
+            yield chunk_file.stem, chunk_dict.get("pdf_id", ""), dumps(chunk_dict)
+
     def get_chunk(self, chunk_id: str) -> Optional[Chunk]:
         """
         Retrieve a chunk by ID.
@@ -68,24 +229,141 @@ class ChunkStorageService:
             Chunk if found, None otherwise
         """
         # Check cache first
-        if chunk_id in self._cache:
-            return self._cache[chunk_id]
+        cached = self._cache.get(chunk_id)
+        record_cache_lookup("chunk_storage", cached is not None)
+        if cached is not None:
+            with self._lock:
+                if chunk_id in self._cache:
+                    self._cache.move_to_end(chunk_id)
+            return cached
         
-        # Load from disk
-        chunk_path = self._get_chunk_path(chunk_id)
-        if not chunk_path.exists():
+        pack = self._serves_pack()
+        if pack is not None:
+            data = pack.get_bytes(chunk_id)
+        else:
+            # Load from disk
+            chunk_path = self._get_chunk_path(chunk_id)
+            if not chunk_path.exists():
+                return None
+            with open(chunk_path, 'rb') as f:
+                data = f.read()
+        if data is None:
             return None
         
         try:
-            with open(chunk_path, 'r', encoding='utf-8') as f:
-                chunk_dict = json.load(f)
-            
-            chunk = Chunk(**chunk_dict)
-            self._cache[chunk_id] = chunk
+            chunk = Chunk(**loads(data))
+            self._remember(chunk)
             return chunk
         except Exception:
             return None
 
+    def get_search_index(self, chunk_id: str) -> Optional[SearchIndex]:
+        """
+        Retrieve the quote-matching index of a chunk.
+        
+        Chunks stored before indexes existed are indexed from their text.
+        
+        Args:
+            chunk_id: Chunk ID
+            
+        Returns:
+            SearchIndex if the chunk was found, None otherwise
+        """
+        index = self._search_indexes.get(chunk_id)
+        if index is not None:
+            return index
+        
+        chunk = self.get_chunk(chunk_id)
+        if chunk is None:
+            return None
+        index = chunk.search_index or build_search_index(chunk.text)
+        with self._lock:
+            self._search_indexes[chunk_id] = index
+            if settings.chunk_cache_size > 0:
+                while len(self._search_indexes) > settings.chunk_cache_size:
+                    self._search_indexes.popitem(last=False)
+        return index
+
+    def get_chunks(self, chunk_ids: list[str]) -> Dict[str, Chunk]:
+        """
+        Retrieve several chunks by ID in one pass.
+        
+        Cache hits are collected under one lock acquisition, misses are read
+        from the pack in file order (or from their files), and the loaded
+        chunks are cached together.
+        
+        Args:
+            chunk_ids: Chunk IDs to retrieve
+            
+        Returns:
+            Dict of chunk ID to Chunk for the IDs that were found
+        """
+        found: Dict[str, Chunk] = {}
+        missing = []
+        with self._lock:
+            for chunk_id in dict.fromkeys(chunk_ids):
+                cached = self._cache.get(chunk_id)
+                if cached is None:
+                    missing.append(chunk_id)
+                else:
+                    self._cache.move_to_end(chunk_id)
+                    found[chunk_id] = cached
+        record_cache_lookup("chunk_storage", True, len(found))
+        record_cache_lookup("chunk_storage", False, len(missing))
+        if not missing:
+            return found
+        
+        pack = self._serves_pack()
+        if pack is not None:
+            stored = pack.get_many_bytes(missing)
+        else:
+            stored = {}
+            for chunk_id in missing:
+                chunk_path = self._get_chunk_path(chunk_id)
+                if chunk_path.exists():
+                    stored[chunk_id] = chunk_path.read_bytes()
+        
+        loaded: Dict[str, Chunk] = {}
+        for chunk_id, data in stored.items():
+            try:
+                loaded[chunk_id] = Chunk(**loads(data))
+            except Exception:
+                continue
+        self._remember(*loaded.values())
+        found.update(loaded)
+        # Keep the requested order
+        return {chunk_id: found[chunk_id] for chunk_id in dict.fromkeys(chunk_ids) if chunk_id in found}
+
+    def preload(self, limit: int = -1) -> int:
+        """
+        Load stored chunks into the in-memory cache, most recently written first.
+        
+        Args:
+            limit: Maximum number of chunks to load (-1 for all)
+            
+        Returns:
+            Number of chunks loaded
+        """
+        pack = self._serves_pack()
+        if pack is not None:
+            # Packs hold chunks in write order
+            chunk_ids = list(reversed(pack.chunk_ids()))
+        else:
+            chunk_files = sorted(
+                self.storage_dir.glob("*.json"),
+                key=lambda path: path.stat().st_mtime,
+                reverse=True
+            )
+            chunk_ids = [chunk_file.stem for chunk_file in chunk_files]
+        if limit >= 0:
+            chunk_ids = chunk_ids[:limit]
+        
+        loaded = 0
+        for chunk_id in chunk_ids:
+            if self.get_chunk(chunk_id) is not None:
+                loaded += 1
+        return loaded
+
     def get_chunks_by_pdf(self, pdf_id: str) -> list[Chunk]:
         """
         Get all chunks for a specific PDF.
@@ -96,15 +374,20 @@ class ChunkStorageService:
         Returns:
             List of chunks
         """
+        pack = self._serves_pack()
+        if pack is not None:
+            found = self.get_chunks(pack.chunk_ids(pdf_id))
+            return list(found.values())
+        
         chunks = []
         for chunk_file in self.storage_dir.glob("*.json"):
             try:
-                with open(chunk_file, 'r', encoding='utf-8') as f:
-                    chunk_dict = json.load(f)
+                with open(chunk_file, 'rb') as f:
+                    chunk_dict = loads(f.read())
                     if chunk_dict.get("pdf_id") == pdf_id:
                         chunk = Chunk(**chunk_dict)
                         chunks.append(chunk)
-                        self._cache[chunk.chunk_id] = chunk
+                        self._remember(chunk)
             except Exception:
                 continue
         
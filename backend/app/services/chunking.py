@@ -3,6 +3,8 @@ import uuid
 from typing import List, Optional
 from app.models.chunk import Atom, Chunk
 from app.utils.text_utils import normalize_whitespace
+from app.services.quote_locator import build_search_index
+from app.services.highlights import compute_highlight_lines
 
 
 class ChunkingService:
@@ -204,6 +206,10 @@ class ChunkingService:
         if not atoms:
             return None
         
+        # Overlapping chunks share atoms; copy them so positions set for this
+        # chunk don't overwrite those of the previous one
+        atoms = [atom.model_copy(deep=True) for atom in atoms]
+        
         # Recalculate character positions relative to chunk start
         chunk_text_parts = []
         current_pos = 0
@@ -249,6 +255,8 @@ class ChunkingService:
             pdf_id=pdf_id,
             page_start=page_start,
             page_end=page_end,
-            section_title=section_title
+            section_title=section_title,
+            search_index=build_search_index(chunk_text),
+            highlight_lines=compute_highlight_lines(atoms)
         )
 
@@ -0,0 +1,138 @@
+"""Incremental parsing of citation markers in streamed LLM output."""
+from typing import Any, List, Tuple
+
+
+CITE_OPEN = "[[CITE:"
+CITE_ID_END = "]]"
+CITE_CLOSE = "[[/CITE]]"
+
+# A chunk ID longer than this means the marker was malformed
+MAX_CHUNK_ID_LENGTH = 128
+
+
+class CitationStreamParser:
+    """
+    State machine that strips [[CITE:chunk_id]]quote[[/CITE]] markers from a token stream.
+
+    Tokens are fed as they arrive. Text is released as soon as it cannot be
+    part of a marker; only a possible partial marker is held back. Quoted text
+    is released as normal text, and a citation is reported when its closing
+    marker arrives.
+    """
+
+    TEXT = "text"
+    CHUNK_ID = "chunk_id"
+    QUOTE = "quote"
+
+    def __init__(self):
+        """Initialize the parser in the text state."""
+        self.state = self.TEXT
+        self._buffer = ""
+        self._chunk_id = ""
+        self._quote = ""
+
+    def feed(self, token: str) -> List[Tuple[str, Any]]:
+        """
+        Consume a token and return the events it completes.
+
+        Args:
+            token: Next piece of LLM output
+
+        Returns:
+            List of ("token", text) and ("citation", (chunk_id, quote)) events
+        """
+        self._buffer += token
+        events: List[Tuple[str, Any]] = []
+
+        while self._buffer:
+            if self.state == self.TEXT:
+                start = self._buffer.find(CITE_OPEN)
+                stray = self._buffer.find(CITE_CLOSE)
+                if stray >= 0 and (start < 0 or stray < start):
+                    # Closing marker without an opening one; drop it
+                    self._emit_text(events, self._buffer[:stray])
+                    self._buffer = self._buffer[stray + len(CITE_CLOSE):]
+                    continue
+                if start >= 0:
+                    self._emit_text(events, self._buffer[:start])
+                    self._buffer = self._buffer[start + len(CITE_OPEN):]
+                    self.state = self.CHUNK_ID
+                    continue
+                held = max(
+                    self._partial_marker_length(self._buffer, CITE_OPEN),
+                    self._partial_marker_length(self._buffer, CITE_CLOSE)
+                )
+                self._emit_text(events, self._buffer[:len(self._buffer) - held])
+                self._buffer = self._buffer[len(self._buffer) - held:]
+                break
+
+            if self.state == self.CHUNK_ID:
+                end = self._buffer.find(CITE_ID_END)
+                if end >= 0:
+                    self._chunk_id = self._buffer[:end].strip()
+                    self._quote = ""
+                    self._buffer = self._buffer[end + len(CITE_ID_END):]
+                    self.state = self.QUOTE
+                    continue
+                if len(self._buffer) > MAX_CHUNK_ID_LENGTH:
+                    # Not a real marker; pass it through as text
+                    self._emit_text(events, CITE_OPEN)
+                    self.state = self.TEXT
+                    continue
+                break
+
+            # QUOTE state
+            end = self._buffer.find(CITE_CLOSE)
+            if end >= 0:
+                self._emit_quote(events, self._buffer[:end])
+                self._buffer = self._buffer[end + len(CITE_CLOSE):]
+                events.append(("citation", (self._chunk_id, self._quote.strip())))
+                self.state = self.TEXT
+                continue
+            held = self._partial_marker_length(self._buffer, CITE_CLOSE)
+            self._emit_quote(events, self._buffer[:len(self._buffer) - held])
+            self._buffer = self._buffer[len(self._buffer) - held:]
+            break
+
+        return events
+
+    def flush(self) -> List[Tuple[str, Any]]:
+        """
+        Release any held-back text at the end of the stream.
+
+        An unterminated citation produces no citation event; its quoted text
+        has already been released. An opening marker cut off before its
+        chunk ID ends was not a marker after all and is released as text.
+
+        Returns:
+            List of remaining ("token", text) events
+        """
+        events: List[Tuple[str, Any]] = []
+        if self.state == self.CHUNK_ID:
+            self._emit_text(events, CITE_OPEN)
+        self._emit_text(events, self._buffer)
+        self._buffer = ""
+        self.state = self.TEXT
+        return events
+
+    def _emit_text(self, events: List[Tuple[str, Any]], text: str):
+        """Append a text event, merging with a preceding text event."""
+        if not text:
+            return
+        if events and events[-1][0] == "token":
+            events[-1] = ("token", events[-1][1] + text)
+        else:
+            events.append(("token", text))
+
+    def _emit_quote(self, events: List[Tuple[str, Any]], text: str):
+        """Release quoted text and remember it for the citation."""
+        self._quote += text
+        self._emit_text(events, text)
+
+    @staticmethod
+    def _partial_marker_length(text: str, marker: str) -> int:
+        """Length of the longest suffix of text that is a proper prefix of marker."""
+        for length in range(min(len(text), len(marker) - 1), 0, -1):
+            if text.endswith(marker[:length]):
+                return length
+        return 0
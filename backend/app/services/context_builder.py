@@ -0,0 +1,128 @@
+"""Token-budgeted assembly of retrieved chunks into prompt context."""
+import re
+from typing import Callable, List, Tuple
+from langchain_core.documents import Document
+from app.models.response import ContextUsage
+
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+
+class ContextBuilder:
+    """Packs retrieved documents into a prompt context under a token budget."""
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        token_budget: int = 3000,
+        min_truncated_tokens: int = 32
+    ):
+        """
+        Initialize the context builder.
+
+        Args:
+            count_tokens: Function returning the token count of a text
+            token_budget: Maximum tokens the context may use
+            min_truncated_tokens: Smallest useful remainder when truncating a
+                chunk; below this the chunk is left out entirely
+        """
+        self.count_tokens = count_tokens
+        self.token_budget = token_budget
+        self.min_truncated_tokens = min_truncated_tokens
+
+    def format_header(self, doc: Document) -> str:
+        """Format the label line shown above a chunk in the context."""
+        chunk_id = doc.metadata.get("chunk_id", "")
+        page_info = f"Page {doc.metadata.get('page_start', '?')}"
+        section = doc.metadata.get("section_title", "")
+        if section:
+            return f"[Chunk {chunk_id}, {page_info}, Section: {section}]"
+        return f"[Chunk {chunk_id}, {page_info}]"
+
+    @staticmethod
+    def document_order(doc: Document) -> Tuple[str, int, str]:
+        """Sort key placing chunks in rulebook order."""
+        page = doc.metadata.get("page_start")
+        return (
+            doc.metadata.get("pdf_id", ""),
+            page if isinstance(page, int) else -1,
+            doc.metadata.get("chunk_id", "")
+        )
+
+    def build(self, docs: List[Document]) -> Tuple[str, List[Document], ContextUsage]:
+        """
+        Pack documents in relevance order until the token budget is spent.
+
+        The first document that does not fit is truncated at a sentence
+        boundary; packing stops there. The context lists the packed chunks in
+        rulebook order rather than rank order, so retrievals that return the
+        same chunks produce the same prompt (and a provider-cacheable prefix).
+
+        Args:
+            docs: Documents in relevance order
+
+        Returns:
+            Tuple of (context string, documents included in relevance order, usage report)
+        """
+        parts: List[str] = []
+        included: List[Document] = []
+        used = 0
+        truncated = 0
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+
+        for doc in docs:
+            header = self.format_header(doc)
+            overhead = self.count_tokens(header + "\n") + (separator_tokens if parts else 0)
+            content_tokens = self.count_tokens(doc.page_content)
+            remaining = self.token_budget - used - overhead
+
+            if content_tokens <= remaining:
+                parts.append(f"{header}\n{doc.page_content}")
+                included.append(doc)
+                used += overhead + content_tokens
+                continue
+
+            if remaining >= self.min_truncated_tokens:
+                text, text_tokens = self._truncate_to_sentences(doc.page_content, remaining)
+                if text:
+                    parts.append(f"{header}\n{text}")
+                    included.append(Document(page_content=text, metadata=doc.metadata))
+                    used += overhead + text_tokens
+                    truncated += 1
+            break
+
+        usage = ContextUsage(
+            context_tokens=used,
+            token_budget=self.token_budget,
+            chunks_retrieved=len(docs),
+            chunks_included=len(included),
+            chunks_truncated=truncated
+        )
+        order = sorted(range(len(parts)), key=lambda i: self.document_order(included[i]))
+        return CONTEXT_SEPARATOR.join(parts[i] for i in order), included, usage
+
+    def _truncate_to_sentences(self, text: str, max_tokens: int) -> Tuple[str, int]:
+        """
+        Keep the leading whole sentences of text that fit in max_tokens.
+
+        Args:
+            text: Text to truncate
+            max_tokens: Token limit for the kept text
+
+        Returns:
+            Tuple of (truncated text, its approximate token count)
+        """
+        # Sentence end positions, so the kept text is an exact prefix of text
+        ends = [match.start() for match in SENTENCE_BOUNDARY.finditer(text)] + [len(text)]
+        kept_end = 0
+        used = 0
+        start = 0
+        for end in ends:
+            sentence_tokens = self.count_tokens(text[start:end])
+            if used + sentence_tokens > max_tokens:
+                break
+            kept_end = end
+            used += sentence_tokens
+            start = end
+        return text[:kept_end].rstrip(), used
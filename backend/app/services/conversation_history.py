@@ -0,0 +1,202 @@
+"""Conversation history windowing and summarization for prompts."""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+from app.utils.metrics import record_cache_lookup
+
+
+CITATION_MARKER = re.compile(r"\[\[/?CITE[^\]]*\]\]")
+
+SUMMARY_PROMPT = """Summarize the conversation below between a user and an assistant about Catan board game rules.
+Keep every rules question asked and the ruling given, plus any game state the user described.
+Write at most {max_words} words of plain prose.
+
+{existing_summary}Conversation:
+{messages}
+
+Summary:"""
+
+
+class ConversationHistoryService:
+    """
+    Keeps recent turns verbatim and compresses older turns into a summary.
+
+    Summarizing is a blocking LLM call made while the answer prompt is built,
+    so it adds a full LLM round trip to time to first token. Summaries are
+    cached per conversation and extended with only the turns that left the
+    window; still, once a conversation is longer than the window, every
+    question usually pushes a turn out and pays for one summarization call.
+    """
+
+    def __init__(
+        self,
+        llm,
+        count_tokens: Callable[[str], int],
+        max_turns: int = 3,
+        token_cap: int = 1000,
+        cache_size: int = 1024
+    ):
+        """
+        Initialize the conversation history service.
+
+        Args:
+            llm: Chat model used to summarize older turns
+            count_tokens: Function returning the token count of a text
+            max_turns: Number of most recent user/assistant turns kept verbatim
+            token_cap: Maximum tokens of formatted history placed in a prompt
+            cache_size: Number of conversation summaries kept in memory
+        """
+        self.llm = llm
+        self.count_tokens = count_tokens
+        self.max_turns = max_turns
+        self.token_cap = token_cap
+        self.cache_size = cache_size
+        # Summary budget; the rest of the cap goes to verbatim turns
+        self.summary_token_cap = token_cap // 3
+
+        # conversation key -> (messages summarized, digest of those messages, summary)
+        self._summaries: "OrderedDict[str, Tuple[int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def format_history(self, history: list, conversation_id: Optional[str] = None) -> str:
+        """
+        Format conversation history for the prompt within the token cap.
+
+        Args:
+            history: Previous messages as dicts with "role" and "content"
+            conversation_id: Client conversation ID used to cache the summary
+
+        Returns:
+            Formatted history block, or an empty string if there is no history
+        """
+        if not history:
+            return ""
+
+        lines = [self._format_message(msg) for msg in history]
+        split = self._window_start(lines)
+
+        summary = ""
+        if split > 0:
+            key = conversation_id or self._digest(lines[:1])
+            summary = self._get_summary(key, lines[:split])
+
+        formatted = ""
+        if summary:
+            formatted += f"Summary of earlier conversation:\n{summary}\n\n"
+        if split < len(lines):
+            formatted += "Previous conversation:\n" + "".join(lines[split:]) + "\n"
+        return formatted
+
+    def _format_message(self, msg: dict) -> str:
+        """Format one message as a prompt line, without citation markers."""
+        role = "User" if msg.get("role") == "user" else "Assistant"
+        content = CITATION_MARKER.sub("", msg.get("content", ""))
+        return f"{role}: {content}\n"
+
+    def _window_start(self, lines: List[str]) -> int:
+        """
+        Find where the verbatim window starts.
+
+        The window is the longest suffix of at most max_turns turns that fits
+        in the token cap left after reserving room for the summary.
+
+        Args:
+            lines: Formatted message lines
+
+        Returns:
+            Index of the first message kept verbatim
+        """
+        budget = self.token_cap - self.summary_token_cap
+        start = len(lines)
+        used = 0
+        while start > 0 and len(lines) - start < self.max_turns * 2:
+            tokens = self.count_tokens(lines[start - 1])
+            if used + tokens > budget:
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    def _get_summary(self, key: str, lines: List[str]) -> str:
+        """
+        Get a summary of the given messages, reusing the cached one if possible.
+
+        A cached summary of a prefix of the messages is extended with only the
+        messages added since, so each message is summarized once.
+
+        Args:
+            key: Conversation cache key
+            lines: Formatted lines of the messages to summarize
+
+        Returns:
+            Summary text, or an empty string if summarization failed
+        """
+        digest = self._digest(lines)
+        with self._lock:
+            cached = self._summaries.get(key)
+            if cached is not None:
+                self._summaries.move_to_end(key)
+
+        previous_summary = ""
+        new_lines = lines
+        if cached is not None:
+            count, cached_digest, cached_summary = cached
+            if count == len(lines) and cached_digest == digest:
+                record_cache_lookup("history_summary", True)
+                return cached_summary
+            if count < len(lines) and cached_digest == self._digest(lines[:count]):
+                previous_summary = cached_summary
+                new_lines = lines[count:]
+
+        record_cache_lookup("history_summary", False)
+        summary = self._summarize(previous_summary, new_lines)
+        if not summary:
+            return previous_summary
+
+        with self._lock:
+            self._summaries[key] = (len(lines), digest, summary)
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _summarize(self, previous_summary: str, lines: List[str]) -> str:
+        """
+        Ask the LLM to fold new messages into the running summary.
+
+        Args:
+            previous_summary: Summary of earlier messages, may be empty
+            lines: Formatted lines of the messages to add
+
+        Returns:
+            Summary capped at the summary token budget, or an empty string on error
+        """
+        existing = f"Existing summary:\n{previous_summary}\n\n" if previous_summary else ""
+        prompt = SUMMARY_PROMPT.format(
+            max_words=max(20, self.summary_token_cap * 3 // 4),
+            existing_summary=existing,
+            messages="".join(lines)
+        )
+        try:
+            if hasattr(self.llm, 'invoke'):
+                summary = self.llm.invoke(prompt).content
+            else:
+                summary = self.llm.predict(prompt)
+        except Exception:
+            # History is best-effort context; never fail the question over it
+            return ""
+
+        summary = summary.strip()
+        # Hard cap in case the model ignored the word limit
+        while summary and self.count_tokens(summary) > self.summary_token_cap:
+            summary = summary[:int(len(summary) * 0.9)].rsplit(" ", 1)[0]
+        return summary
+
+    def _digest(self, lines: List[str]) -> str:
+        """Hash message lines to detect edited or different histories."""
+        hasher = hashlib.sha256()
+        for line in lines:
+            hasher.update(line.encode("utf-8"))
+        return hasher.hexdigest()
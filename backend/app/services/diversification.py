@@ -0,0 +1,170 @@
+"""Post-retrieval deduplication and MMR diversification of chunks."""
+from typing import List, Sequence
+import numpy as np
+from langchain_core.documents import Document
+
+
+class DiversificationService:
+    """Service for removing redundant content from retrieved chunks."""
+
+    def __init__(
+        self,
+        mmr_lambda: float = 0.7,
+        duplicate_threshold: float = 0.97,
+        min_overlap_chars: int = 40
+    ):
+        """
+        Initialize the diversification service.
+
+        Args:
+            mmr_lambda: Trade-off between relevance (1.0) and diversity (0.0)
+            duplicate_threshold: Cosine similarity above which a candidate is
+                dropped as a duplicate of an already selected chunk
+            min_overlap_chars: Minimum shared text before two chunks are
+                treated as overlapping neighbours
+        """
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap_chars = min_overlap_chars
+
+    def diversify(
+        self,
+        query_embedding: Sequence[float],
+        docs: List[Document],
+        embeddings: Sequence[Sequence[float]],
+        k: int
+    ) -> List[Document]:
+        """
+        Select up to k diverse chunks and trim text they share with each other.
+
+        Args:
+            query_embedding: Embedding of the user's question
+            docs: Candidate documents, in retrieval order
+            embeddings: Embedding of each candidate document
+            k: Maximum number of documents to return
+
+        Returns:
+            Selected documents in MMR order with overlapping text removed
+        """
+        if not docs:
+            return []
+
+        selected = self.mmr_select(query_embedding, embeddings, k)
+        return self.merge_overlaps([docs[i] for i in selected])
+
+    def mmr_select(
+        self,
+        query_embedding: Sequence[float],
+        embeddings: Sequence[Sequence[float]],
+        k: int
+    ) -> List[int]:
+        """
+        Pick candidate indices by maximal marginal relevance.
+
+        Args:
+            query_embedding: Embedding of the user's question
+            embeddings: Embedding of each candidate
+            k: Maximum number of candidates to select
+
+        Returns:
+            Indices of the selected candidates in selection order
+        """
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2 or len(matrix) == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+
+        # Cosine similarities via normalized dot products
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        relevance = matrix @ query
+        similarity = matrix @ matrix.T
+
+        available = np.ones(len(matrix), dtype=bool)
+        max_similarity = np.zeros(len(matrix), dtype=np.float32)
+        selected: List[int] = []
+
+        while len(selected) < k and available.any():
+            scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_similarity
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            selected.append(best)
+            available[best] = False
+            max_similarity = np.maximum(max_similarity, similarity[best])
+            # Near-identical chunks add nothing once one of them is selected
+            available &= similarity[best] < self.duplicate_threshold
+
+        return selected
+
+    def merge_overlaps(self, docs: List[Document]) -> List[Document]:
+        """
+        Remove text that a document shares with a higher-ranked neighbour.
+
+        Adjacent chunks from the same PDF overlap by design. Each document's
+        overlap with an earlier document is cut so the shared passage appears
+        only once; documents fully contained in an earlier one are dropped.
+        Trimmed documents are copies whose ``content_offset`` metadata records
+        where the remaining text starts in the original chunk.
+
+        Args:
+            docs: Documents in ranking order
+
+        Returns:
+            Documents with overlapping text removed
+        """
+        kept: List[Document] = []
+
+        for doc in docs:
+            text = doc.page_content
+            offset = doc.metadata.get("content_offset", 0)
+            pdf_id = doc.metadata.get("pdf_id")
+            contained = False
+
+            for earlier in kept:
+                if earlier.metadata.get("pdf_id") != pdf_id:
+                    continue
+                earlier_text = earlier.page_content
+                if text in earlier_text:
+                    contained = True
+                    break
+
+                # Earlier chunk's tail repeats at the start of this one
+                overlap = self._suffix_prefix_overlap(earlier_text, text)
+                if overlap:
+                    stripped = text[overlap:].lstrip()
+                    offset += len(text) - len(stripped)
+                    text = stripped
+
+                # This chunk's tail repeats at the start of the earlier one
+                overlap = self._suffix_prefix_overlap(text, earlier_text)
+                if overlap:
+                    text = text[:len(text) - overlap].rstrip()
+
+                if not text:
+                    contained = True
+                    break
+
+            if contained:
+                continue
+            if text == doc.page_content:
+                kept.append(doc)
+            else:
+                kept.append(Document(
+                    page_content=text,
+                    metadata={**doc.metadata, "content_offset": offset}
+                ))
+
+        return kept
+
+    def _suffix_prefix_overlap(self, first: str, second: str) -> int:
+        """Length of the longest suffix of first that is also a prefix of second."""
+        if len(second) < self.min_overlap_chars:
+            return 0
+
+        probe = second[:self.min_overlap_chars]
+        pos = first.find(probe, max(0, len(first) - len(second)))
+        while pos != -1:
+            if second.startswith(first[pos:]):
+                return len(first) - pos
+            pos = first.find(probe, pos + 1)
+        return 0
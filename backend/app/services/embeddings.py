@@ -4,8 +4,6 @@ try:
     from langchain.embeddings.base import Embeddings
 except ImportError:
     from langchain_core.embeddings import Embeddings
-from langchain_openai import OpenAIEmbeddings
-from langchain_google_vertexai import VertexAIEmbeddings
 from app.config import settings
 
 
@@ -18,12 +16,15 @@ class EmbeddingService:
 
     def _create_embeddings(self) -> Embeddings:
         """Create the appropriate embedding model based on configuration."""
+        # Provider SDKs are imported here so only the configured one is loaded
         if settings.llm_provider == "openai":
+            from langchain_openai import OpenAIEmbeddings
             return OpenAIEmbeddings(
                 model=settings.embedding_model,
                 openai_api_key=settings.openai_api_key
             )
         elif settings.llm_provider == "vertex":
+            from langchain_google_vertexai import VertexAIEmbeddings
             return VertexAIEmbeddings(
                 model_name=settings.vertex_embedding_model,
                 project=settings.vertex_project_id,
@@ -56,3 +57,17 @@ class EmbeddingService:
         """
         return self.embeddings.embed_documents(texts)
 
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Generate search-query embeddings for multiple texts in one batched call.
+        
+        Args:
+            texts: List of query texts to embed
+            
+        Returns:
+            List of embedding vectors, one per text
+        """
+        if settings.llm_provider == "vertex":
+            # Vertex embeds queries and documents with different task types
+            return self.embeddings.embed(texts, embeddings_task_type="RETRIEVAL_QUERY")
+        return self.embeddings.embed_documents(texts)
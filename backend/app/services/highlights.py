@@ -0,0 +1,103 @@
+"""Precomputed per-line highlight geometry for chunks."""
+from bisect import bisect_right
+from typing import Dict, List
+from app.models.chunk import Atom, BBox, Chunk, HighlightLine
+
+
+# Atoms whose tops are this close are on the same line
+SAME_LINE_TOLERANCE = 5
+# Atoms on the same line closer than this are merged into one rectangle
+MAX_WORD_GAP = 10
+
+
+def _union(boxes: List[BBox]) -> BBox:
+    """Smallest bounding box containing all boxes."""
+    return BBox(
+        x0=min(box.x0 for box in boxes),
+        y0=min(box.y0 for box in boxes),
+        x1=max(box.x1 for box in boxes),
+        y1=max(box.y1 for box in boxes)
+    )
+
+
+def compute_highlight_lines(atoms: List[Atom]) -> List[HighlightLine]:
+    """
+    Merge a chunk's atoms into per-line highlight rectangles.
+
+    Consecutive atoms on the same page and line that are horizontally
+    adjacent become one rectangle.
+
+    Args:
+        atoms: Chunk atoms in reading order, with chunk-relative char positions
+
+    Returns:
+        Highlight lines ordered by character position
+    """
+    lines: List[HighlightLine] = []
+    start = 0
+
+    for i in range(1, len(atoms) + 1):
+        if i < len(atoms):
+            previous, atom = atoms[i - 1], atoms[i]
+            same_line = (
+                atom.page_num == previous.page_num
+                and abs(atom.bbox.y0 - previous.bbox.y0) < SAME_LINE_TOLERANCE
+                and atom.bbox.x0 - previous.bbox.x1 < MAX_WORD_GAP
+            )
+            if same_line:
+                continue
+
+        run = atoms[start:i]
+        lines.append(HighlightLine(
+            page_num=run[0].page_num,
+            bbox=_union([atom.bbox for atom in run]),
+            char_start=run[0].char_start,
+            char_end=run[-1].char_end,
+            atom_start=start,
+            atom_end=i
+        ))
+        start = i
+
+    return lines
+
+
+def resolve_highlight(chunk: Chunk, char_start: int, char_end: int) -> Dict[int, List[BBox]]:
+    """
+    Resolve a quote span to highlight rectangles grouped by page.
+
+    Lines fully inside the span contribute their merged rectangle; lines the
+    span only partly covers contribute the union of the atoms it overlaps.
+
+    Args:
+        chunk: Chunk containing the quote
+        char_start: Quote start position in chunk text
+        char_end: Quote end position in chunk text
+
+    Returns:
+        Dict of page number to rectangles on that page
+    """
+    lines = chunk.highlight_lines
+    if lines is None:
+        lines = compute_highlight_lines(chunk.atoms)
+
+    by_page: Dict[int, List[BBox]] = {}
+    # Lines are ordered by position; skip those ending before the span
+    first = bisect_right(lines, char_start, key=lambda line: line.char_end)
+    for line in lines[first:]:
+        if line.char_start >= char_end:
+            break
+        if line.char_end <= char_start:
+            continue
+        if char_start <= line.char_start and line.char_end <= char_end:
+            box = line.bbox
+        else:
+            overlapping = [
+                atom.bbox for atom in chunk.atoms[line.atom_start:line.atom_end]
+                if atom.char_end > char_start and atom.char_start < char_end
+            ]
+            if not overlapping:
+                continue
+            box = _union(overlapping)
+        by_page.setdefault(line.page_num, []).append(box)
+
+    return by_page
@@ -0,0 +1,402 @@
+"""Failover across LLM providers: hedged requests and per-provider circuit breakers."""
+import asyncio
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from langchain_core.messages import AIMessage
+from app.utils.metrics import LLM_CIRCUIT_OPEN, LLM_HEDGED_REQUESTS, LLM_PROVIDER_CALLS
+
+
+class ProvidersUnavailable(RuntimeError):
+    """Raised when every provider's circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a provider that keeps failing.
+
+    After failure_threshold consecutive failures the breaker opens and the
+    provider is skipped. Once reset_timeout_s has passed it lets a single
+    trial request through (half-open): success closes the breaker, failure
+    opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout_s: float):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Provider name, used as the metric label
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout_s: Time the breaker stays open before a trial request
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout_s = reset_timeout_s
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        LLM_CIRCUIT_OPEN.labels(name).set(0)
+
+    @property
+    def state(self) -> str:
+        """Current state: closed, open or half_open."""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at < self.reset_timeout_s:
+                return "open"
+            return "half_open"
+
+    def allow(self) -> bool:
+        """
+        Ask to send a request; a half-open breaker admits one trial at a time.
+
+        Returns:
+            True if the request may be sent
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout_s or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        """Close the breaker after a successful request."""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+        LLM_CIRCUIT_OPEN.labels(self.name).set(0)
+
+    def record_failure(self):
+        """Count a failure, opening the breaker at the threshold or after a failed trial."""
+        with self._lock:
+            self._failures += 1
+            trial = self._trial_in_flight
+            self._trial_in_flight = False
+            if not trial and self._failures < self.failure_threshold:
+                return
+            self._opened_at = time.monotonic()
+        LLM_CIRCUIT_OPEN.labels(self.name).set(1)
+
+    def record_cancelled(self):
+        """A request was abandoned without an outcome; free the trial slot."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class Provider:
+    """A chat model together with its circuit breaker."""
+
+    def __init__(self, name: str, llm: Any, breaker: CircuitBreaker):
+        self.name = name
+        self.llm = llm
+        self.breaker = breaker
+
+
+class _ThreadAttempt:
+    """A provider stream consumed in a worker thread."""
+
+    def __init__(self, provider: Provider, prompt: Any, events: queue.Queue):
+        self.provider = provider
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(prompt, events), name=f"llm-{provider.name}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, prompt: Any, events: queue.Queue):
+        stream = None
+        try:
+            stream = self.provider.llm.stream(prompt)
+            for chunk in stream:
+                if self._cancelled.is_set():
+                    return
+                events.put((self, "chunk", chunk))
+            events.put((self, "done", None))
+        except Exception as e:
+            events.put((self, "error", e))
+        finally:
+            # Closing the generator closes the provider's HTTP stream
+            if stream is not None and hasattr(stream, "close"):
+                stream.close()
+
+    def cancel(self):
+        """Stop at the next chunk (a blocking provider call cannot be interrupted)."""
+        self._cancelled.set()
+
+
+class _TaskAttempt:
+    """A provider stream consumed in an event-loop task."""
+
+    def __init__(self, provider: Provider, prompt: Any, events: asyncio.Queue):
+        self.provider = provider
+        self._task = asyncio.create_task(self._run(prompt, events))
+
+    async def _run(self, prompt: Any, events: asyncio.Queue):
+        try:
+            async for chunk in self.provider.llm.astream(prompt):
+                events.put_nowait((self, "chunk", chunk))
+            events.put_nowait((self, "done", None))
+        except Exception as e:
+            events.put_nowait((self, "error", e))
+
+    def cancel(self):
+        """Cancel the task, which aborts the provider request."""
+        self._task.cancel()
+
+
+class _Race:
+    """
+    Provider selection for one request.
+
+    Starts the first provider whose breaker allows it. While a single
+    attempt is running without a first chunk, the next provider is started
+    once hedge_after_s has passed since the last start; an attempt that
+    fails before its first chunk is replaced by the next provider at once.
+    The first attempt to produce a chunk with content, or to finish, wins
+    and the others are cancelled. Empty chunks that arrive before that (role
+    or metadata only) are held back and handed over if their attempt wins.
+    """
+
+    def __init__(self, providers: List[Provider], hedge_after_s: float, launch: Callable[[Provider], Any]):
+        self._pending = list(providers)
+        self._hedge_after_s = hedge_after_s
+        self._launch = launch
+        self._running: List[Any] = []
+        self._launched_at = 0.0
+        # Attempt -> empty chunks it produced before the race was decided
+        self._held: Dict[Any, List[Any]] = {}
+        self.winner = None
+        if not self._start_next():
+            raise ProvidersUnavailable("All LLM providers are unavailable (circuit breakers open)")
+
+    def _start_next(self) -> bool:
+        """Start the next provider whose breaker allows a request."""
+        while self._pending:
+            provider = self._pending.pop(0)
+            if provider.breaker.allow():
+                self._running.append(self._launch(provider))
+                self._launched_at = time.monotonic()
+                return True
+        return False
+
+    def hedge_timeout(self) -> Optional[float]:
+        """Seconds until a hedged request should start, or None to wait indefinitely."""
+        if self.winner is not None or len(self._running) != 1 or not self._pending or self._hedge_after_s <= 0:
+            return None
+        return max(0.0, self._launched_at + self._hedge_after_s - time.monotonic())
+
+    def hedge(self):
+        """Start the next provider alongside the slow one."""
+        slow = self._running[0].provider.name
+        if self._start_next():
+            LLM_HEDGED_REQUESTS.labels(slow).inc()
+
+    def accept(self, attempt: Any, kind: str, payload: Any) -> bool:
+        """
+        Process an event from an attempt.
+
+        Args:
+            attempt: Attempt that produced the event
+            kind: "chunk", "done" or "error"
+            payload: Chunk or exception
+
+        Returns:
+            True if the event belongs to the winner and should be handled by the caller
+
+        Raises:
+            Exception: The last provider error, once no provider is left to try
+        """
+        if self.winner is not None:
+            return attempt is self.winner
+        if attempt not in self._running:
+            return False
+        if kind == "error":
+            self._running.remove(attempt)
+            self._held.pop(attempt, None)
+            self._record(attempt, "failure")
+            if not self._running and not self._start_next():
+                raise payload
+            return False
+        if kind == "chunk" and not getattr(payload, "content", payload):
+            # A provider that has only sent headers has not started answering
+            self._held.setdefault(attempt, []).append(payload)
+            return False
+        self.winner = attempt
+        for other in self._running:
+            if other is not attempt:
+                other.cancel()
+                self._record(other, "cancelled")
+        self._running = [attempt]
+        return True
+
+    def take_held(self) -> List[Any]:
+        """Empty chunks the winner produced before it won, to pass on before its event."""
+        held = self._held.pop(self.winner, [])
+        self._held = {}
+        return held
+
+    def finish(self, error: Optional[BaseException] = None):
+        """Record the winner's outcome."""
+        self._record(self.winner, "failure" if error is not None else "success")
+        self._running = []
+
+    def cancel(self):
+        """Cancel every attempt still running (the caller stopped reading)."""
+        for attempt in self._running:
+            attempt.cancel()
+            self._record(attempt, "cancelled")
+        self._running = []
+
+    @staticmethod
+    def _record(attempt: Any, outcome: str):
+        breaker = attempt.provider.breaker
+        if outcome == "success":
+            breaker.record_success()
+        elif outcome == "failure":
+            breaker.record_failure()
+        else:
+            breaker.record_cancelled()
+        LLM_PROVIDER_CALLS.labels(attempt.provider.name, outcome).inc()
+
+
+class FailoverLLM:
+    """
+    Chat model facade over an ordered list of providers.
+
+    Exposes the stream/invoke methods QAService uses. Requests go to the
+    first healthy provider; a slow first token triggers a hedged request to
+    the next one and whichever streams first is used. A provider that fails
+    before its first chunk is replaced by the next one; an error after
+    streaming has started is raised, since part of the answer has been sent.
+    """
+
+    def __init__(self, providers: List[Tuple[str, Any]], hedge_after_ms: float,
+                 failure_threshold: int, reset_timeout_s: float):
+        """
+        Initialize the failover model.
+
+        Args:
+            providers: (name, chat model) pairs in order of preference
+            hedge_after_ms: Time to first token after which the next provider is tried (0 = never)
+            failure_threshold: Consecutive failures that open a provider's breaker
+            reset_timeout_s: Time a breaker stays open before a trial request
+        """
+        self.providers = [
+            Provider(name, llm, CircuitBreaker(name, failure_threshold, reset_timeout_s))
+            for name, llm in providers
+        ]
+        self.hedge_after_s = hedge_after_ms / 1000
+
+    def stream(self, prompt: Any) -> Iterator[Any]:
+        """
+        Stream chunks from the first provider to respond.
+
+        Args:
+            prompt: Prompt passed to the provider's chat model
+
+        Yields:
+            Message chunks of the winning provider
+
+        Raises:
+            ProvidersUnavailable: If every breaker is open
+        """
+        events: queue.Queue = queue.Queue()
+        race = _Race(self.providers, self.hedge_after_s, lambda provider: _ThreadAttempt(provider, prompt, events))
+        try:
+            while True:
+                try:
+                    attempt, kind, payload = events.get(timeout=race.hedge_timeout())
+                except queue.Empty:
+                    race.hedge()
+                    continue
+                if not race.accept(attempt, kind, payload):
+                    continue
+                yield from race.take_held()
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    race.finish()
+                    return
+                else:
+                    race.finish(payload)
+                    raise payload
+        finally:
+            race.cancel()
+
+    async def astream(self, prompt: Any) -> AsyncIterator[Any]:
+        """
+        Async version of stream(); losing requests are cancelled outright.
+
+        Args:
+            prompt: Prompt passed to the provider's chat model
+
+        Yields:
+            Message chunks of the winning provider
+
+        Raises:
+            ProvidersUnavailable: If every breaker is open
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        race = _Race(self.providers, self.hedge_after_s, lambda provider: _TaskAttempt(provider, prompt, events))
+        try:
+            while True:
+                try:
+                    attempt, kind, payload = await asyncio.wait_for(events.get(), race.hedge_timeout())
+                except asyncio.TimeoutError:
+                    race.hedge()
+                    continue
+                if not race.accept(attempt, kind, payload):
+                    continue
+                for chunk in race.take_held():
+                    yield chunk
+                if kind == "chunk":
+                    yield payload
+                elif kind == "done":
+                    race.finish()
+                    return
+                else:
+                    race.finish(payload)
+                    raise payload
+        finally:
+            race.cancel()
+
+    @staticmethod
+    def _join(chunks: List[Any]) -> Any:
+        """Merge streamed chunks into one message."""
+        if not chunks:
+            return AIMessage(content="")
+        message = chunks[0]
+        for chunk in chunks[1:]:
+            message = message + chunk
+        return message
+
+    def invoke(self, prompt: Any) -> Any:
+        """
+        Get a complete response; streamed internally so it can be hedged.
+
+        Args:
+            prompt: Prompt passed to the provider's chat model
+
+        Returns:
+            Message with the full response content
+        """
+        return self._join(list(self.stream(prompt)))
+
+    async def ainvoke(self, prompt: Any) -> Any:
+        """
+        Async version of invoke().
+
+        Args:
+            prompt: Prompt passed to the provider's chat model
+
+        Returns:
+            Message with the full response content
+        """
+        return self._join([chunk async for chunk in self.astream(prompt)])
@@ -1,5 +1,4 @@
 """Custom PDF parser using PyMuPDF for coordinate tracking."""
-import fitz  # PyMuPDF
 import uuid
 from pathlib import Path
 from typing import List, Tuple, Optional
@@ -25,6 +24,9 @@ class PDFParser:
         Returns:
             Tuple of (PDFMetadata, List[Atom])
         """
+        # Imported on first use; PyMuPDF is only needed for ingestion
+        import fitz  # PyMuPDF
+        
         if pdf_id is None:
             pdf_id = str(uuid.uuid4())
         
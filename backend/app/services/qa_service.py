@@ -1,6 +1,10 @@
 """Question-answering service using LangChain RAG."""
+import asyncio
 import json
-from typing import List, Optional, Generator, Tuple
+import threading
+import time
+from contextlib import aclosing, closing
+from typing import AsyncGenerator, Dict, List, Optional, Generator, Tuple, Union
 try:
     from langchain.prompts import PromptTemplate
 except ImportError:
@@ -9,12 +13,32 @@ try:
     from langchain.schema import BaseOutputParser
 except ImportError:
     from langchain_core.output_parsers import BaseOutputParser
-from langchain_openai import ChatOpenAI
-from langchain_google_vertexai import ChatVertexAI
 from langchain_core.documents import Document
+from langchain_core.messages.ai import add_usage
 from app.config import settings
-from app.models.response import QueryResponse, SourceReference
+from app.models.chunk import RetrievalFilter, SearchIndex
+from app.models.response import ContextUsage, QueryResponse, RetrievedChunk, SourceReference
 from app.services.vector_store import VectorStoreService
+from app.services.diversification import DiversificationService
+from app.services.context_builder import ContextBuilder
+from app.services.conversation_history import ConversationHistoryService
+from app.services.citation_stream import CitationStreamParser
+from app.services.quote_locator import QuoteLocator, build_search_index
+from app.services.admission import AdmissionController, AdmissionRejected, Slot
+from app.services.single_flight import EventStream, SingleFlight
+from app.services.llm_failover import FailoverLLM
+from app.utils.metrics import (
+    CONTEXT_TOKENS,
+    LLM_PROMPT_TOKENS,
+    LLM_TOKENS_PER_SECOND,
+    LLM_TOKENS_SAVED,
+    QUERY_STAGE_SECONDS,
+    STREAM_CANCELLATIONS,
+)
+from app.utils.token_utils import get_token_counter
+
+
+NO_RESULTS_ANSWER = "I cannot answer this question as no relevant information was found in the rulebooks."
 
 
 class JSONOutputParser(BaseOutputParser):
@@ -56,16 +80,70 @@ class QAService:
         self.vector_store_service = vector_store_service
         self.llm = self._create_llm()
         self.output_parser = JSONOutputParser()
+        self.diversification_service = DiversificationService(
+            mmr_lambda=settings.mmr_lambda,
+            duplicate_threshold=settings.duplicate_similarity_threshold
+        )
+        self.quote_locator = QuoteLocator()
+        count_tokens = get_token_counter(self._model_name())
+        self.count_tokens = count_tokens
+        self.context_builder = ContextBuilder(
+            count_tokens=count_tokens,
+            token_budget=settings.context_token_budget
+        )
+        self.history_service = ConversationHistoryService(
+            llm=self.llm,
+            count_tokens=count_tokens,
+            max_turns=settings.history_max_turns,
+            token_cap=settings.history_token_cap,
+            cache_size=settings.history_summary_cache_size
+        )
+        # Moving average of answer length, to estimate tokens saved by cancelling
+        self._avg_answer_tokens: Optional[float] = None
+        # Prompt templates are built once and reused for every question
+        self.answer_prompt = self._create_prompt_template()
+        self.streaming_prompt = self._create_streaming_prompt_template()
+        # Identical concurrent questions share one retrieval and LLM call
+        self.flights = SingleFlight()
+        # Bounds concurrent LLM calls; excess requests queue fairly per client
+        self.admission = AdmissionController(
+            max_concurrent=settings.llm_max_concurrency,
+            max_queue=settings.llm_queue_size,
+            queue_timeout_s=settings.llm_queue_timeout_s
+        )
+
+    def _model_name(self) -> str:
+        """Name of the preferred LLM, used to pick a tokenizer."""
+        if settings.llm_provider_order[0] == "vertex":
+            return settings.vertex_model
+        return settings.openai_model
 
     def _create_llm(self):
-        """Create the appropriate LLM based on configuration."""
-        if settings.llm_provider == "openai":
+        """Create the LLM: the configured provider, or failover across several."""
+        providers = settings.llm_provider_order
+        if len(providers) == 1:
+            return self._create_provider_llm(providers[0])
+        return FailoverLLM(
+            [(provider, self._create_provider_llm(provider)) for provider in providers],
+            hedge_after_ms=settings.llm_hedge_after_ms,
+            failure_threshold=settings.llm_breaker_failures,
+            reset_timeout_s=settings.llm_breaker_reset_s
+        )
+
+    def _create_provider_llm(self, provider: str):
+        """Create the chat model of one provider."""
+        # Provider SDKs are imported here so only the configured ones are loaded
+        if provider == "openai":
+            from langchain_openai import ChatOpenAI
             return ChatOpenAI(
                 model_name=settings.openai_model,
                 openai_api_key=settings.openai_api_key,
-                temperature=0
+                temperature=0,
+                # Report token usage (including cached prompt tokens) when streaming
+                stream_usage=True
             )
-        elif settings.llm_provider == "vertex":
+        elif provider == "vertex":
+            from langchain_google_vertexai import ChatVertexAI
             return ChatVertexAI(
                 model_name=settings.vertex_model,
                 project=settings.vertex_project_id,
@@ -73,19 +151,16 @@ class QAService:
                 temperature=0
             )
         else:
-            raise ValueError(f"Unsupported LLM provider: {settings.llm_provider}")
+            raise ValueError(f"Unsupported LLM provider: {provider}")
 
     def _create_prompt_template(self) -> PromptTemplate:
         """Create the prompt template for RAG."""
+        # Fixed instructions come first and the per-question parts last, so
+        # every prompt shares a prefix that providers can cache
         template = """You are a helpful assistant that answers questions about Catan board game rules based ONLY on the provided context from official rulebooks.
 
-Context from rulebooks:
-{context}
-
-Question: {question}
-
 Instructions:
-1. Answer the question using ONLY the information provided in the context above.
+1. Answer the question using ONLY the information provided in the context below.
 2. If the answer is not in the provided context, say "I cannot answer this question based on the available rulebook content."
 3. Cite specific sources by referencing the chunk IDs where you found the information.
 4. Provide exact quotes from the rulebooks when possible.
@@ -102,6 +177,11 @@ Respond in the following JSON format:
   ]
 }}
 
+Context from rulebooks:
+{context}
+
+Question: {question}
+
 JSON Response:"""
         
         return PromptTemplate(
@@ -111,15 +191,11 @@ JSON Response:"""
 
     def _create_streaming_prompt_template(self) -> PromptTemplate:
         """Create the prompt template for streaming RAG with citation markers."""
+        # Same layout as the JSON prompt: static prefix, then context, history and question
         template = """You are a helpful assistant that answers questions about Catan board game rules based ONLY on the provided context from official rulebooks.
 
-Context from rulebooks:
-{context}
-
-{conversation_history}Question: {question}
-
 Instructions:
-1. Answer the question using ONLY the information provided in the context above.
+1. Answer the question using ONLY the information provided in the context below.
 2. If the answer is not in the provided context, say "I cannot answer this question based on the available rulebook content."
 3. Be thorough but concise in your answer.
 4. When citing rules, wrap the citation in markers like this: [[CITE:chunk_id]]exact quote from rulebook[[/CITE]]
@@ -127,6 +203,11 @@ Instructions:
    - Include the exact text you're quoting from that chunk
 5. You MUST cite sources when making factual claims about rules.
 
+Context from rulebooks:
+{context}
+
+{conversation_history}Question: {question}
+
 Answer:"""
 
         return PromptTemplate(
@@ -134,126 +215,334 @@ Answer:"""
             input_variables=["context", "question", "conversation_history"]
         )
 
-    def answer_question(self, question: str, k: int = 5) -> QueryResponse:
+    def answer_question(
+        self,
+        question: str,
+        k: int = 5,
+        filters: Optional[RetrievalFilter] = None,
+        client_id: Optional[str] = None
+    ) -> QueryResponse:
         """
         Answer a question using RAG.
         
         Args:
             question: User's question
             k: Number of chunks to retrieve
+            filters: Optional metadata filter restricting the searched chunks
+            client_id: Client asking, for fair LLM admission
             
         Returns:
             QueryResponse with answer and sources
+            
+        Raises:
+            AdmissionRejected: If no LLM slot could be obtained
         """
-        # Retrieve relevant chunks
-        retriever = self.vector_store_service.get_retriever(k=k)
-        # Support both old and new LangChain API
-        if hasattr(retriever, 'invoke'):
-            relevant_docs = retriever.invoke(question)
-        elif hasattr(retriever, 'get_relevant_documents'):
-            relevant_docs = retriever.get_relevant_documents(question)
-        else:
-            # Fallback to direct vector store search
-            relevant_docs = self.vector_store_service.search(question, k=k)
+        if settings.coalesce_queries:
+            key = self._flight_key("answer", question, k, filters)
+            return self.flights.call(key, lambda: self._answer_question(question, k, filters, client_id))
+        return self._answer_question(question, k, filters, client_id)
+
+    def _answer_question(
+        self, question: str, k: int, filters: Optional[RetrievalFilter], client_id: Optional[str]
+    ) -> QueryResponse:
+        """Answer a question using RAG, without coalescing."""
+        # Checked here rather than by the caller so a request that joins an
+        # identical answer in flight is never turned away
+        self.admission.check()
+        with QUERY_STAGE_SECONDS.labels("total").time():
+            # Retrieve relevant chunks
+            relevant_docs = self._retrieve_relevant_docs(question, k, filters)
+            return self._answer_from_docs(question, relevant_docs, client_id)
+
+    def _flight_key(
+        self,
+        kind: str,
+        question: str,
+        k: int,
+        filters: Optional[RetrievalFilter],
+        conversation_history: Optional[list] = None,
+        include_geometry: bool = False
+    ) -> tuple:
+        """
+        Key identifying requests that would produce the same answer.
+
+        The question is compared case-insensitively, ignoring whitespace and
+        trailing punctuation. The corpus version is part of the key so a
+        request never joins one that searches an older version.
+
+        Args:
+            kind: "answer" or "stream"
+            question: User's question
+            k: Number of chunks to retrieve
+            filters: Optional metadata filter
+            conversation_history: Previous conversation messages
+            include_geometry: Whether the retrieved event carries atom geometry
+
+        Returns:
+            Hashable key
+        """
+        normalized = " ".join(question.casefold().split()).rstrip("?!. ")
+        filter_key = None if filters is None or filters.is_empty() else filters.model_dump_json()
+        history_key = tuple(
+            (message.get("role", ""), message.get("content", "")) for message in conversation_history or []
+        )
+        return (
+            kind,
+            normalized,
+            k,
+            filter_key,
+            history_key,
+            include_geometry,
+            self.vector_store_service.corpus_version()
+        )
+
+    async def answer_questions_batch(
+        self,
+        questions: List[str],
+        k: int = 5,
+        filters: Optional[RetrievalFilter] = None,
+        max_concurrency: int = 8,
+        client_id: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[int, Union[QueryResponse, AdmissionRejected]], None]:
+        """
+        Answer many questions with shared embedding and retrieval.
         
-        if not relevant_docs:
-            return QueryResponse(
-                answer="I cannot answer this question as no relevant information was found in the rulebooks.",
-                sources=[]
-            )
+        All questions are embedded in one batched call and searched in one
+        vector store query. LLM calls then run concurrently, at most
+        max_concurrency at a time. A question that cannot get an LLM slot
+        is reported with its AdmissionRejected instead of an answer.
         
-        # Format context
-        context_parts = []
-        for doc in relevant_docs:
-            chunk_id = doc.metadata.get("chunk_id", "")
-            page_info = f"Page {doc.metadata.get('page_start', '?')}"
-            section = doc.metadata.get("section_title", "")
-            if section:
-                context_parts.append(f"[Chunk {chunk_id}, {page_info}, Section: {section}]\n{doc.page_content}")
-            else:
-                context_parts.append(f"[Chunk {chunk_id}, {page_info}]\n{doc.page_content}")
+        Args:
+            questions: User questions
+            k: Number of chunks to retrieve per question
+            filters: Optional metadata filter applied to every question
+            max_concurrency: Maximum number of concurrent LLM calls
+            client_id: Client asking, for fair LLM admission
+            
+        Yields:
+            Tuples of (question index, QueryResponse or AdmissionRejected) in completion order
+        """
+        docs_per_question = await asyncio.to_thread(
+            self._retrieve_relevant_docs_batch, questions, k, filters
+        )
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+        async def answer(
+            index: int, question: str, docs: List[Document]
+        ) -> Tuple[int, Union[QueryResponse, AdmissionRejected]]:
+            async with semaphore:
+                try:
+                    return index, await self._aanswer_from_docs(question, docs, client_id)
+                except AdmissionRejected as e:
+                    return index, e
+
+        tasks = [
+            asyncio.create_task(answer(index, question, docs))
+            for index, (question, docs) in enumerate(zip(questions, docs_per_question))
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Stop outstanding LLM calls if the consumer goes away
+            for task in tasks:
+                task.cancel()
+
+    def _build_answer_prompt(self, question: str, docs: List[Document]) -> Tuple[str, ContextUsage]:
+        """
+        Build the JSON-answer prompt for a question and its retrieved documents.
         
-        context = "\n\n---\n\n".join(context_parts)
+        Args:
+            question: User's question
+            docs: Retrieved documents in relevance order
+            
+        Returns:
+            Tuple of (prompt, context token usage)
+        """
+        # Format context within the token budget
+        context, _, usage = self._format_context(docs)
         
         # Create prompt
-        prompt_template = self._create_prompt_template()
-        prompt = prompt_template.format(context=context, question=question)
+        prompt = self.answer_prompt.format(context=context, question=question)
+        return prompt, usage
+
+    def _parse_answer(self, response: str, usage: ContextUsage) -> QueryResponse:
+        """
+        Parse the LLM's JSON answer into a QueryResponse.
         
-        # Call LLM
-        try:
-            # Use invoke for newer LangChain versions, fallback to predict
-            if hasattr(self.llm, 'invoke'):
-                response = self.llm.invoke(prompt).content
-            else:
-                response = self.llm.predict(prompt)
+        Args:
+            response: Raw LLM output
+            usage: Context token usage of the prompt
             
-            # Parse JSON response
-            parsed = self.output_parser.parse(response)
+        Returns:
+            QueryResponse with answer and sources
+        """
+        # Parse JSON response
+        parsed = self.output_parser.parse(response)
+        
+        # Extract answer and sources
+        answer = parsed.get("answer", "I cannot answer this question.")
+        sources_data = parsed.get("sources", [])
+        
+        sources = [
+            SourceReference(
+                chunk_id=src.get("chunk_id", ""),
+                quote_char_start=src.get("quote_char_start", 0),
+                quote_char_end=src.get("quote_char_end", 0)
+            )
+            for src in sources_data
+        ]
+        
+        return QueryResponse(answer=answer, sources=sources, usage=usage)
+
+    def _answer_from_docs(
+        self, question: str, docs: List[Document], client_id: Optional[str] = None
+    ) -> QueryResponse:
+        """
+        Answer a question from already retrieved documents.
+        
+        Args:
+            question: User's question
+            docs: Retrieved documents in relevance order
+            client_id: Client asking, for fair LLM admission
             
-            # Extract answer and sources
-            answer = parsed.get("answer", "I cannot answer this question.")
-            sources_data = parsed.get("sources", [])
+        Returns:
+            QueryResponse with answer and sources
             
-            sources = [
-                SourceReference(
-                    chunk_id=src.get("chunk_id", ""),
-                    quote_char_start=src.get("quote_char_start", 0),
-                    quote_char_end=src.get("quote_char_end", 0)
+        Raises:
+            AdmissionRejected: If no LLM slot could be obtained
+        """
+        if not docs:
+            return QueryResponse(answer=NO_RESULTS_ANSWER, sources=[])
+        
+        prompt, usage = self._build_answer_prompt(question, docs)
+        
+        # Call LLM
+        with self.admission.slot(client_id):
+            try:
+                # Use invoke for newer LangChain versions, fallback to predict
+                with QUERY_STAGE_SECONDS.labels("llm_generation").time():
+                    if hasattr(self.llm, 'invoke'):
+                        message = self.llm.invoke(prompt)
+                        response = message.content
+                        self._observe_prompt_cache(getattr(message, "usage_metadata", None), usage)
+                    else:
+                        response = self.llm.predict(prompt)
+                
+                return self._parse_answer(response, usage)
+                
+            except Exception as e:
+                # Fallback response on error
+                return QueryResponse(
+                    answer=f"I encountered an error while processing your question: {str(e)}. Please try again.",
+                    sources=[],
+                    usage=usage
                 )
-                for src in sources_data
-            ]
+
+    async def _aanswer_from_docs(
+        self, question: str, docs: List[Document], client_id: Optional[str] = None
+    ) -> QueryResponse:
+        """
+        Answer a question from already retrieved documents without blocking the event loop.
+        
+        Args:
+            question: User's question
+            docs: Retrieved documents in relevance order
+            client_id: Client asking, for fair LLM admission
             
-            return QueryResponse(answer=answer, sources=sources)
+        Returns:
+            QueryResponse with answer and sources
             
-        except Exception as e:
-            # Fallback response on error
-            return QueryResponse(
-                answer=f"I encountered an error while processing your question: {str(e)}. Please try again.",
-                sources=[]
-            )
+        Raises:
+            AdmissionRejected: If no LLM slot could be obtained
+        """
+        if not docs:
+            return QueryResponse(answer=NO_RESULTS_ANSWER, sources=[])
+        
+        prompt, usage = self._build_answer_prompt(question, docs)
+        
+        async with self.admission.aslot(client_id):
+            try:
+                with QUERY_STAGE_SECONDS.labels("llm_generation").time():
+                    if hasattr(self.llm, 'ainvoke'):
+                        message = await self.llm.ainvoke(prompt)
+                        response = message.content
+                        self._observe_prompt_cache(getattr(message, "usage_metadata", None), usage)
+                    else:
+                        response = await asyncio.to_thread(self.llm.predict, prompt)
+                
+                return self._parse_answer(response, usage)
+                
+            except Exception as e:
+                return QueryResponse(
+                    answer=f"I encountered an error while processing your question: {str(e)}. Please try again.",
+                    sources=[],
+                    usage=usage
+                )
 
-    def _retrieve_relevant_docs(self, question: str, k: int = 5) -> List[Document]:
+    def _retrieve_relevant_docs(
+        self, question: str, k: int = 5, filters: Optional[RetrievalFilter] = None
+    ) -> List[Document]:
         """
         Retrieve relevant documents for a question.
         
+        Over-fetches candidates, then applies MMR diversification and removes
+        text shared between overlapping neighbour chunks so the prompt only
+        carries unique content.
+        
         Args:
             question: User's question
             k: Number of chunks to retrieve
+            filters: Optional metadata filter restricting the searched chunks
             
         Returns:
             List of relevant documents
         """
-        retriever = self.vector_store_service.get_retriever(k=k)
-        # Support both old and new LangChain API
-        if hasattr(retriever, 'invoke'):
-            return retriever.invoke(question)
-        elif hasattr(retriever, 'get_relevant_documents'):
-            return retriever.get_relevant_documents(question)
-        else:
-            # Fallback to direct vector store search
-            return self.vector_store_service.search(question, k=k)
+        fetch_k = k * max(1, settings.retrieval_fetch_multiplier)
+        docs, embeddings, query_embedding = self.vector_store_service.search_with_embeddings(
+            question, k=fetch_k, filters=filters
+        )
+        with QUERY_STAGE_SECONDS.labels("diversify").time():
+            return self.diversification_service.diversify(query_embedding, docs, embeddings, k)
 
-    def _format_context(self, docs: List[Document]) -> str:
+    def _retrieve_relevant_docs_batch(
+        self, questions: List[str], k: int = 5, filters: Optional[RetrievalFilter] = None
+    ) -> List[List[Document]]:
         """
-        Format documents into context string.
+        Retrieve relevant documents for many questions in one vector store pass.
         
         Args:
-            docs: List of documents
+            questions: User questions
+            k: Number of chunks to retrieve per question
+            filters: Optional metadata filter applied to every question
             
         Returns:
-            Formatted context string
+            List of relevant documents for each question
         """
-        context_parts = []
-        for doc in docs:
-            chunk_id = doc.metadata.get("chunk_id", "")
-            page_info = f"Page {doc.metadata.get('page_start', '?')}"
-            section = doc.metadata.get("section_title", "")
-            if section:
-                context_parts.append(f"[Chunk {chunk_id}, {page_info}, Section: {section}]\n{doc.page_content}")
-            else:
-                context_parts.append(f"[Chunk {chunk_id}, {page_info}]\n{doc.page_content}")
+        fetch_k = k * max(1, settings.retrieval_fetch_multiplier)
+        searches = self.vector_store_service.search_batch_with_embeddings(
+            questions, k=fetch_k, filters=filters
+        )
+        with QUERY_STAGE_SECONDS.labels("diversify").time():
+            return [
+                self.diversification_service.diversify(query_embedding, docs, embeddings, k)
+                for docs, embeddings, query_embedding in searches
+            ]
+
+    def _format_context(self, docs: List[Document]) -> Tuple[str, List[Document], ContextUsage]:
+        """
+        Format documents into a context string within the token budget.
         
-        return "\n\n---\n\n".join(context_parts)
+        Args:
+            docs: List of documents in relevance order
+            
+        Returns:
+            Tuple of (context string, documents included, token usage)
+        """
+        with QUERY_STAGE_SECONDS.labels("context_format").time():
+            context, included, usage = self.context_builder.build(docs)
+        CONTEXT_TOKENS.observe(usage.context_tokens)
+        return context, included, usage
 
     def _docs_to_sources(self, docs: List[Document]) -> List[SourceReference]:
         """
@@ -274,17 +563,179 @@ Answer:"""
             for doc in docs
         ]
 
-    def _format_conversation_history(self, history: list) -> str:
-        """Format conversation history for the prompt."""
-        if not history:
-            return ""
+    def _format_conversation_history(self, history: list, conversation_id: Optional[str] = None) -> str:
+        """Format conversation history for the prompt, summarizing older turns."""
+        return self.history_service.format_history(history, conversation_id)
+
+    def _resolve_citation(
+        self,
+        chunk_id: str,
+        quote: str,
+        docs_by_id: Dict[str, Document],
+        search_indexes: Optional[Dict[str, Tuple[SearchIndex, int]]] = None
+    ) -> Optional[SourceReference]:
+        """
+        Locate a cited quote within its retrieved chunk.
+
+        Args:
+            chunk_id: Chunk ID from the citation marker
+            quote: Quoted text from the citation marker
+            docs_by_id: Retrieved documents keyed by chunk ID
+            search_indexes: Indexes loaded up front by _load_search_indexes;
+                missing ones are loaded here
+
+        Returns:
+            SourceReference for the quote, or None if the chunk was not retrieved
+        """
+        doc = docs_by_id.get(chunk_id)
+        if doc is None:
+            # The LLM occasionally shortens IDs; fall back to a substring match
+            doc = next((d for cid, d in docs_by_id.items() if chunk_id and chunk_id in cid), None)
+            if doc is None:
+                return None
+        doc_chunk_id = doc.metadata.get("chunk_id", "")
+
+        if search_indexes is not None and doc_chunk_id in search_indexes:
+            index, offset = search_indexes[doc_chunk_id]
+        else:
+            index, offset = self._get_search_index(doc)
+        span = self.quote_locator.locate(quote, index)
+        if span is not None:
+            return SourceReference(
+                chunk_id=doc_chunk_id,
+                quote_char_start=offset + span[0],
+                quote_char_end=offset + span[1]
+            )
+        # Couldn't find the quote, use beginning of the chunk text shown to the LLM
+        start = doc.metadata.get("content_offset", 0)
+        return SourceReference(
+            chunk_id=doc_chunk_id,
+            quote_char_start=start,
+            quote_char_end=start + min(100, len(doc.page_content))
+        )
+
+    def _get_search_index(self, doc: Document) -> Tuple[SearchIndex, int]:
+        """
+        Get the quote-matching index for a retrieved document.
+
+        Uses the chunk's stored index; when the chunk is missing from chunk
+        storage, the document text is indexed instead.
+
+        Args:
+            doc: Retrieved document
+
+        Returns:
+            Tuple of (search index, offset of the indexed text within the chunk)
+        """
+        index = self.vector_store_service.get_search_index(doc.metadata.get("chunk_id", ""))
+        if index is not None:
+            return index, 0
+        return build_search_index(doc.page_content), doc.metadata.get("content_offset", 0)
+
+    def _load_search_indexes(self, docs: List[Document]) -> Dict[str, Tuple[SearchIndex, int]]:
+        """
+        Load the quote-matching index of every document a citation may refer to.
+
+        Args:
+            docs: Documents included in the prompt
+
+        Returns:
+            Dict of chunk ID to (search index, offset) as returned by _get_search_index
+        """
+        return {doc.metadata.get("chunk_id", ""): self._get_search_index(doc) for doc in docs}
+
+    def _retrieved_chunks(self, docs: List[Document], include_geometry: bool = False) -> List[RetrievedChunk]:
+        """
+        Describe retrieved documents so the client can prefetch their pages.
+
+        Args:
+            docs: Retrieved documents
+            include_geometry: Whether to attach compact atom geometry from chunk storage
+
+        Returns:
+            List of retrieved chunk descriptions
+        """
+        retrieved = []
+        for doc in docs:
+            chunk_id = doc.metadata.get("chunk_id", "")
+            atoms = None
+            if include_geometry:
+                chunk = self.vector_store_service.get_chunk_by_id(chunk_id)
+                if chunk is not None:
+                    # Points rounded to 0.01 keep the payload small
+                    atoms = [
+                        [atom.page_num, round(atom.bbox.x0, 2), round(atom.bbox.y0, 2),
+                         round(atom.bbox.x1, 2), round(atom.bbox.y1, 2), atom.char_start, atom.char_end]
+                        for atom in chunk.atoms
+                    ]
+            retrieved.append(RetrievedChunk(
+                chunk_id=chunk_id,
+                pdf_id=doc.metadata.get("pdf_id", ""),
+                page_start=doc.metadata.get("page_start", 0),
+                page_end=doc.metadata.get("page_end", 0),
+                section_title=doc.metadata.get("section_title") or None,
+                atoms=atoms
+            ))
+        return retrieved
+
+    def _observe_generation(self, started: float, first_token_at: Optional[float], answer: str):
+        """
+        Record time to first token, generation time and generation speed.
+
+        Args:
+            started: perf_counter time the LLM call was made
+            first_token_at: perf_counter time the first token arrived, if any
+            answer: Full generated text
+        """
+        finished = time.perf_counter()
+        QUERY_STAGE_SECONDS.labels("llm_generation").observe(finished - started)
+        if first_token_at is None:
+            return
+        QUERY_STAGE_SECONDS.labels("llm_ttft").observe(first_token_at - started)
+        answer_tokens = self.count_tokens(answer)
+        if self._avg_answer_tokens is None:
+            self._avg_answer_tokens = answer_tokens
+        else:
+            self._avg_answer_tokens = 0.9 * self._avg_answer_tokens + 0.1 * answer_tokens
+        streaming_seconds = finished - first_token_at
+        if streaming_seconds > 0:
+            LLM_TOKENS_PER_SECOND.observe(answer_tokens / streaming_seconds)
+
+    def _observe_cancellation(self, partial_answer: str):
+        """
+        Count an answer cancelled mid-generation and the tokens it saved.
+
+        The saving is estimated as the average answer length minus what had
+        already been generated.
+
+        Args:
+            partial_answer: Text generated before the cancellation
+        """
+        STREAM_CANCELLATIONS.inc()
+        if self._avg_answer_tokens is not None:
+            LLM_TOKENS_SAVED.inc(max(0.0, self._avg_answer_tokens - self.count_tokens(partial_answer)))
 
-        formatted = "Previous conversation:\n"
-        for msg in history:
-            role = "User" if msg.get("role") == "user" else "Assistant"
-            formatted += f"{role}: {msg.get('content', '')}\n"
-        formatted += "\n"
-        return formatted
+    def _observe_prompt_cache(self, usage_metadata: Optional[dict], usage: Optional[ContextUsage] = None):
+        """
+        Record the prompt tokens a provider reported and how many it served from its prompt cache.
+
+        Args:
+            usage_metadata: Token usage of the LLM response, if the provider reported it
+            usage: Context usage of a non-streamed answer, which gets the counts
+        """
+        if not usage_metadata:
+            return
+        prompt_tokens = usage_metadata.get("input_tokens", 0)
+        cached_tokens = (usage_metadata.get("input_token_details") or {}).get("cache_read") or 0
+        LLM_PROMPT_TOKENS.labels("hit").inc(cached_tokens)
+        LLM_PROMPT_TOKENS.labels("miss").inc(max(0, prompt_tokens - cached_tokens))
+        if usage is not None:
+            usage.prompt_tokens = prompt_tokens
+            usage.cached_prompt_tokens = cached_tokens
+
+    def _docs_by_id(self, docs: List[Document]) -> Dict[str, Document]:
+        """Key retrieved documents by chunk ID for citation lookup."""
+        return {doc.metadata.get("chunk_id", ""): doc for doc in docs}
 
     def _parse_citations(self, text: str, docs: List[Document]) -> Tuple[str, List[SourceReference]]:
         """
@@ -297,60 +748,181 @@ Answer:"""
         Returns:
             Tuple of (clean_text, sources)
         """
-        import re
-
+        parser = CitationStreamParser()
+        docs_by_id = self._docs_by_id(docs)
+        clean_parts = []
         sources = []
-        clean_text = text
-
-        # Find all citation markers
-        pattern = r'\[\[CITE:([^\]]+)\]\]([^\[]*)\[\[/CITE\]\]'
-        matches = re.finditer(pattern, text)
-
-        for match in matches:
-            chunk_id = match.group(1).strip()
-            quote = match.group(2).strip()
-
-            # Find the chunk and locate the quote within it
-            for doc in docs:
-                doc_chunk_id = doc.metadata.get("chunk_id", "")
-                if doc_chunk_id == chunk_id or chunk_id in doc_chunk_id:
-                    # Find quote position in chunk text
-                    chunk_text = doc.page_content
-                    quote_lower = quote.lower()
-                    chunk_lower = chunk_text.lower()
-
-                    start_pos = chunk_lower.find(quote_lower[:50] if len(quote_lower) > 50 else quote_lower)
-                    if start_pos >= 0:
-                        end_pos = start_pos + len(quote)
-                        sources.append(SourceReference(
-                            chunk_id=doc_chunk_id,
-                            quote_char_start=start_pos,
-                            quote_char_end=min(end_pos, len(chunk_text))
-                        ))
-                    else:
-                        # Couldn't find exact quote, use beginning of chunk
-                        sources.append(SourceReference(
-                            chunk_id=doc_chunk_id,
-                            quote_char_start=0,
-                            quote_char_end=min(100, len(chunk_text))
-                        ))
-                    break
 
-        # Remove citation markers from text, keeping just the quoted content
-        clean_text = re.sub(r'\[\[CITE:[^\]]+\]\]', '', clean_text)
-        clean_text = re.sub(r'\[\[/CITE\]\]', '', clean_text)
+        with QUERY_STAGE_SECONDS.labels("citation_parse").time():
+            # Remove citation markers from text, keeping just the quoted content
+            for event_type, data in parser.feed(text) + parser.flush():
+                if event_type == "token":
+                    clean_parts.append(data)
+                else:
+                    source = self._resolve_citation(*data, docs_by_id)
+                    if source is not None:
+                        sources.append(source)
 
-        return clean_text, sources
+        return "".join(clean_parts), sources
 
     def stream_answer_question(
-        self, question: str, k: int = 5, conversation_history: list = None
+        self,
+        question: str,
+        k: int = 5,
+        conversation_history: list = None,
+        filters: Optional[RetrievalFilter] = None,
+        conversation_id: Optional[str] = None,
+        include_geometry: bool = False,
+        client_id: Optional[str] = None
     ) -> Generator[Tuple[str, any], None, None]:
         """
         Stream an answer to a question using RAG.
 
+        Events are described in _stream_answer_question. With coalescing on,
+        the answer is produced in a background thread and identical
+        concurrent requests subscribe to it: a request that joins late first
+        receives every event sent so far, then the live ones.
+
+        Args:
+            question: User's question
+            k: Number of chunks to retrieve
+            conversation_history: Previous conversation messages
+            filters: Optional metadata filter restricting the searched chunks
+            conversation_id: Client conversation ID used to cache history summaries
+            include_geometry: Whether the retrieved event carries atom geometry
+            client_id: Client asking, for fair LLM admission
+
+        Yields:
+            Tuples of (event_type, data)
+        """
+        arguments = (question, k, conversation_history, filters, conversation_id, include_geometry, client_id)
+        if not settings.coalesce_queries:
+            yield from self._stream_answer_question(*arguments)
+            return
+
+        def start(stream) -> threading.Thread:
+            producer = threading.Thread(
+                target=stream.run, args=(self._stream_answer_question(*arguments),), daemon=True
+            )
+            producer.start()
+            return producer
+
+        key = self._flight_key("stream", question, k, filters, conversation_history, include_geometry)
+        yield from self.flights.stream(key, start).subscribe()
+
+    async def astream_answer_question(
+        self,
+        question: str,
+        k: int = 5,
+        conversation_history: list = None,
+        filters: Optional[RetrievalFilter] = None,
+        conversation_id: Optional[str] = None,
+        include_geometry: bool = False,
+        client_id: Optional[str] = None,
+        threaded: bool = False
+    ) -> AsyncGenerator[Tuple[str, any], None]:
+        """
+        Stream an answer without blocking the event loop or a worker thread.
+
+        Same events and coalescing as stream_answer_question. The answer is
+        produced by a task on the event loop or, with threaded, by the
+        blocking QA path in a dedicated thread. Either way every request
+        reads its events on the event loop, so one waiting for a popular
+        answer holds no worker thread.
+
+        Args:
+            question: User's question
+            k: Number of chunks to retrieve
+            conversation_history: Previous conversation messages
+            filters: Optional metadata filter restricting the searched chunks
+            conversation_id: Client conversation ID used to cache history summaries
+            include_geometry: Whether the retrieved event carries atom geometry
+            client_id: Client asking, for fair LLM admission
+            threaded: Produce the answer in a thread with the blocking QA path
+
+        Yields:
+            Tuples of (event_type, data)
+        """
+        arguments = (question, k, conversation_history, filters, conversation_id, include_geometry, client_id)
+        if not threaded and not settings.coalesce_queries:
+            async for event in self._astream_answer_question(*arguments):
+                yield event
+            return
+
+        def start(stream) -> asyncio.Task:
+            if threaded:
+                producer = self._produce_in_thread(stream, arguments)
+            else:
+                producer = stream.arun(self._astream_answer_question(*arguments))
+            return asyncio.get_running_loop().create_task(producer)
+
+        if settings.coalesce_queries:
+            # The key includes the corpus version, which may read CURRENT from disk
+            key = await asyncio.to_thread(
+                self._flight_key, "stream", question, k, filters, conversation_history, include_geometry
+            )
+            stream = self.flights.stream(key, start)
+        else:
+            # A stream of its own, so the thread's events are read on the event loop too
+            stream = EventStream()
+            stream.join()
+            stream.on_abandoned = stream.cancel
+            stream.producer = start(stream)
+        async for event in stream.asubscribe():
+            yield event
+
+    async def _produce_in_thread(self, stream: EventStream, arguments: tuple):
+        """
+        Publish a blocking QA stream from a dedicated thread.
+
+        Only the request that starts a stream gets here, so only it takes an
+        LLM slot; requests that join it wait for nothing. The slot is taken
+        on the event loop, so queueing for it holds no thread, and is always
+        released, even if the stream ends before the thread takes it over.
+
+        Args:
+            stream: Stream to publish to
+            arguments: Arguments for _stream_answer_question
+        """
+        client_id = arguments[-1]
+        try:
+            slot = await self.admission.aacquire(client_id)
+        except BaseException as e:
+            stream.close(e)
+            return
+
+        def produce():
+            try:
+                stream.run(self._stream_answer_question(*arguments, slot=slot))
+            finally:
+                slot.release()
+
+        try:
+            threading.Thread(target=produce, daemon=True).start()
+        except BaseException as e:
+            slot.release()
+            stream.close(e)
+
+    def _stream_answer_question(
+        self,
+        question: str,
+        k: int = 5,
+        conversation_history: list = None,
+        filters: Optional[RetrievalFilter] = None,
+        conversation_id: Optional[str] = None,
+        include_geometry: bool = False,
+        client_id: Optional[str] = None,
+        slot: Optional[Slot] = None
+    ) -> Generator[Tuple[str, any], None, None]:
+        """
+        Stream an answer to a question using RAG, without coalescing.
+
         Yields tuples of (event_type, data):
-        - ("sources", List[SourceReference]): Source references (sent after answer completes)
-        - ("token", str): Token/chunk of the answer
+        - ("retrieved", List[RetrievedChunk]): Retrieved chunk locations (sent right after retrieval)
+        - ("usage", ContextUsage): Context token usage (sent before the answer)
+        - ("token", str): Token/chunk of the answer, with citation markers removed
+        - ("citation", SourceReference): A citation, sent as soon as its marker closes
+        - ("sources", List[SourceReference]): All source references (sent after answer completes)
         - ("done", None): Streaming complete
         - ("error", str): Error message
 
@@ -358,63 +930,277 @@ Answer:"""
             question: User's question
             k: Number of chunks to retrieve
             conversation_history: Previous conversation messages
+            filters: Optional metadata filter restricting the searched chunks
+            conversation_id: Client conversation ID used to cache history summaries
+            include_geometry: Whether the retrieved event carries atom geometry
+            client_id: Client asking, for fair LLM admission
+            slot: LLM slot already taken for this request; released when done
 
         Yields:
             Tuples of (event_type, data)
         """
-        # Retrieve relevant chunks
-        relevant_docs = self._retrieve_relevant_docs(question, k)
+        # The slot is taken before retrieval so a rejection is the first thing
+        # a caller sees, before any event is sent
+        with slot or self.admission.acquire(client_id):
+            started = time.perf_counter()
+            # Retrieve relevant chunks
+            relevant_docs = self._retrieve_relevant_docs(question, k, filters)
+            # Let the client start loading PDFs and pages while the LLM generates
+            yield ("retrieved", self._retrieved_chunks(relevant_docs, include_geometry))
 
-        if not relevant_docs:
-            yield ("sources", [])
-            yield ("token", "I cannot answer this question as no relevant information was found in the rulebooks.")
-            yield ("done", None)
-            return
+            if not relevant_docs:
+                yield from self._no_results_events()
+                return
+
+            # Format context and conversation history
+            context, relevant_docs, usage = self._format_context(relevant_docs)
+            yield ("usage", usage)
+            prompt = self._build_streaming_prompt(question, context, conversation_history, conversation_id)
+
+            answer = StreamingAnswer(self, relevant_docs)
+
+            # Stream the LLM response
+            try:
+                prompt_usage = None
+                if hasattr(self.llm, 'stream'):
+                    # Closed explicitly so a cancelled answer drops the provider request at once
+                    with closing(self.llm.stream(prompt)) as chunks:
+                        for chunk in chunks:
+                            prompt_usage = self._add_chunk_usage(prompt_usage, chunk)
+                            yield from answer.feed(self._chunk_content(chunk))
+                else:
+                    # Fallback for LLMs that don't support streaming
+                    if hasattr(self.llm, 'invoke'):
+                        message = self.llm.invoke(prompt)
+                        response = message.content
+                        prompt_usage = getattr(message, "usage_metadata", None)
+                    else:
+                        response = self.llm.predict(prompt)
+                    yield from answer.feed(response)
+                self._observe_prompt_cache(prompt_usage)
+
+                # Send sources after answer completes
+                yield from answer.finish()
+                QUERY_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started)
+                yield ("done", None)
 
-        # Format context and conversation history
-        context = self._format_context(relevant_docs)
-        conv_history = self._format_conversation_history(conversation_history or [])
-        prompt_template = self._create_streaming_prompt_template()
-        prompt = prompt_template.format(
+            except GeneratorExit:
+                # Nobody is reading any more (the client disconnected)
+                answer.cancel()
+                raise
+            except Exception as e:
+                yield ("error", f"Error generating response: {str(e)}")
+
+    async def _astream_answer_question(
+        self,
+        question: str,
+        k: int = 5,
+        conversation_history: list = None,
+        filters: Optional[RetrievalFilter] = None,
+        conversation_id: Optional[str] = None,
+        include_geometry: bool = False,
+        client_id: Optional[str] = None
+    ) -> AsyncGenerator[Tuple[str, any], None]:
+        """
+        Stream an answer on the event loop, without coalescing.
+
+        Same events as _stream_answer_question. Retrieval, context
+        formatting and history summarization run in threads, and the search
+        indexes citations are resolved against are loaded before the LLM is
+        streamed asynchronously.
+
+        Args:
+            question: User's question
+            k: Number of chunks to retrieve
+            conversation_history: Previous conversation messages
+            filters: Optional metadata filter restricting the searched chunks
+            conversation_id: Client conversation ID used to cache history summaries
+            include_geometry: Whether the retrieved event carries atom geometry
+            client_id: Client asking, for fair LLM admission
+
+        Yields:
+            Tuples of (event_type, data)
+        """
+        async with self.admission.aslot(client_id):
+            started = time.perf_counter()
+            relevant_docs = await asyncio.to_thread(self._retrieve_relevant_docs, question, k, filters)
+            yield ("retrieved", await asyncio.to_thread(self._retrieved_chunks, relevant_docs, include_geometry))
+
+            if not relevant_docs:
+                for event in self._no_results_events():
+                    yield event
+                return
+
+            # Token counting and chunk reads stay off the event loop
+            context, relevant_docs, usage = await asyncio.to_thread(self._format_context, relevant_docs)
+            yield ("usage", usage)
+            prompt, search_indexes = await asyncio.gather(
+                asyncio.to_thread(
+                    self._build_streaming_prompt, question, context, conversation_history, conversation_id
+                ),
+                asyncio.to_thread(self._load_search_indexes, relevant_docs)
+            )
+
+            answer = StreamingAnswer(self, relevant_docs, search_indexes)
+
+            try:
+                prompt_usage = None
+                if hasattr(self.llm, 'astream'):
+                    async with aclosing(self.llm.astream(prompt)) as chunks:
+                        async for chunk in chunks:
+                            prompt_usage = self._add_chunk_usage(prompt_usage, chunk)
+                            for event in answer.feed(self._chunk_content(chunk)):
+                                yield event
+                else:
+                    if hasattr(self.llm, 'ainvoke'):
+                        message = await self.llm.ainvoke(prompt)
+                        response = message.content
+                        prompt_usage = getattr(message, "usage_metadata", None)
+                    else:
+                        response = await asyncio.to_thread(self.llm.predict, prompt)
+                    for event in answer.feed(response):
+                        yield event
+                self._observe_prompt_cache(prompt_usage)
+
+                for event in answer.finish():
+                    yield event
+                QUERY_STAGE_SECONDS.labels("total").observe(time.perf_counter() - started)
+                yield ("done", None)
+
+            except (GeneratorExit, asyncio.CancelledError):
+                # Nobody is reading any more (the client disconnected)
+                answer.cancel()
+                raise
+            except Exception as e:
+                yield ("error", f"Error generating response: {str(e)}")
+
+    def _build_streaming_prompt(
+        self,
+        question: str,
+        context: str,
+        conversation_history: Optional[list],
+        conversation_id: Optional[str]
+    ) -> str:
+        """
+        Build the streaming (citation marker) prompt.
+
+        Args:
+            question: User's question
+            context: Formatted context
+            conversation_history: Previous conversation messages
+            conversation_id: Client conversation ID used to cache history summaries
+
+        Returns:
+            Prompt text
+        """
+        conv_history = self._format_conversation_history(conversation_history or [], conversation_id)
+        return self.streaming_prompt.format(
             context=context,
             question=question,
             conversation_history=conv_history
         )
 
-        # Collect full response to parse citations
-        full_response = ""
+    @staticmethod
+    def _no_results_events() -> List[Tuple[str, any]]:
+        """Events answering a question for which nothing was retrieved."""
+        return [("sources", []), ("token", NO_RESULTS_ANSWER), ("done", None)]
 
-        # Stream the LLM response
-        try:
-            if hasattr(self.llm, 'stream'):
-                for chunk in self.llm.stream(prompt):
-                    # Extract content from chunk
-                    if hasattr(chunk, 'content'):
-                        content = chunk.content
-                    else:
-                        content = str(chunk)
+    @staticmethod
+    def _add_chunk_usage(total: Optional[dict], chunk) -> Optional[dict]:
+        """Add the token usage a streamed chunk carries, if any, to the running total."""
+        usage = getattr(chunk, "usage_metadata", None)
+        return add_usage(total, usage) if usage else total
 
-                    if content:
-                        full_response += content
-                        # Stream tokens without citation markers for better UX
-                        # We'll send clean text - remove partial markers
-                        yield ("token", content)
-            else:
-                # Fallback for LLMs that don't support streaming
-                if hasattr(self.llm, 'invoke'):
-                    response = self.llm.invoke(prompt).content
-                else:
-                    response = self.llm.predict(prompt)
-                full_response = response
-                yield ("token", response)
+    @staticmethod
+    def _chunk_content(chunk) -> str:
+        """Extract the text of a streamed LLM chunk."""
+        if hasattr(chunk, 'content'):
+            return chunk.content
+        return str(chunk)
 
-            # Parse citations from the full response
-            clean_text, sources = self._parse_citations(full_response, relevant_docs)
 
-            # Send sources after answer completes
-            yield ("sources", sources if sources else self._docs_to_sources(relevant_docs))
-            yield ("done", None)
+class StreamingAnswer:
+    """
+    Turns streamed LLM output into answer events for one question.
 
-        except Exception as e:
-            yield ("error", f"Error generating response: {str(e)}")
+    Citation markers are stripped as tokens arrive and each citation is
+    resolved as soon as its closing marker is seen.
+    """
+
+    def __init__(
+        self,
+        qa_service: QAService,
+        docs: List[Document],
+        search_indexes: Optional[Dict[str, Tuple[SearchIndex, int]]] = None
+    ):
+        """
+        Initialize the streaming answer.
 
+        Args:
+            qa_service: QA service used to resolve citations
+            docs: Documents included in the prompt
+            search_indexes: Preloaded search indexes of the documents, so
+                citations resolve without reading chunk storage
+        """
+        self.qa_service = qa_service
+        self.docs = docs
+        self.docs_by_id = qa_service._docs_by_id(docs)
+        self.search_indexes = search_indexes
+        self.parser = CitationStreamParser()
+        self.sources: List[SourceReference] = []
+        self._parts: List[str] = []
+        self._started = time.perf_counter()
+        self._first_token_at: Optional[float] = None
+        self._parse_seconds = 0.0
+        self._finished = False
+
+    def feed(self, content: str) -> List[Tuple[str, any]]:
+        """
+        Consume a piece of LLM output.
+
+        Args:
+            content: Streamed text
+
+        Returns:
+            ("token", text) and ("citation", SourceReference) events
+        """
+        if not content:
+            return []
+        if self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+        self._parts.append(content)
+        return self._handle(self.parser.feed, content)
+
+    def finish(self) -> List[Tuple[str, any]]:
+        """
+        Flush the parser, record generation metrics and emit the sources.
+
+        Returns:
+            Remaining token and citation events followed by the sources event
+        """
+        self._finished = True
+        events = self._handle(self.parser.flush)
+        self.qa_service._observe_generation(self._started, self._first_token_at, "".join(self._parts))
+        QUERY_STAGE_SECONDS.labels("citation_parse").observe(self._parse_seconds)
+        events.append(("sources", self.sources if self.sources else self.qa_service._docs_to_sources(self.docs)))
+        return events
+
+    def cancel(self):
+        """Record that the answer was abandoned, unless it had already finished."""
+        if not self._finished:
+            self.qa_service._observe_cancellation("".join(self._parts))
+
+    def _handle(self, step, *args) -> List[Tuple[str, any]]:
+        """Run a parser step and resolve the citations it completes."""
+        parse_started = time.perf_counter()
+        events = []
+        for event_type, data in step(*args):
+            if event_type == "token":
+                events.append(("token", data))
+            else:
+                source = self.qa_service._resolve_citation(*data, self.docs_by_id, self.search_indexes)
+                if source is not None:
+                    self.sources.append(source)
+                    events.append(("citation", source))
+        self._parse_seconds += time.perf_counter() - parse_started
+        return events
@@ -0,0 +1,101 @@
+"""Fast approximate location of quoted text within chunks."""
+from difflib import SequenceMatcher
+from typing import Optional, Tuple
+from app.models.chunk import SearchIndex
+from app.utils.text_utils import compress_offsets, map_offset, normalize_for_matching
+
+
+# Surrounding punctuation the LLM often adds to quotes
+QUOTE_STRIP_CHARS = " \"'.,;:-"
+
+
+def build_search_index(text: str) -> SearchIndex:
+    """
+    Build the normalized search index for a chunk's text.
+
+    Args:
+        text: Chunk text
+
+    Returns:
+        SearchIndex with the normalized text and its offset map
+    """
+    normalized, offsets = normalize_for_matching(text)
+    return SearchIndex(normalized_text=normalized, offset_breaks=compress_offsets(offsets))
+
+
+class QuoteLocator:
+    """Locates quotes in chunk text via the chunk's normalized search index."""
+
+    def __init__(self, anchor_length: int = 24, min_match_length: int = 12):
+        """
+        Initialize the quote locator.
+
+        Args:
+            anchor_length: Length of the quote fragments searched for exactly
+                when the whole quote does not match
+            min_match_length: Shortest common run accepted by the last-resort
+                longest-match search
+        """
+        self.anchor_length = anchor_length
+        self.min_match_length = min_match_length
+
+    def locate(self, quote: str, index: SearchIndex) -> Optional[Tuple[int, int]]:
+        """
+        Find a quote in the indexed chunk.
+
+        Tries an exact match on the normalized text, then anchors on exact
+        fragments of the quote (head, tail, then interior), then the longest
+        common run of characters.
+
+        Args:
+            quote: Quoted text as written by the LLM
+            index: Search index of the chunk
+
+        Returns:
+            (start, end) character offsets in the original chunk text, or None
+        """
+        text = index.normalized_text
+        needle, _ = normalize_for_matching(quote)
+        needle = needle.strip(QUOTE_STRIP_CHARS)
+        if not needle or not text:
+            return None
+
+        span = self._find_span(text, needle)
+        if span is None:
+            return None
+        start, end = max(0, span[0]), min(len(text), span[1])
+        if end <= start:
+            return None
+        return (
+            map_offset(index.offset_breaks, start),
+            map_offset(index.offset_breaks, end - 1) + 1
+        )
+
+    def _find_span(self, text: str, needle: str) -> Optional[Tuple[int, int]]:
+        """Locate needle in text, returning a normalized-text span."""
+        pos = text.find(needle)
+        if pos >= 0:
+            return pos, pos + len(needle)
+
+        length = min(self.anchor_length, len(needle))
+        head = text.find(needle[:length])
+        tail = text.find(needle[-length:], max(head, 0))
+        if head >= 0 and tail >= 0 and tail + length - head <= 2 * len(needle):
+            return head, tail + length
+        if head >= 0:
+            return head, head + len(needle)
+        if tail >= 0:
+            return tail + length - len(needle), tail + length
+
+        # Interior fragments survive edits at both ends of the quote
+        for offset in range(length, len(needle) - length, length):
+            pos = text.find(needle[offset:offset + length])
+            if pos >= 0:
+                return pos - offset, pos - offset + len(needle)
+
+        matcher = SequenceMatcher(None, text, needle, autojunk=False)
+        match = matcher.find_longest_match(0, len(text), 0, len(needle))
+        if match.size >= min(self.min_match_length, len(needle)):
+            start = match.a - match.b
+            return start, start + len(needle)
+        return None
@@ -0,0 +1,250 @@
+"""Single-flight coalescing of identical concurrent requests."""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+from app.utils.metrics import COALESCED_REQUESTS
+
+
+class EventStream:
+    """
+    Events of one in-flight stream, buffered and replayed to every subscriber.
+
+    A producer publishes events; each subscriber receives everything
+    published so far and then live events until the stream closes. An
+    exception raised by the producer is re-raised in every subscriber after
+    the events published before it. When the last subscriber stops reading
+    before the stream is complete, on_abandoned is called.
+    """
+
+    def __init__(self):
+        self._events: List[Any] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        # Async subscribers waiting for the next event: (loop, event to set)
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self._on_close: List[Callable[[], None]] = []
+        # Subscribers that have joined and not yet stopped reading
+        self._subscribers = 0
+        self._cancelled = False
+        self.on_abandoned: Optional[Callable[[], None]] = None
+        # Thread or task running the producer
+        self.producer = None
+
+    def publish(self, event: Any):
+        """Append an event and wake the subscribers."""
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+
+    def close(self, error: Optional[BaseException] = None):
+        """
+        Mark the stream complete.
+
+        Args:
+            error: Exception that ended the producer, if any
+        """
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+            waiters, self._waiters = self._waiters, []
+        self._wake(waiters)
+        for callback in self._on_close:
+            callback()
+
+    @staticmethod
+    def _wake(waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]):
+        """Wake async subscribers from whichever thread published."""
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The subscriber's loop has closed
+                pass
+
+    def run(self, events: Iterator[Any]):
+        """Publish every event of a generator, then close; stops early if cancelled."""
+        try:
+            for event in events:
+                if self._cancelled:
+                    # Closing the generator stops the work behind it
+                    events.close()
+                    break
+                self.publish(event)
+        except BaseException as e:
+            self.close(e)
+            return
+        self.close()
+
+    async def arun(self, events: AsyncIterator[Any]):
+        """Publish every event of an async generator, then close; stops early if cancelled."""
+        try:
+            async for event in events:
+                if self._cancelled:
+                    await events.aclose()
+                    break
+                self.publish(event)
+        except BaseException as e:
+            self.close(e)
+            return
+        self.close()
+
+    def cancel(self):
+        """Stop the producer: a task is cancelled, a thread stops at its next event."""
+        self._cancelled = True
+        if isinstance(self.producer, asyncio.Task):
+            self.producer.get_loop().call_soon_threadsafe(self.producer.cancel)
+
+    def join(self):
+        """Count a new subscriber; call before subscribing."""
+        with self._cond:
+            self._subscribers += 1
+
+    def _leave(self):
+        """A subscriber stopped reading; report the stream abandoned if it was the last."""
+        with self._cond:
+            self._subscribers -= 1
+            abandoned = self._subscribers <= 0 and not self._done
+        if abandoned and self.on_abandoned is not None:
+            self.on_abandoned()
+
+    @property
+    def abandoned(self) -> bool:
+        """Whether the stream is incomplete and nobody is reading it."""
+        with self._cond:
+            return self._subscribers <= 0 and not self._done
+
+    def subscribe(self) -> Iterator[Any]:
+        """Iterate over all events, blocking until new ones are published."""
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self._events) and not self._done:
+                        self._cond.wait()
+                    batch = self._events[index:]
+                    done = self._done
+                index += len(batch)
+                yield from batch
+                if done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+        finally:
+            self._leave()
+
+    async def asubscribe(self) -> AsyncIterator[Any]:
+        """Iterate over all events without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        index = 0
+        try:
+            while True:
+                wake = asyncio.Event()
+                with self._cond:
+                    batch = self._events[index:]
+                    done = self._done
+                    if not batch and not done:
+                        self._waiters.append((loop, wake))
+                if batch:
+                    index += len(batch)
+                    for event in batch:
+                        yield event
+                    continue
+                if done:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                await wake.wait()
+        finally:
+            self._leave()
+
+
+class SingleFlight:
+    """
+    Runs identical concurrent requests once and shares the outcome.
+
+    Requests are identified by a hashable key. A key is only shared while its
+    call or stream is in flight; nothing is cached after it completes. A
+    stream that every subscriber has stopped reading is cancelled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._streams: Dict[Hashable, EventStream] = {}
+
+    def call(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn, or wait for the identical call already running.
+
+        Args:
+            key: Request key
+            fn: Work to run if no identical call is in flight
+
+        Returns:
+            Result of fn (the leader's result for followers)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            COALESCED_REQUESTS.labels("answer").inc()
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key: Hashable, start: Callable[[EventStream], Any]) -> EventStream:
+        """
+        Join the identical stream in flight, or start one.
+
+        Args:
+            key: Request key
+            start: Starts a producer for a new stream and returns its thread or task
+
+        Returns:
+            Event stream to subscribe to (the caller is counted as a subscriber)
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is not None:
+                stream.join()
+                COALESCED_REQUESTS.labels("stream").inc()
+                return stream
+            stream = EventStream()
+            stream.join()
+            self._streams[key] = stream
+        stream._on_close.append(lambda: self._forget_stream(key, stream))
+        stream.on_abandoned = lambda: self._abandon_stream(key, stream)
+        stream.producer = start(stream)
+        return stream
+
+    def _abandon_stream(self, key: Hashable, stream: EventStream):
+        """Cancel a stream nobody is reading, unless a new subscriber joined meanwhile."""
+        with self._lock:
+            if not stream.abandoned:
+                return
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+        stream.cancel()
+
+    def _forget_stream(self, key: Hashable, stream: EventStream):
+        """Stop offering a finished stream to new requests."""
+        with self._lock:
+            if self._streams.get(key) is stream:
+                del self._streams[key]
@@ -1,21 +1,49 @@
 """Vector store service using LangChain and Chroma."""
-from typing import List, Optional
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 try:
     from langchain.docstore.document import Document
 except ImportError:
     from langchain_core.documents import Document
-try:
-    from langchain.vectorstores import Chroma
-except ImportError:
-    from langchain_community.vectorstores import Chroma
 try:
     from langchain.retrievers import VectorStoreRetriever
 except ImportError:
     from langchain_core.retrievers import BaseRetriever as VectorStoreRetriever
 from app.config import settings
-from app.models.chunk import Chunk
+from app.models.chunk import Chunk, RetrievalFilter, SearchIndex
 from app.services.embeddings import EmbeddingService
-from app.services.chunk_storage import ChunkStorageService
+from app.services.chunk_storage import ChunkStorageService, ReadOnlyStorageError
+from app.services.write_session import WriteSession, recover_write_session
+from app.utils.metrics import INGEST_STAGE_SECONDS, QUERY_STAGE_SECONDS, record_cache_lookup
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import Chroma
+
+
+def _load_chroma() -> type:
+    """Import the Chroma wrapper (and chromadb) on first use."""
+    try:
+        from langchain.vectorstores import Chroma
+    except ImportError:
+        from langchain_community.vectorstores import Chroma
+    return Chroma
+
+
+def _forget_chroma_system(persist_dir: str):
+    """
+    Drop chromadb's per-process system for a directory.
+    
+    chromadb shares one system per persist directory within a process and
+    keeps the index it loaded at startup, so writes from another process
+    only become visible once the next client builds a fresh system.
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        from chromadb.api.client import SharedSystemClient
+    # The old system is not stopped: in-flight queries may still hold it
+    SharedSystemClient._identifier_to_system.pop(persist_dir, None)
+    SharedSystemClient._identifier_to_refcount.pop(persist_dir, None)
 
 
 class VectorStoreService:
@@ -30,12 +58,20 @@ class VectorStoreService:
         """
         self.collection_name = collection_name
         self.embedding_service = EmbeddingService()
-        self.vector_store: Optional[Chroma] = None
+        self.vector_store: Optional["Chroma"] = None
         self.chunk_storage = ChunkStorageService()
+        self.read_only = self.chunk_storage.read_only
+        # Distinct section titles in the collection, used to expand prefix filters
+        self._section_titles: Optional[List[str]] = None
+        # One write session at a time per process
+        self._write_lock = threading.Lock()
         self._initialize_vector_store()
+        if not self.read_only:
+            recover_write_session(self)
 
     def _initialize_vector_store(self):
         """Initialize or load the Chroma vector store."""
+        Chroma = _load_chroma()
         try:
             # Try to load existing collection
             self.vector_store = Chroma(
@@ -51,6 +87,34 @@ class VectorStoreService:
                 embedding_function=self.embedding_service.embeddings
             )
 
+    def refresh(self) -> bool:
+        """
+        Pick up a newly published corpus version.
+        
+        Checks the chunk storage for a new version (at most once per
+        version_check_interval_s) and, when there is one, reopens the Chroma
+        collection so searches see the new vectors.
+        
+        Returns:
+            True if a new version was loaded
+        """
+        if not self.chunk_storage.refresh():
+            return False
+        _forget_chroma_system(settings.chroma_persist_dir)
+        self._initialize_vector_store()
+        self.invalidate_section_titles()
+        return True
+
+    def corpus_version(self) -> int:
+        """
+        Corpus version searches are served from, after checking for a newer one.
+        
+        Returns:
+            Published version (0 before the first publish)
+        """
+        self.refresh()
+        return self.chunk_storage.version
+
     def add_chunks(self, chunks: List[Chunk]):
         """
         Add chunks to the vector store.
@@ -58,87 +122,287 @@ class VectorStoreService:
         Args:
             chunks: List of Chunk objects to add
         """
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for chunk in chunks:
-            # Create LangChain Document
-            doc = Document(
-                page_content=chunk.text,
-                metadata={
-                    "chunk_id": chunk.chunk_id,
-                    "pdf_id": chunk.pdf_id,
-                    "page_start": chunk.page_start,
-                    "page_end": chunk.page_end,
-                    "section_title": chunk.section_title or ""
-                }
-            )
-            documents.append(doc)
-            metadatas.append(doc.metadata)
-            ids.append(chunk.chunk_id)
+        embeddings = self.embed_chunks(chunks)
+        self.store_chunks(chunks, embeddings)
+
+    def embed_chunks(self, chunks: List[Chunk]) -> List[List[float]]:
+        """
+        Embed chunk texts for storage.
         
-        # Store full chunks with atoms separately
-        self.chunk_storage.save_chunks(chunks)
+        Args:
+            chunks: Chunks to embed
+            
+        Returns:
+            One embedding per chunk
+        """
+        with INGEST_STAGE_SECONDS.labels("embed").time():
+            return self.embedding_service.embed_texts([chunk.text for chunk in chunks])
+
+    def store_chunks(self, chunks: List[Chunk], embeddings: List[List[float]]):
+        """
+        Write embedded chunks to chunk storage and the vector store in one write session.
         
-        # Add to vector store
+        Args:
+            chunks: Chunks to store
+            embeddings: Embeddings from embed_chunks, in the same order
+            
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
+        """
+        with self.write_session() as session:
+            session.add(chunks, embeddings)
+
+    def write_session(self, batch_size: Optional[int] = None) -> WriteSession:
+        """
+        Start a write session that buffers chunks and commits them as one version.
+        
+        Args:
+            batch_size: Chunks buffered before a flush (defaults to write_batch_size)
+            
+        Returns:
+            WriteSession to use as a context manager
+            
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
+        """
+        if self.read_only:
+            raise ReadOnlyStorageError("Vector store is read-only on this worker")
+        return WriteSession(self, batch_size)
+
+    def collection_for_write(self):
+        """
+        Get the underlying Chroma collection for writes.
+        
+        Raises:
+            ReadOnlyStorageError: On a read-only worker
+        """
+        if self.read_only:
+            raise ReadOnlyStorageError("Vector store is read-only on this worker")
         if self.vector_store is None:
             self._initialize_vector_store()
+        return self.vector_store._collection
+
+    @staticmethod
+    def chunk_metadata(chunk: Chunk) -> dict:
+        """Metadata stored with a chunk's vector."""
+        return {
+            "chunk_id": chunk.chunk_id,
+            "pdf_id": chunk.pdf_id,
+            "page_start": chunk.page_start,
+            "page_end": chunk.page_end,
+            "section_title": chunk.section_title or ""
+        }
+
+    def invalidate_section_titles(self):
+        """Forget the cached section titles after the collection changed."""
+        self._section_titles = None
+
+    def _get_section_titles(self) -> List[str]:
+        """Get the distinct section titles stored in the collection (cached)."""
+        record_cache_lookup("section_titles", self._section_titles is not None)
+        if self._section_titles is None:
+            if self.vector_store is None:
+                self._initialize_vector_store()
+            result = self.vector_store.get(include=["metadatas"])
+            titles = {
+                metadata.get("section_title", "")
+                for metadata in result.get("metadatas") or []
+                if metadata
+            }
+            titles.discard("")
+            self._section_titles = sorted(titles)
+        return self._section_titles
+
+    def build_where_filter(self, filters: Optional[RetrievalFilter]) -> Optional[dict]:
+        """
+        Translate a retrieval filter into a Chroma metadata ``where`` clause.
         
-        self.vector_store.add_documents(
-            documents=documents,
-            ids=ids
-        )
+        Args:
+            filters: Retrieval filter, or None for an unfiltered search
+            
+        Returns:
+            Chroma ``where`` dict, or None if the filter has no constraints
+        """
+        if filters is None or filters.is_empty():
+            return None
         
-        # Persist to disk
-        self.vector_store.persist()
+        clauses = []
+        if filters.pdf_ids:
+            clauses.append({"pdf_id": {"$in": list(filters.pdf_ids)}})
+        # A chunk matches a page range if any of its pages overlap the range
+        if filters.page_max is not None:
+            clauses.append({"page_start": {"$lte": filters.page_max}})
+        if filters.page_min is not None:
+            clauses.append({"page_end": {"$gte": filters.page_min}})
+        if filters.section_prefix:
+            # Chroma has no prefix operator for metadata, so expand the prefix
+            # into the exact titles it matches
+            prefix = filters.section_prefix.lower()
+            titles = [t for t in self._get_section_titles() if t.lower().startswith(prefix)]
+            if titles:
+                clauses.append({"section_title": {"$in": titles}})
+            else:
+                # No stored title starts with the prefix, so neither does the
+                # prefix itself: an equality clause on it matches nothing
+                clauses.append({"section_title": {"$eq": filters.section_prefix}})
+        
+        if len(clauses) == 1:
+            return clauses[0]
+        return {"$and": clauses}
 
-    def get_retriever(self, k: int = 5) -> VectorStoreRetriever:
+    def get_retriever(self, k: int = 5, filters: Optional[RetrievalFilter] = None) -> VectorStoreRetriever:
         """
         Get a retriever for searching the vector store.
         
         Args:
             k: Number of documents to retrieve
+            filters: Optional metadata filter applied to the search
             
         Returns:
             VectorStoreRetriever instance
         """
+        self.refresh()
         if self.vector_store is None:
             self._initialize_vector_store()
         
-        return self.vector_store.as_retriever(search_kwargs={"k": k})
+        search_kwargs = {"k": k}
+        where = self.build_where_filter(filters)
+        if where is not None:
+            search_kwargs["filter"] = where
+        
+        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
 
-    def search(self, query: str, k: int = 5) -> List[Document]:
+    def search(self, query: str, k: int = 5, filters: Optional[RetrievalFilter] = None) -> List[Document]:
         """
         Search the vector store for similar documents.
         
         Args:
             query: Search query text
             k: Number of results to return
+            filters: Optional metadata filter applied to the search
             
         Returns:
             List of Document objects
         """
+        self.refresh()
         if self.vector_store is None:
             self._initialize_vector_store()
         
-        return self.vector_store.similarity_search(query, k=k)
+        return self.vector_store.similarity_search(query, k=k, filter=self.build_where_filter(filters))
 
-    def search_with_scores(self, query: str, k: int = 5) -> List[tuple]:
+    def search_with_scores(
+        self, query: str, k: int = 5, filters: Optional[RetrievalFilter] = None
+    ) -> List[tuple]:
         """
         Search the vector store with similarity scores.
         
         Args:
             query: Search query text
             k: Number of results to return
+            filters: Optional metadata filter applied to the search
             
         Returns:
             List of (Document, score) tuples
         """
+        self.refresh()
+        if self.vector_store is None:
+            self._initialize_vector_store()
+        
+        return self.vector_store.similarity_search_with_score(
+            query, k=k, filter=self.build_where_filter(filters)
+        )
+
+    def search_with_embeddings(
+        self, query: str, k: int = 5, filters: Optional[RetrievalFilter] = None
+    ) -> Tuple[List[Document], List[List[float]], List[float]]:
+        """
+        Search the vector store and return the stored embeddings of the hits.
+        
+        Args:
+            query: Search query text
+            k: Number of results to return
+            filters: Optional metadata filter applied to the search
+            
+        Returns:
+            Tuple of (documents, document embeddings, query embedding)
+        """
+        with QUERY_STAGE_SECONDS.labels("embed_query").time():
+            query_embedding = self.embedding_service.embed_text(query)
+        return self._query_by_embeddings([query_embedding], k, filters)[0]
+
+    def search_batch_with_embeddings(
+        self, queries: List[str], k: int = 5, filters: Optional[RetrievalFilter] = None
+    ) -> List[Tuple[List[Document], List[List[float]], List[float]]]:
+        """
+        Search for many queries with one embedding call and one collection query.
+        
+        Args:
+            queries: Search query texts
+            k: Number of results to return per query
+            filters: Optional metadata filter applied to every search
+            
+        Returns:
+            One (documents, document embeddings, query embedding) tuple per query
+        """
+        if not queries:
+            return []
+        with QUERY_STAGE_SECONDS.labels("embed_query").time():
+            query_embeddings = self.embedding_service.embed_queries(queries)
+        return self._query_by_embeddings(query_embeddings, k, filters)
+
+    def _query_by_embeddings(
+        self,
+        query_embeddings: List[List[float]],
+        k: int,
+        filters: Optional[RetrievalFilter]
+    ) -> List[Tuple[List[Document], List[List[float]], List[float]]]:
+        """
+        Run a nearest-neighbour query for each embedding in a single call.
+        
+        Args:
+            query_embeddings: Query embedding vectors
+            k: Number of results to return per query
+            filters: Optional metadata filter applied to every search
+            
+        Returns:
+            One (documents, document embeddings, query embedding) tuple per query
+        """
+        self.refresh()
         if self.vector_store is None:
             self._initialize_vector_store()
         
-        return self.vector_store.similarity_search_with_score(query, k=k)
+        query_kwargs = {}
+        where = self.build_where_filter(filters)
+        if where is not None:
+            query_kwargs["where"] = where
+        
+        # Query the underlying collection directly: the LangChain wrapper does
+        # not return embeddings alongside documents
+        with QUERY_STAGE_SECONDS.labels("vector_search").time():
+            results = self.vector_store._collection.query(
+                query_embeddings=[list(embedding) for embedding in query_embeddings],
+                n_results=k,
+                include=["documents", "metadatas", "embeddings"],
+                **query_kwargs
+            )
+        
+        all_texts = results.get("documents") or []
+        all_metadatas = results.get("metadatas") or []
+        all_embeddings = results.get("embeddings")
+        if all_embeddings is None:
+            all_embeddings = []
+        
+        searches = []
+        for i, query_embedding in enumerate(query_embeddings):
+            texts = all_texts[i] if i < len(all_texts) else []
+            metadatas = all_metadatas[i] if i < len(all_metadatas) else []
+            embeddings = all_embeddings[i] if i < len(all_embeddings) else []
+            documents = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(texts, metadatas)
+            ]
+            searches.append((documents, list(embeddings), query_embedding))
+        return searches
 
     def get_chunk_by_id(self, chunk_id: str) -> Optional[Chunk]:
         """
@@ -150,5 +414,31 @@ class VectorStoreService:
         Returns:
             Chunk if found, None otherwise
         """
+        self.refresh()
         return self.chunk_storage.get_chunk(chunk_id)
 
+    def get_search_index(self, chunk_id: str) -> Optional[SearchIndex]:
+        """
+        Retrieve the quote-matching index of a chunk.
+        
+        Args:
+            chunk_id: Chunk ID
+            
+        Returns:
+            SearchIndex if the chunk was found, None otherwise
+        """
+        self.refresh()
+        return self.chunk_storage.get_search_index(chunk_id)
+
+    def get_chunks_by_ids(self, chunk_ids: List[str]) -> Dict[str, Chunk]:
+        """
+        Retrieve several chunks by ID with full details including atoms.
+        
+        Args:
+            chunk_ids: Chunk IDs to retrieve
+            
+        Returns:
+            Dict of chunk ID to Chunk for the IDs that were found
+        """
+        self.refresh()
+        return self.chunk_storage.get_chunks(chunk_ids)
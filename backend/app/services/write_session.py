@@ -0,0 +1,242 @@
+"""Buffered, journaled writes to the chunk store and the vector store."""
+import logging
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional
+from app.config import settings
+from app.models.chunk import Chunk
+from app.utils.metrics import INGEST_STAGE_SECONDS
+from app.utils.serialization import dumps, loads
+
+if TYPE_CHECKING:
+    from app.services.vector_store import VectorStoreService
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = "write_session.journal"
+
+
+def journal_path() -> Path:
+    """Location of the write-session journal."""
+    return Path(settings.chroma_persist_dir) / JOURNAL_FILE
+
+
+class WriteSession:
+    """
+    Write chunks and their embeddings to both stores as one transaction.
+
+    Added chunks are buffered and flushed in batches of write_batch_size:
+    one chunk-store write and one Chroma upsert per batch. Before each batch
+    is written, the IDs it touches and their previous contents are appended
+    to a journal. Commit publishes a new corpus version (the CURRENT pointer
+    of the chunk packs is the version marker) and then removes the journal;
+    on error, or at the next startup after a crash, the journaled batches are
+    undone.
+
+    Use as a context manager: leaving the block commits, an exception rolls
+    back.
+    """
+
+    def __init__(self, vector_store: "VectorStoreService", batch_size: Optional[int] = None):
+        """
+        Initialize a write session.
+
+        Args:
+            vector_store: Vector store service whose stores are written
+            batch_size: Chunks buffered before a flush (defaults to write_batch_size)
+        """
+        self.vector_store = vector_store
+        self.batch_size = batch_size or settings.write_batch_size
+        self._chunks: List[Chunk] = []
+        self._embeddings: List[List[float]] = []
+        self._batches: List[dict] = []
+        self._journal = None
+        self._base_version = 0
+
+    def __enter__(self) -> "WriteSession":
+        self.vector_store._write_lock.acquire()
+        self._base_version = self.vector_store.chunk_storage.packs.current_version()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            self.vector_store._write_lock.release()
+
+    def add(self, chunks: List[Chunk], embeddings: List[List[float]]):
+        """
+        Buffer chunks for writing, flushing whenever a full batch is buffered.
+
+        Args:
+            chunks: Chunks to store
+            embeddings: Embeddings from embed_chunks, in the same order
+        """
+        self._chunks.extend(chunks)
+        self._embeddings.extend(embeddings)
+        while len(self._chunks) >= self.batch_size:
+            self._flush(self.batch_size)
+
+    def flush(self):
+        """Write everything buffered so far."""
+        while self._chunks:
+            self._flush(len(self._chunks))
+
+    def _flush(self, count: int):
+        """Journal and write the first `count` buffered chunks."""
+        chunks, self._chunks = self._chunks[:count], self._chunks[count:]
+        embeddings, self._embeddings = self._embeddings[:count], self._embeddings[count:]
+        chunk_ids = [chunk.chunk_id for chunk in chunks]
+        collection = self.vector_store.collection_for_write()
+
+        batch = {"ids": chunk_ids, "previous": self._previous_contents(collection, chunk_ids)}
+        self._append_journal(batch)
+        self._batches.append(batch)
+
+        with INGEST_STAGE_SECONDS.labels("store").time():
+            # Store full chunks with atoms separately
+            self.vector_store.chunk_storage.save_chunks(chunks)
+            collection.upsert(
+                ids=chunk_ids,
+                embeddings=[list(embedding) for embedding in embeddings],
+                metadatas=[self.vector_store.chunk_metadata(chunk) for chunk in chunks],
+                documents=[chunk.text for chunk in chunks]
+            )
+
+    def _previous_contents(self, collection, chunk_ids: List[str]) -> Dict[str, dict]:
+        """Contents of chunks that already exist, so a rollback can restore them."""
+        existing = collection.get(ids=chunk_ids, include=["embeddings", "metadatas", "documents"])
+        embeddings = existing.get("embeddings")
+        if embeddings is None:
+            embeddings = []
+        previous: Dict[str, dict] = {
+            chunk_id: {
+                "embedding": [float(value) for value in embedding],
+                "metadata": metadata,
+                "document": document
+            }
+            for chunk_id, embedding, metadata, document in zip(
+                existing.get("ids") or [], embeddings,
+                existing.get("metadatas") or [], existing.get("documents") or []
+            )
+        }
+        for chunk_id, content in self.vector_store.chunk_storage.snapshot(chunk_ids).items():
+            if content is not None:
+                previous.setdefault(chunk_id, {})["chunk"] = content
+        return previous
+
+    def _append_journal(self, batch: dict):
+        """Durably append a batch to the journal, starting it if needed."""
+        if self._journal is None:
+            path = journal_path()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = open(path, "wb")
+            self._write_journal_line({"base_version": self._base_version, "started_at": time.time()})
+        self._write_journal_line(batch)
+
+    def _write_journal_line(self, entry: dict):
+        """Write one journal line and fsync it."""
+        self._journal.write(dumps(entry) + b"\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    def _close_journal(self):
+        """Close and remove the journal."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+            journal_path().unlink(missing_ok=True)
+
+    def commit(self) -> int:
+        """
+        Flush and publish everything written in this session as a new version.
+
+        Returns:
+            The published version (unchanged if nothing was written)
+        """
+        self.flush()
+        if not self._batches:
+            return self.vector_store.chunk_storage.version
+        with INGEST_STAGE_SECONDS.labels("publish").time():
+            version = self.vector_store.chunk_storage.publish()
+        self._batches = []
+        self._close_journal()
+        self.vector_store.invalidate_section_titles()
+        return version
+
+    def rollback(self):
+        """Discard buffered chunks and undo the batches already written."""
+        self._chunks, self._embeddings = [], []
+        if self._batches:
+            undo_batches(self.vector_store, self._batches)
+            self._batches = []
+        self._close_journal()
+
+
+def undo_batches(vector_store: "VectorStoreService", batches: List[dict]):
+    """
+    Undo journaled batches, newest first.
+
+    Args:
+        vector_store: Vector store service whose stores were written
+        batches: Journal batch entries ({"ids", "previous"})
+    """
+    collection = vector_store.collection_for_write()
+    for batch in reversed(batches):
+        previous = batch["previous"]
+        added = [chunk_id for chunk_id in batch["ids"] if "embedding" not in previous.get(chunk_id, {})]
+        if added:
+            collection.delete(ids=added)
+        replaced = [chunk_id for chunk_id in batch["ids"] if "embedding" in previous.get(chunk_id, {})]
+        if replaced:
+            collection.upsert(
+                ids=replaced,
+                embeddings=[previous[chunk_id]["embedding"] for chunk_id in replaced],
+                metadatas=[previous[chunk_id]["metadata"] for chunk_id in replaced],
+                documents=[previous[chunk_id]["document"] for chunk_id in replaced]
+            )
+        vector_store.chunk_storage.restore({
+            chunk_id: previous.get(chunk_id, {}).get("chunk") for chunk_id in batch["ids"]
+        })
+    vector_store.invalidate_section_titles()
+
+
+def recover_write_session(vector_store: "VectorStoreService") -> Optional[str]:
+    """
+    Finish a write session left behind by a crash.
+
+    A session whose version was published is complete and only its journal
+    is removed; otherwise its journaled batches are rolled back.
+
+    Args:
+        vector_store: Vector store service whose stores were written
+
+    Returns:
+        "committed" or "rolled_back" if a journal was found, None otherwise
+    """
+    path = journal_path()
+    if not path.exists():
+        return None
+
+    entries = []
+    for line in path.read_bytes().splitlines():
+        try:
+            entries.append(loads(line))
+        except ValueError:
+            # Torn final line: that batch was never written to the stores
+            break
+
+    outcome = "rolled_back"
+    if entries and vector_store.chunk_storage.packs.current_version() > entries[0]["base_version"]:
+        outcome = "committed"
+    else:
+        batches = entries[1:]
+        logger.warning("Rolling back an interrupted write session (%d batches)", len(batches))
+        undo_batches(vector_store, batches)
+    path.unlink()
+    return outcome
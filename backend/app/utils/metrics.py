@@ -0,0 +1,127 @@
+"""Prometheus metrics for the query and ingestion pipelines."""
+from prometheus_client import Counter, Gauge, Histogram
+
+
+# Stage latencies span sub-millisecond parsing to multi-second generation
+STAGE_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+QUERY_STAGE_SECONDS = Histogram(
+    "catan_query_stage_seconds",
+    "Time spent in each stage of answering a question",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+INGEST_STAGE_SECONDS = Histogram(
+    "catan_ingest_stage_seconds",
+    "Time spent in each stage of ingesting a PDF",
+    ["stage"],
+    buckets=STAGE_BUCKETS + (120.0, 300.0)
+)
+
+LLM_TOKENS_PER_SECOND = Histogram(
+    "catan_llm_tokens_per_second",
+    "Generation speed of streamed answers after the first token",
+    buckets=(5, 10, 20, 40, 60, 80, 120, 160, 240, 320)
+)
+
+CONTEXT_TOKENS = Histogram(
+    "catan_context_tokens",
+    "Tokens of retrieved context placed in each prompt",
+    buckets=(100, 250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+
+STREAM_FRAMES = Histogram(
+    "catan_stream_token_frames",
+    "SSE token frames sent per streamed answer",
+    buckets=(1, 5, 10, 20, 50, 100, 200, 500, 1000)
+)
+
+CACHE_REQUESTS = Counter(
+    "catan_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+
+LLM_QUEUE_DEPTH = Gauge(
+    "catan_llm_queue_depth",
+    "Requests waiting for an LLM slot"
+)
+
+LLM_ACTIVE_CALLS = Gauge(
+    "catan_llm_active_calls",
+    "LLM calls holding a slot"
+)
+
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "catan_llm_queue_wait_seconds",
+    "Time spent waiting for an LLM slot",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+LLM_ADMISSION_REJECTED = Counter(
+    "catan_llm_admission_rejected_total",
+    "Requests rejected by LLM admission control",
+    ["reason"]
+)
+
+LLM_PROMPT_TOKENS = Counter(
+    "catan_llm_prompt_tokens_total",
+    "Prompt tokens reported by the LLM provider, by whether its prompt cache served them",
+    ["cache"]
+)
+
+LLM_PROVIDER_CALLS = Counter(
+    "catan_llm_provider_calls_total",
+    "LLM provider requests by outcome (success, failure, cancelled)",
+    ["provider", "outcome"]
+)
+
+LLM_HEDGED_REQUESTS = Counter(
+    "catan_llm_hedged_requests_total",
+    "Hedged requests started because a provider was slow to its first token",
+    ["provider"]
+)
+
+LLM_CIRCUIT_OPEN = Gauge(
+    "catan_llm_circuit_open",
+    "Whether a provider's circuit breaker is open (1) or closed (0)",
+    ["provider"]
+)
+
+STREAM_CANCELLATIONS = Counter(
+    "catan_stream_cancellations_total",
+    "Streamed answers whose LLM generation was cancelled because no client was reading"
+)
+
+LLM_TOKENS_SAVED = Counter(
+    "catan_llm_tokens_saved_total",
+    "Estimated completion tokens not generated because streams were cancelled"
+)
+
+COALESCED_REQUESTS = Counter(
+    "catan_coalesced_requests_total",
+    "Requests served by an identical request already in flight",
+    ["kind"]
+)
+
+CORPUS_VERSION = Gauge(
+    "catan_corpus_version",
+    "Published corpus version this worker is serving"
+)
+
+
+def record_cache_lookup(cache: str, hit: bool, count: int = 1):
+    """
+    Count cache hits or misses.
+
+    Args:
+        cache: Cache name
+        hit: Whether the lookups were served from the cache
+        count: Number of lookups
+    """
+    if count:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc(count)
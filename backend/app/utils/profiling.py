@@ -0,0 +1,158 @@
+"""Per-stage wall time, CPU time and memory profiling for batch jobs."""
+import cProfile
+import json
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Get the peak resident set size of this process over its lifetime.
+
+    This is a high-water mark: it never goes down, so it cannot tell which
+    stage used the memory.
+
+    Returns:
+        Peak RSS in MiB, or None if the platform does not report it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time, peak memory and item counts per stage and item.
+
+    Memory per stage is the tracemalloc peak above what was allocated when
+    the stage started, so it covers Python and NumPy allocations but not
+    memory allocated directly by C libraries. Tracing slows down
+    allocation-heavy stages; the process peak RSS is reported once, for the
+    whole run.
+    """
+
+    def __init__(self, enabled: bool = True, cprofile_dir: Optional[str] = None):
+        """
+        Initialize the stage profiler.
+
+        Args:
+            enabled: Whether to record anything; a disabled profiler is a no-op
+            cprofile_dir: If set, dump cProfile stats of every stage run here
+        """
+        self.enabled = enabled
+        self.cprofile_dir = Path(cprofile_dir) if cprofile_dir else None
+        if self.enabled and self.cprofile_dir is not None:
+            self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+        self.records: List[dict] = []
+        self._started = time.perf_counter()
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, item: str = "") -> Iterator[dict]:
+        """
+        Profile one run of a stage.
+
+        The yielded record's "items" entry can be set to the number of items
+        the stage produced (atoms, chunks, ...).
+
+        Args:
+            name: Stage name
+            item: What the stage ran on, e.g. a PDF file name
+
+        Yields:
+            The record being built for this run
+        """
+        record = {"stage": name, "item": item, "items": 0}
+        if not self.enabled:
+            yield record
+            return
+
+        profiler = cProfile.Profile() if self.cprofile_dir is not None else None
+        tracemalloc.reset_peak()
+        allocated_before, _ = tracemalloc.get_traced_memory()
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["wall_s"] = round(time.perf_counter() - wall_started, 4)
+            record["cpu_s"] = round(time.process_time() - cpu_started, 4)
+            _, allocated_peak = tracemalloc.get_traced_memory()
+            record["peak_alloc_mb"] = round((allocated_peak - allocated_before) / (1024 * 1024), 2)
+            if profiler is not None:
+                path = self.cprofile_dir / f"{self._slug(item)}.{self._slug(name)}.prof"
+                profiler.dump_stats(str(path))
+                record["cprofile"] = str(path)
+            self.records.append(record)
+
+    def report(self) -> dict:
+        """
+        Summarize the recorded stages.
+
+        Returns:
+            Dict with totals per stage, totals per item and the raw records
+        """
+        by_stage: Dict[str, dict] = {}
+        by_item: Dict[str, dict] = {}
+        for record in self.records:
+            for key, group in ((record["stage"], by_stage), (record["item"], by_item)):
+                totals = group.setdefault(key, {"runs": 0, "wall_s": 0.0, "cpu_s": 0.0})
+                totals["runs"] += 1
+                totals["wall_s"] = round(totals["wall_s"] + record["wall_s"], 4)
+                totals["cpu_s"] = round(totals["cpu_s"] + record["cpu_s"], 4)
+                totals["peak_alloc_mb"] = max(totals.get("peak_alloc_mb", 0.0), record["peak_alloc_mb"])
+            # Item counts only add up within a stage (atoms vs chunks)
+            by_stage[record["stage"]]["items"] = by_stage[record["stage"]].get("items", 0) + record["items"]
+            stages = by_item[record["item"]].setdefault("stages", {})
+            stages[record["stage"]] = {
+                "wall_s": record["wall_s"],
+                "cpu_s": record["cpu_s"],
+                "peak_alloc_mb": record["peak_alloc_mb"],
+                "items": record["items"]
+            }
+
+        return {
+            "total_wall_s": round(time.perf_counter() - self._started, 4),
+            "process_peak_rss_mb": peak_rss_mb(),
+            "stages": by_stage,
+            "items": by_item,
+            "records": self.records
+        }
+
+    def write_report(self, path: str) -> dict:
+        """
+        Write the report as JSON with stable key order, so runs can be diffed.
+
+        Args:
+            path: Output file path
+
+        Returns:
+            The written report
+        """
+        report = self.report()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        return report
+
+    @staticmethod
+    def _slug(text: str) -> str:
+        """Make text safe for use in a file name."""
+        return re.sub(r"[^A-Za-z0-9_.-]+", "_", text) or "run"
@@ -0,0 +1,94 @@
+"""Fast JSON and MessagePack encoding for API responses and chunk storage."""
+import json
+from typing import Any, Optional
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode an object as compact UTF-8 JSON.
+
+    Args:
+        obj: JSON-compatible object
+
+    Returns:
+        Encoded JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decode JSON bytes.
+
+    Args:
+        data: Encoded JSON (any formatting)
+
+    Returns:
+        Decoded object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """
+    Pick the response encoding from an Accept header.
+
+    MessagePack is chosen only when the client asks for it and msgpack is
+    installed; everything else gets JSON.
+
+    Args:
+        accept: Value of the Accept header
+
+    Returns:
+        Media type of the response
+    """
+    if accept and msgpack is not None:
+        for part in accept.split(","):
+            media_type = part.split(";", 1)[0].strip().lower()
+            if media_type in MSGPACK_MEDIA_TYPES:
+                return media_type
+    return JSON_MEDIA_TYPE
+
+
+def encode_response(content: Any, accept: Optional[str] = None, status_code: int = 200) -> Response:
+    """
+    Build a response from plain data without revalidating it.
+
+    Args:
+        content: JSON-compatible data (dicts, lists and scalars)
+        accept: Value of the request's Accept header
+        status_code: HTTP status code
+
+    Returns:
+        JSON or MessagePack response
+    """
+    media_type = negotiate_media_type(accept)
+    if media_type == JSON_MEDIA_TYPE:
+        body = dumps(content)
+    else:
+        body = msgpack.packb(content, use_bin_type=True)
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type=media_type,
+        headers={"Vary": "Accept"}
+    )
@@ -0,0 +1,101 @@
+"""Server-Sent Events framing and token coalescing."""
+import re
+import time
+from typing import Callable, List, Optional
+
+
+LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+
+def format_sse_event(event: str, data: str) -> str:
+    """
+    Encode an SSE frame, one data line per line of the payload.
+
+    Per the SSE spec the client joins consecutive data lines with newlines,
+    so payloads need no escaping.
+
+    Args:
+        event: Event name
+        data: Event payload
+
+    Returns:
+        SSE formatted frame
+    """
+    data_lines = "".join(f"data: {line}\n" for line in LINE_BREAK.split(data))
+    return f"event: {event}\n{data_lines}\n"
+
+
+class TokenCoalescer:
+    """Buffers streamed tokens and releases them in larger frames."""
+
+    def __init__(
+        self,
+        max_bytes: int = 64,
+        max_delay_ms: float = 20,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the token coalescer.
+
+        Args:
+            max_bytes: Flush once the buffer holds at least this many UTF-8 bytes
+            max_delay_ms: Flush once the oldest buffered token is this old
+            clock: Monotonic clock in seconds
+        """
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000
+        self.clock = clock
+        self._parts: List[str] = []
+        self._size = 0
+        self._first_at = 0.0
+
+    def add(self, token: str) -> Optional[str]:
+        """
+        Buffer a token, releasing the buffer if a threshold is reached.
+
+        Thresholds are checked as tokens arrive; a caller that wants the
+        delay honoured while no token arrives flushes once time_until_flush()
+        has passed.
+
+        Args:
+            token: Token text
+
+        Returns:
+            Coalesced text to send, or None if still buffering
+        """
+        if not token:
+            return None
+        if not self._parts:
+            self._first_at = self.clock()
+        self._parts.append(token)
+        self._size += len(token.encode("utf-8"))
+
+        if self._size >= self.max_bytes or self.clock() - self._first_at >= self.max_delay:
+            return self.flush()
+        return None
+
+    def time_until_flush(self) -> Optional[float]:
+        """
+        Time left before the buffered tokens are due.
+
+        Returns:
+            Seconds until the delay threshold (0 if already past), or None if
+            nothing is buffered
+        """
+        if not self._parts:
+            return None
+        return max(0.0, self._first_at + self.max_delay - self.clock())
+
+    def flush(self) -> Optional[str]:
+        """
+        Release everything buffered.
+
+        Returns:
+            Buffered text, or None if the buffer is empty
+        """
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text
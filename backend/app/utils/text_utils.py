@@ -1,6 +1,7 @@
 """Text normalization and utility functions."""
 import re
-from typing import Tuple
+from bisect import bisect_right
+from typing import List, Tuple
 
 
 def normalize_whitespace(text: str) -> str:
@@ -22,3 +23,90 @@ def preserve_char_positions(original_text: str, normalized_text: str) -> Tuple[i
     # This is a placeholder for more complex mapping if needed
     return 0, len(normalized_text)
 
+
+# Typographic characters folded to plain ASCII for matching
+_MATCH_CHAR_MAP = {
+    "\u2018": "'", "\u2019": "'", "\u201a": "'", "\u201b": "'", "\u2032": "'",
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"', "\u2033": '"',
+    "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-",
+    "\u2015": "-", "\u2212": "-",
+    "\u2026": "...",
+    "\ufb00": "ff", "\ufb01": "fi", "\ufb02": "fl", "\ufb03": "ffi", "\ufb04": "ffl",
+    "\u00a0": " ", "\u00ad": "",
+}
+
+
+def normalize_for_matching(text: str) -> Tuple[str, List[int]]:
+    """
+    Normalize text for fuzzy quote matching, tracking original positions.
+
+    Case-folds, replaces curly quotes, dashes and ligatures with ASCII, and
+    collapses whitespace runs to a single space.
+
+    Args:
+        text: Text to normalize
+
+    Returns:
+        Tuple of (normalized text, original index of each normalized character)
+    """
+    chars: List[str] = []
+    offsets: List[int] = []
+    previous_space = True  # Drops leading whitespace
+
+    for i, ch in enumerate(text):
+        mapped = _MATCH_CHAR_MAP.get(ch)
+        if mapped is None:
+            mapped = ch.casefold()
+        for out in mapped:
+            if out.isspace():
+                if previous_space:
+                    continue
+                out = " "
+                previous_space = True
+            else:
+                previous_space = False
+            chars.append(out)
+            offsets.append(i)
+
+    if chars and chars[-1] == " ":
+        chars.pop()
+        offsets.pop()
+    return "".join(chars), offsets
+
+
+def compress_offsets(offsets: List[int]) -> List[Tuple[int, int]]:
+    """
+    Compress a normalized-to-original offset list into breakpoints.
+
+    Between breakpoints the original offset advances one-for-one with the
+    normalized offset, so only positions where that changes are stored.
+
+    Args:
+        offsets: Original index of each normalized character
+
+    Returns:
+        List of (normalized index, original index) breakpoints
+    """
+    breaks: List[Tuple[int, int]] = []
+    for i, original in enumerate(offsets):
+        if not breaks or original - i != breaks[-1][1] - breaks[-1][0]:
+            breaks.append((i, original))
+    return breaks
+
+
+def map_offset(breaks: List[Tuple[int, int]], index: int) -> int:
+    """
+    Map a normalized text index back to the original text.
+
+    Args:
+        breaks: Breakpoints from compress_offsets
+        index: Index into the normalized text
+
+    Returns:
+        Corresponding index into the original text
+    """
+    if not breaks:
+        return index
+    pos = bisect_right(breaks, (index, float("inf"))) - 1
+    norm_index, original = breaks[max(pos, 0)]
+    return original + (index - norm_index)
@@ -0,0 +1,43 @@
+"""Token counting helpers for prompt budgeting."""
+from functools import lru_cache
+from typing import Callable
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken ships with langchain-openai
+    tiktoken = None
+
+# Rough characters-per-token ratio for English prose, used without tiktoken
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def get_token_counter(model_name: str = "") -> Callable[[str], int]:
+    """
+    Get a function that counts tokens for the given model.
+
+    Uses tiktoken when available (exact for OpenAI models, a close estimate
+    for others) and falls back to a character-based estimate.
+
+    Args:
+        model_name: Name of the LLM the prompt is built for
+
+    Returns:
+        Callable mapping text to its token count
+    """
+    def estimate(text: str) -> int:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    if tiktoken is None:
+        return estimate
+
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Encodings are downloaded on first use; offline hosts fall back
+        return estimate
+
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
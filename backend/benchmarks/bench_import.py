@@ -0,0 +1,102 @@
+"""Import-time benchmark for the API app.
+
+Imports a module in fresh interpreters with `python -X importtime`, reports
+the median total import time and the slowest modules, and exits 1 if the
+median exceeds --target-ms.
+
+Run from the backend directory:
+    python -m benchmarks.bench_import --target-ms 1500
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# "import time:  self [us] | cumulative | imported package"
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Import a module in a fresh interpreter and collect -X importtime output.
+
+    Args:
+        module: Module to import
+
+    Returns:
+        Dict of imported module to (self us, cumulative us)
+    """
+    env = dict(os.environ)
+    # Settings load lazily, but keep a placeholder in case a module reads them
+    env.setdefault("OPENAI_API_KEY", "import-benchmark")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(BACKEND_DIR), env.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    timings: Dict[str, Tuple[int, int]] = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+
+def main():
+    """Run the import-time benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app.main", help="Module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to run (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    parser.add_argument("--target-ms", type=float, default=None, help="Fail if the median import time exceeds this")
+    parser.add_argument(
+        "--forbid",
+        default="langchain_google_vertexai,langchain_openai,fitz,chromadb",
+        help="Comma-separated modules that must not be imported (empty to skip)"
+    )
+    args = parser.parse_args()
+
+    runs: List[Dict[str, Tuple[int, int]]] = [measure_import(args.module) for _ in range(args.repeat)]
+    totals_ms = [run[args.module][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.repeat} runs "
+          f"(min {min(totals_ms):.1f}, max {max(totals_ms):.1f})")
+
+    # Slowest modules by self time of the median run, grouped by top-level package
+    median_run = min(runs, key=lambda run: abs(run[args.module][1] / 1000 - median_ms))
+    packages: Dict[str, int] = {}
+    for name, (self_us, _) in median_run.items():
+        top_level = name.split(".")[0]
+        packages[top_level] = packages.get(top_level, 0) + self_us
+    print("Slowest top-level packages (self time):")
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<40} {self_us / 1000:8.1f} ms")
+
+    ok = True
+    forbidden = [name for name in args.forbid.split(",") if name]
+    loaded = sorted(name for name in forbidden if name in median_run)
+    if loaded:
+        print(f"Eagerly imported (should load on first use): {', '.join(loaded)}")
+        ok = False
+    if args.target_ms is not None and median_ms > args.target_ms:
+        print(f"Over target: {median_ms:.1f} ms > {args.target_ms:.1f} ms")
+        ok = False
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmark suite for parsing, chunking, chunk storage and answer post-processing.
+
+Generates a synthetic rulebook PDF, times each stage and records peak traced
+memory, then writes a results file. With --baseline, results are compared to
+an earlier run and the exit code is 1 if any stage got slower than the
+tolerance allows.
+
+No baseline is shipped, since timings depend on the machine. Record one on
+the machine you compare on, with the parameters you will compare with, and
+pass it to later runs. From the backend directory:
+    python -m benchmarks.bench_pipeline --pages 40 --output baseline.json
+    python -m benchmarks.bench_pipeline --pages 40 --baseline baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# Settings are loaded on first use and require an API key; no API calls
+# are made by these benchmarks
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from langchain_core.documents import Document
+from app.config import settings
+from app.models.chunk import Chunk
+from app.services.chunk_storage import ChunkStorageService
+from app.services.chunking import ChunkingService
+from app.services.pdf_parser import PDFParser
+from app.services.qa_service import QAService
+from app.services.vector_store import VectorStoreService
+from benchmarks.synthetic_pdf import generate_rulebook_pdf
+
+
+# Slowdowns smaller than this are timer noise, whatever the ratio
+NOISE_FLOOR_S = 0.0005
+
+
+def measure(func: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """
+    Time a function and measure its peak traced memory.
+
+    Memory is measured in a separate untimed run because tracing slows
+    allocation-heavy code down.
+
+    Args:
+        func: Function to benchmark
+        repeat: Number of timed runs
+
+    Returns:
+        Dict with median and min seconds and peak memory in MiB
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "median_s": round(statistics.median(times), 6),
+        "min_s": round(min(times), 6),
+        "peak_mem_mb": round(peak / (1024 * 1024), 3)
+    }
+
+
+def make_citation_answer(chunks: List[Chunk], citations: int, seed: int) -> str:
+    """
+    Build an LLM-style answer citing quotes from the given chunks.
+
+    Every third quote is lightly edited so the fuzzy matching path is exercised.
+
+    Args:
+        chunks: Chunks to quote from
+        citations: Number of citation markers
+        seed: Random seed
+
+    Returns:
+        Answer text with [[CITE:chunk_id]]quote[[/CITE]] markers
+    """
+    rng = random.Random(seed)
+    parts = []
+    for i in range(citations):
+        chunk = chunks[i % len(chunks)]
+        start = rng.randrange(max(1, len(chunk.text) - 80))
+        quote = chunk.text[start:start + 60]
+        if i % 3 == 2:
+            quote = quote.replace(" the ", " a ", 1).upper()
+        parts.append(f"According to the rules, [[CITE:{chunk.chunk_id}]]{quote}[[/CITE]] applies here.")
+    return " ".join(parts)
+
+
+def chunk_to_document(chunk: Chunk) -> Document:
+    """Build the retrieval document for a chunk, as the vector store returns it."""
+    return Document(
+        page_content=chunk.text,
+        metadata={
+            "chunk_id": chunk.chunk_id,
+            "pdf_id": chunk.pdf_id,
+            "page_start": chunk.page_start,
+            "page_end": chunk.page_end,
+            "section_title": chunk.section_title or ""
+        }
+    )
+
+
+def run_benchmarks(pages: int, repeat: int, k: int, citations: int, seed: int) -> dict:
+    """
+    Run every benchmark in a temporary directory.
+
+    Args:
+        pages: Pages in the synthetic PDF
+        repeat: Timed runs per benchmark
+        k: Documents passed to context formatting
+        citations: Citation markers in the parsed answer
+        seed: Random seed for generated content
+
+    Returns:
+        Results dict with parameters, environment and per-benchmark numbers
+    """
+    results: Dict[str, Dict[str, float]] = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the vector store and chunk files out of the real data directory
+        settings.chroma_persist_dir = tmp
+        pdf_path = str(Path(tmp) / "rulebook.pdf")
+        generate_rulebook_pdf(pdf_path, pages=pages, seed=seed)
+
+        parser = PDFParser()
+        results["parse_pdf"] = measure(lambda: parser.parse_pdf(pdf_path, pdf_id="bench"), repeat)
+        _, atoms = parser.parse_pdf(pdf_path, pdf_id="bench")
+
+        chunking = ChunkingService()
+        results["group_atoms_into_chunks"] = measure(
+            lambda: chunking.group_atoms_into_chunks(atoms=atoms, pdf_id="bench"), repeat
+        )
+        chunks = chunking.group_atoms_into_chunks(atoms=atoms, pdf_id="bench")
+        chunk_ids = [chunk.chunk_id for chunk in chunks]
+
+        storage_dir = str(Path(tmp) / "chunks")
+        storage = ChunkStorageService(storage_dir)
+        results["storage_save"] = measure(lambda: storage.save_chunks(chunks), repeat)
+        # A fresh service per run so loads hit the disk, not the cache
+        results["storage_load"] = measure(
+            lambda: ChunkStorageService(storage_dir).get_chunks(chunk_ids), repeat
+        )
+        results["storage_by_pdf"] = measure(
+            lambda: ChunkStorageService(storage_dir).get_chunks_by_pdf("bench"), repeat
+        )
+
+        vector_store = VectorStoreService()
+        vector_store.chunk_storage = storage
+        qa_service = QAService(vector_store)
+
+        docs = [chunk_to_document(chunk) for chunk in chunks[:k]]
+        answer = make_citation_answer(chunks[:k], citations, seed)
+        results["parse_citations"] = measure(lambda: qa_service._parse_citations(answer, docs), repeat)
+        results["format_context"] = measure(lambda: qa_service._format_context(docs), repeat)
+
+    return {
+        "params": {"pages": pages, "repeat": repeat, "k": k, "citations": citations, "seed": seed},
+        "counts": {"atoms": len(atoms), "chunks": len(chunks)},
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "benchmarks": results
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Print results next to a baseline and flag regressions.
+
+    Args:
+        results: Results of this run
+        baseline: Stored results to compare against
+        tolerance: Allowed slowdown of the median as a fraction (0.2 = 20%)
+
+    Returns:
+        True if no benchmark regressed beyond the tolerance
+    """
+    if baseline.get("params") != results["params"]:
+        print(f"Warning: baseline parameters differ: {baseline.get('params')}")
+
+    ok = True
+    print(f"{'benchmark':<26} {'median ms':>10} {'baseline':>10} {'ratio':>7} {'mem MiB':>9}")
+    for name, current in results["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if previous is None or not previous.get("median_s"):
+            print(f"{name:<26} {current['median_s'] * 1000:10.2f} {'-':>10} {'-':>7} {current['peak_mem_mb']:9.2f}")
+            continue
+        ratio = current["median_s"] / previous["median_s"]
+        flag = ""
+        if ratio > 1 + tolerance and current["median_s"] - previous["median_s"] > NOISE_FLOOR_S:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{name:<26} {current['median_s'] * 1000:10.2f} {previous['median_s'] * 1000:10.2f} "
+            f"{ratio:7.2f} {current['peak_mem_mb']:9.2f}{flag}"
+        )
+    return ok
+
+
+def main():
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40, help="Pages in the synthetic rulebook")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (median is compared)")
+    parser.add_argument("--k", type=int, default=8, help="Documents passed to context formatting")
+    parser.add_argument("--citations", type=int, default=20, help="Citation markers in the parsed answer")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for generated content")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write results")
+    parser.add_argument("--baseline", default=None, help="Results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed median slowdown vs baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.pages, args.repeat, args.k, args.citations, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"{results['counts']['atoms']} atoms, {results['counts']['chunks']} chunks; results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.tolerance):
+            sys.exit(1)
+    else:
+        for name, numbers in results["benchmarks"].items():
+            print(f"  {name:<26} {numbers['median_s'] * 1000:10.2f} ms  {numbers['peak_mem_mb']:8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Microbenchmark of chunk response and storage serialization.
+
+Compares the previous path (per-atom model_dump, ChunkResponse revalidation,
+stdlib json with indentation for storage) against the orjson/MessagePack path.
+
+Run from the backend directory:
+    python -m benchmarks.bench_serialization --atoms 2000
+"""
+import argparse
+import json
+import timeit
+from fastapi.responses import JSONResponse
+from app.models.chunk import Atom, BBox, Chunk
+from app.models.response import ChunkResponse
+from app.services.highlights import compute_highlight_lines
+from app.services.quote_locator import build_search_index
+from app.utils import serialization
+
+
+def make_chunk(num_atoms: int) -> Chunk:
+    """Build a synthetic chunk with the given number of word atoms."""
+    atoms = []
+    pos = 0
+    for i in range(num_atoms):
+        text = f"word{i}"
+        line, col = divmod(i, 12)
+        atoms.append(Atom(
+            text=text,
+            page_num=line // 50,
+            bbox=BBox(x0=50 + col * 40.5, y0=60 + (line % 50) * 14.25, x1=85 + col * 40.5, y1=72 + (line % 50) * 14.25),
+            char_start=pos,
+            char_end=pos + len(text)
+        ))
+        pos += len(text) + 1
+    text = " ".join(atom.text for atom in atoms)
+    return Chunk(
+        chunk_id="bench-chunk",
+        text=text,
+        pdf_id="bench-pdf",
+        atoms=atoms,
+        page_start=atoms[0].page_num,
+        page_end=atoms[-1].page_num,
+        section_title="Benchmark",
+        search_index=build_search_index(text),
+        highlight_lines=compute_highlight_lines(atoms)
+    )
+
+
+def legacy_response(chunk: Chunk) -> bytes:
+    """Response encoding as done by get_chunk before the fast path."""
+    response = ChunkResponse(
+        chunk_id=chunk.chunk_id,
+        text=chunk.text,
+        pdf_id=chunk.pdf_id,
+        page_start=chunk.page_start,
+        page_end=chunk.page_end,
+        section_title=chunk.section_title,
+        atoms=[atom.model_dump() for atom in chunk.atoms]
+    )
+    return JSONResponse(response.model_dump()).body
+
+
+def fast_response(chunk: Chunk, accept: str) -> bytes:
+    """Response encoding of the fast path."""
+    fields = {"chunk_id", "text", "pdf_id", "page_start", "page_end", "section_title", "atoms"}
+    return serialization.encode_response(chunk.model_dump(include=fields), accept).body
+
+
+def legacy_storage(chunk: Chunk) -> Chunk:
+    """Storage round trip with indented stdlib JSON."""
+    data = json.dumps(chunk.model_dump(), indent=2, ensure_ascii=False)
+    return Chunk(**json.loads(data))
+
+
+def fast_storage(chunk: Chunk) -> Chunk:
+    """Storage round trip with compact encoding."""
+    return Chunk(**serialization.loads(serialization.dumps(chunk.model_dump())))
+
+
+def report(name: str, func, repeat: int, size: int = None):
+    """Time a function and print the best per-call time."""
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    size_note = f"  {size / 1024:8.1f} KiB" if size is not None else ""
+    print(f"  {name:<28} {best * 1000:8.2f} ms{size_note}")
+
+
+def main():
+    """Run the serialization benchmarks."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--atoms", type=int, default=2000, help="Atoms in the synthetic chunk")
+    parser.add_argument("--repeat", type=int, default=20, help="Timing repetitions (best is reported)")
+    args = parser.parse_args()
+
+    chunk = make_chunk(args.atoms)
+    print(f"Chunk with {args.atoms} atoms")
+    print(f"  orjson: {'yes' if serialization.orjson else 'no'}, msgpack: {'yes' if serialization.msgpack else 'no'}")
+
+    print("Response")
+    report("legacy (revalidate + json)", lambda: legacy_response(chunk), args.repeat, len(legacy_response(chunk)))
+    report("fast json", lambda: fast_response(chunk, "application/json"), args.repeat,
+           len(fast_response(chunk, "application/json")))
+    if serialization.msgpack is not None:
+        report("fast msgpack", lambda: fast_response(chunk, "application/msgpack"), args.repeat,
+               len(fast_response(chunk, "application/msgpack")))
+
+    print("Storage round trip")
+    report("legacy (indented json)", lambda: legacy_storage(chunk), args.repeat,
+           len(json.dumps(chunk.model_dump(), indent=2, ensure_ascii=False).encode("utf-8")))
+    report("compact", lambda: fast_storage(chunk), args.repeat, len(serialization.dumps(chunk.model_dump())))
+
+
+if __name__ == "__main__":
+    main()
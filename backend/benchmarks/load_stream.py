@@ -0,0 +1,423 @@
+"""Load test for the streaming query endpoint.
+
+Ramps the number of concurrent /api/query/stream sessions and reports
+time to first byte, gaps between SSE events, full-answer latency and error
+rate at each level.
+
+By default the app is served in-process by uvicorn on a local port, with a
+stub LLM (fixed time to first token and per-token delay) and deterministic
+local embeddings over a synthetic rulebook. --qa-path selects the sync
+(threaded) or async QA streaming path, or runs both for comparison.
+
+Every session asks a question of its own, so each one costs a retrieval
+and an LLM call. With --coalesce, sessions draw from a few fixed questions
+and the stub app coalesces identical ones in flight, which shows how much
+coalescing saves but overstates capacity for varied traffic.
+
+Run from the backend directory:
+    python -m benchmarks.load_stream --concurrency 1,10,50,100 --qa-path both
+
+To test a separately started server, point --url at it. The stub app can be
+served with:
+    uvicorn --factory benchmarks.load_stream:create_stub_app --port 8001
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+# Settings are loaded on first use and require an API key; the stub app
+# makes no API calls
+os.environ.setdefault("OPENAI_API_KEY", "load-test")
+
+import httpx
+import uvicorn
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from app.config import settings
+from app.services.chunking import ChunkingService
+from app.services.pdf_parser import PDFParser
+from benchmarks.synthetic_pdf import generate_rulebook_pdf
+
+
+CHUNK_HEADER = re.compile(r"\[Chunk ([^,\]]+)[^\]]*\]\n(.+)")
+
+QUESTIONS = [
+    "What happens when a seven is rolled?",
+    "How many resources can I trade with the bank?",
+    "Where can I build a settlement?",
+    "How does the longest road work?",
+    "When can I play a development card?",
+    "What does a harbor let me do?",
+    "How is the game won?",
+    "Can the robber block a city?"
+]
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that streams a canned, citing answer with realistic timing."""
+
+    ttft_ms: float = 300
+    token_ms: float = 15
+    answer_tokens: int = 120
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub"
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        """Build the answer tokens, citing the first chunk of the context."""
+        prompt = messages[-1].content if messages else ""
+        citation = ""
+        match = CHUNK_HEADER.search(prompt)
+        if match:
+            quote = " ".join(match.group(2).split()[:8])
+            citation = f" [[CITE:{match.group(1)}]]{quote}[[/CITE]]"
+        words = [f"word{i % 50}" for i in range(self.answer_tokens)]
+        tokens = [f" {word}" for word in words]
+        tokens.insert(len(tokens) // 2, citation)
+        return tokens
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        tokens = self._tokens(messages)
+        time.sleep((self.ttft_ms + self.token_ms * len(tokens)) / 1000)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.ttft_ms / 1000)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.token_ms / 1000)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.ttft_ms / 1000)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.token_ms / 1000)
+
+
+def create_stub_app(
+    pages: int = 20,
+    ttft_ms: float = 300,
+    token_ms: float = 15,
+    answer_tokens: int = 120,
+    coalesce: bool = False
+):
+    """
+    Build the API app backed by a stub LLM and local embeddings.
+
+    The corpus is a synthetic rulebook ingested into a temporary directory.
+
+    Args:
+        pages: Pages in the synthetic rulebook
+        ttft_ms: Stub LLM time to first token
+        token_ms: Stub LLM delay between tokens
+        answer_tokens: Tokens per stub answer
+        coalesce: Whether identical concurrent questions share one answer
+
+    Returns:
+        FastAPI app
+    """
+    from app.api import dependencies
+    from app.main import app
+    from app.services.qa_service import QAService
+    from app.services.vector_store import VectorStoreService
+
+    data_dir = tempfile.mkdtemp(prefix="catan-load-")
+    settings.chroma_persist_dir = data_dir
+    settings.coalesce_queries = coalesce
+
+    vector_store = VectorStoreService()
+    vector_store.embedding_service.embeddings = DeterministicFakeEmbedding(size=256)
+
+    pdf_path = os.path.join(data_dir, "rulebook.pdf")
+    generate_rulebook_pdf(pdf_path, pages=pages)
+    _, atoms = PDFParser().parse_pdf(pdf_path, pdf_id="load-test")
+    vector_store.add_chunks(ChunkingService().group_atoms_into_chunks(atoms=atoms, pdf_id="load-test"))
+
+    qa_service = QAService(vector_store)
+    stub = StubChatModel(ttft_ms=ttft_ms, token_ms=token_ms, answer_tokens=answer_tokens)
+    qa_service.llm = stub
+    qa_service.history_service.llm = stub
+
+    app.dependency_overrides[dependencies.get_vector_store_service] = lambda: vector_store
+    app.dependency_overrides[dependencies.get_qa_service] = lambda: qa_service
+    return app
+
+
+class BackgroundServer:
+    """Runs uvicorn in a thread so responses are really streamed over HTTP."""
+
+    def __init__(self, app):
+        """
+        Initialize the server on a free local port.
+
+        Args:
+            app: ASGI app to serve
+        """
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+@dataclass
+class SessionResult:
+    """Timings of one streamed answer, in seconds from the request start."""
+    ok: bool
+    ttfb: Optional[float] = None
+    latency: Optional[float] = None
+    gaps: List[float] = field(default_factory=list)
+    error: str = ""
+
+
+async def run_session(client: httpx.AsyncClient, question: str, k: int) -> SessionResult:
+    """
+    Stream one answer and time its events.
+
+    Args:
+        client: HTTP client with the server's base URL
+        question: Question to ask
+        k: Number of chunks to retrieve
+
+    Returns:
+        SessionResult for the session
+    """
+    started = time.perf_counter()
+    result = SessionResult(ok=False)
+    last_event = None
+    buffer = b""
+    saw_done = False
+    try:
+        async with client.stream("POST", "/api/query/stream", json={"question": question, "k": k}) as response:
+            if response.status_code != 200:
+                result.error = f"HTTP {response.status_code}"
+                return result
+            async for raw in response.aiter_raw():
+                now = time.perf_counter()
+                if result.ttfb is None:
+                    result.ttfb = now - started
+                buffer += raw
+                *frames, buffer = buffer.split(b"\n\n")
+                for frame in frames:
+                    if last_event is not None:
+                        result.gaps.append(now - last_event)
+                    last_event = now
+                    if frame.startswith(b"event: error"):
+                        result.error = frame.decode("utf-8", "replace")[:200]
+                    elif frame.startswith(b"event: done"):
+                        saw_done = True
+    except httpx.HTTPError as e:
+        result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    result.latency = time.perf_counter() - started
+    if not result.error and not saw_done:
+        result.error = "stream ended without done event"
+    result.ok = not result.error
+    return result
+
+
+async def run_level(
+    url: str, concurrency: int, requests: int, k: int, seed: int, repeat_questions: bool = False
+) -> List[SessionResult]:
+    """
+    Run a fixed number of sessions with a fixed number of concurrent clients.
+
+    Args:
+        url: Server base URL
+        concurrency: Sessions in flight at once
+        requests: Total sessions to run
+        k: Number of chunks to retrieve per question
+        seed: Seed for question selection
+        repeat_questions: Ask the fixed questions as they are instead of
+            making each session's question unique
+
+    Returns:
+        Results of all sessions
+    """
+    rng = random.Random(seed)
+    questions = [rng.choice(QUESTIONS) for _ in range(requests)]
+    if not repeat_questions:
+        questions = [f"{question} (session {index})" for index, question in enumerate(questions)]
+    results: List[SessionResult] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=None, limits=limits) as client:
+        async def worker():
+            while questions:
+                results.append(await run_session(client, questions.pop(), k))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a list, or None if it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(results: List[SessionResult], elapsed: float) -> Dict[str, Any]:
+    """
+    Aggregate session results of one concurrency level.
+
+    Args:
+        results: Session results
+        elapsed: Wall time of the level in seconds
+
+    Returns:
+        Dict of throughput, error rate and latency percentiles in milliseconds
+    """
+    ok = [result for result in results if result.ok]
+    ttfb = [result.ttfb for result in ok]
+    latency = [result.latency for result in ok]
+    gaps = [gap for result in ok for gap in result.gaps]
+
+    def ms(value: Optional[float]) -> Optional[float]:
+        return round(value * 1000, 1) if value is not None else None
+
+    errors: Dict[str, int] = {}
+    for result in results:
+        if not result.ok:
+            errors[result.error] = errors.get(result.error, 0) + 1
+
+    return {
+        "requests": len(results),
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed > 0 else 0.0,
+        "error_rate": round(1 - len(ok) / len(results), 4) if results else 0.0,
+        "errors": errors,
+        "ttfb_ms": {f"p{p}": ms(percentile(ttfb, p)) for p in (50, 95, 99)},
+        "event_gap_ms": {f"p{p}": ms(percentile(gaps, p)) for p in (50, 99)}
+        | {"max": ms(max(gaps) if gaps else None)},
+        "latency_ms": {f"p{p}": ms(percentile(latency, p)) for p in (50, 95, 99)}
+        | {"mean": ms(statistics.fmean(latency) if latency else None)}
+    }
+
+
+def print_level(qa_path: str, concurrency: int, summary: Dict[str, Any]):
+    """Print one row of the results table."""
+    def fmt(value):
+        return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+
+    print(
+        f"{qa_path:<6} {concurrency:>5} {summary['throughput_rps']:8.2f} {summary['error_rate'] * 100:6.1f}%"
+        f" {fmt(summary['ttfb_ms']['p50'])} {fmt(summary['ttfb_ms']['p99'])}"
+        f" {fmt(summary['event_gap_ms']['p99'])}"
+        f" {fmt(summary['latency_ms']['p50'])} {fmt(summary['latency_ms']['p99'])}"
+    )
+
+
+async def ramp(url: str, qa_path: str, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Run every concurrency level against a server and print the results."""
+    rows = []
+    for concurrency in args.concurrency:
+        if qa_path in ("sync", "async"):
+            settings.stream_async = qa_path == "async"
+        requests = max(concurrency, args.requests_per_level)
+        started = time.perf_counter()
+        results = await run_level(url, concurrency, requests, args.k, args.seed, args.coalesce)
+        summary = summarize(results, time.perf_counter() - started)
+        print_level(qa_path, concurrency, summary)
+        rows.append({"qa_path": qa_path, "concurrency": concurrency, **summary})
+    return rows
+
+
+def main():
+    """Run the load test."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="Test a running server instead of the in-process stub app")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(level) for level in value.split(",")],
+        default=[1, 5, 10, 25, 50],
+        help="Comma-separated concurrency levels"
+    )
+    parser.add_argument("--requests-per-level", type=int, default=50, help="Sessions per level (at least the level)")
+    parser.add_argument(
+        "--qa-path",
+        choices=["sync", "async", "both"],
+        default="sync",
+        help="QA streaming path of the in-process app"
+    )
+    parser.add_argument("--k", type=int, default=5, help="Chunks retrieved per question")
+    parser.add_argument("--pages", type=int, default=20, help="Pages in the synthetic rulebook")
+    parser.add_argument("--ttft-ms", type=float, default=300, help="Stub LLM time to first token")
+    parser.add_argument("--token-ms", type=float, default=15, help="Stub LLM delay between tokens")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens per stub answer")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for question selection")
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Repeat a few fixed questions and coalesce identical ones in the stub app"
+    )
+    parser.add_argument("--output", default=None, help="Also write results as JSON to this file")
+    args = parser.parse_args()
+
+    print(
+        f"{'path':<6} {'conc':>5} {'req/s':>8} {'errors':>7} {'ttfb50':>8} {'ttfb99':>8}"
+        f" {'gap99':>8} {'lat50':>8} {'lat99':>8}   (ms)"
+    )
+    rows: List[Dict[str, Any]] = []
+    if args.url:
+        rows += asyncio.run(ramp(args.url, "server", args))
+    else:
+        app = create_stub_app(args.pages, args.ttft_ms, args.token_ms, args.answer_tokens, args.coalesce)
+        paths = ["sync", "async"] if args.qa_path == "both" else [args.qa_path]
+        with BackgroundServer(app) as server:
+            for qa_path in paths:
+                rows += asyncio.run(ramp(server.url, qa_path, args))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"params": vars(args), "results": rows}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
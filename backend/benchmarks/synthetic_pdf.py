@@ -0,0 +1,85 @@
+"""Generate synthetic rulebook-like PDFs for benchmarks."""
+import random
+import textwrap
+import fitz  # PyMuPDF
+
+
+SECTION_NAMES = [
+    "SETUP", "TURN OVERVIEW", "RESOURCE PRODUCTION", "TRADING", "BUILDING",
+    "THE ROBBER", "DEVELOPMENT CARDS", "SPECIAL CARDS", "ENDING THE GAME", "VARIANTS"
+]
+
+SUBJECTS = [
+    "Each player", "The active player", "A settlement", "A city", "The robber",
+    "A knight card", "The longest road", "The bank", "A harbor", "Any opponent"
+]
+
+VERBS = [
+    "may trade", "must discard", "produces", "blocks", "receives",
+    "cannot build", "moves", "reveals", "counts as", "takes"
+]
+
+OBJECTS = [
+    "one resource card", "two victory points", "the hex it occupies", "half of their cards",
+    "a road adjacent to their settlement", "one card at random", "the ore and grain",
+    "a development card from the stack", "three identical resources", "the special card"
+]
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 72
+BODY_SIZE = 10
+LINE_HEIGHT = 14
+HEADING_SIZE = 14
+WRAP_WIDTH = 90
+
+
+def _sentence(rng: random.Random) -> str:
+    """Build one rules-like sentence."""
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}."
+
+
+def generate_rulebook_pdf(path: str, pages: int = 20, seed: int = 0) -> int:
+    """
+    Write a rulebook-like PDF with headings and wrapped paragraphs.
+
+    Output is deterministic for a given page count and seed.
+
+    Args:
+        path: Output PDF path
+        pages: Number of pages
+        seed: Random seed for the generated text
+
+    Returns:
+        Number of text lines written
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    lines_written = 0
+    section = 0
+
+    for _ in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        y = MARGIN
+        while y < PAGE_HEIGHT - MARGIN - 3 * LINE_HEIGHT:
+            if rng.random() < 0.25:
+                # Headings get extra spacing and capitals, like real rulebooks
+                y += LINE_HEIGHT
+                name = SECTION_NAMES[section % len(SECTION_NAMES)]
+                page.insert_text((MARGIN, y), f"{name} {section + 1}", fontsize=HEADING_SIZE)
+                y += LINE_HEIGHT + 8
+                section += 1
+                lines_written += 1
+
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 8)))
+            for line in textwrap.wrap(paragraph, WRAP_WIDTH):
+                if y >= PAGE_HEIGHT - MARGIN:
+                    break
+                page.insert_text((MARGIN, y), line, fontsize=BODY_SIZE)
+                y += LINE_HEIGHT
+                lines_written += 1
+            y += LINE_HEIGHT // 2
+
+    doc.save(path)
+    doc.close()
+    return lines_written
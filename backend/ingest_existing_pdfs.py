@@ -1,4 +1,12 @@
-"""Script to ingest existing PDFs from the data directory."""
+"""Script to ingest existing PDFs from the data directory.
+
+All PDFs are written in one write session and published as a single corpus
+version; PDFs are registered only once that version is committed.
+
+Pass --profile to record wall/CPU time, peak allocated memory and item
+counts per stage and per PDF, plus the process peak RSS, into a JSON report (and --cprofile-dir for cProfile dumps).
+"""
+import argparse
 import asyncio
 import hashlib
 import sys
@@ -7,43 +15,62 @@ from app.services.pdf_parser import PDFParser
 from app.services.chunking import ChunkingService
 from app.services.vector_store import VectorStoreService
 from app.services.pdf_registry import PDFRegistry
+from app.services.write_session import WriteSession
+from app.utils.profiling import StageProfiler
 
 
-async def ingest_pdf_file(pdf_path: Path, pdf_id: str):
-    """Ingest a single PDF file."""
-    print(f"Ingesting {pdf_path.name}...")
+async def ingest_pdf_file(
+    pdf_path: Path,
+    pdf_id: str,
+    profiler: StageProfiler,
+    pdf_parser: PDFParser,
+    chunking_service: ChunkingService,
+    vector_store: VectorStoreService,
+    session: WriteSession
+):
+    """
+    Ingest a single PDF file into an open write session.
     
-    pdf_parser = PDFParser()
-    chunking_service = ChunkingService()
-    vector_store = VectorStoreService()
-    registry = PDFRegistry()
+    Parse, chunk and embed errors fail only this PDF; write errors propagate
+    so the whole session is rolled back.
+    """
+    print(f"Ingesting {pdf_path.name}...")
     
     try:
-        # Register PDF
-        registry.register_pdf(pdf_id, str(pdf_path), pdf_path.name)
-        
         # Parse PDF
-        metadata, atoms = pdf_parser.parse_pdf(str(pdf_path), pdf_id=pdf_id)
+        with profiler.stage("parse", pdf_path.name) as record:
+            metadata, atoms = pdf_parser.parse_pdf(str(pdf_path), pdf_id=pdf_id)
+            record["items"] = len(atoms)
         print(f"  Parsed {len(atoms)} atoms from {metadata.total_pages} pages")
         
         # Chunk atoms
-        chunks = chunking_service.group_atoms_into_chunks(
-            atoms=atoms,
-            pdf_id=pdf_id
-        )
+        with profiler.stage("chunk", pdf_path.name) as record:
+            chunks = chunking_service.group_atoms_into_chunks(
+                atoms=atoms,
+                pdf_id=pdf_id
+            )
+            record["items"] = len(chunks)
         print(f"  Created {len(chunks)} chunks")
         
-        # Add to vector store
+        embeddings = []
         if chunks:
-            vector_store.add_chunks(chunks)
-            print(f"  ✓ Successfully ingested {pdf_path.name}")
-        else:
-            print(f"  ⚠ No chunks created for {pdf_path.name}")
-        
-        return True
+            with profiler.stage("embed", pdf_path.name) as record:
+                embeddings = vector_store.embed_chunks(chunks)
+                record["items"] = len(embeddings)
     except Exception as e:
         print(f"  ✗ Error ingesting {pdf_path.name}: {str(e)}")
         return False
+    
+    # Add to the session (written in batches, published on commit)
+    if chunks:
+        with profiler.stage("store", pdf_path.name) as record:
+            session.add(chunks, embeddings)
+            record["items"] = len(chunks)
+        print(f"  ✓ Successfully ingested {pdf_path.name}")
+    else:
+        print(f"  ⚠ No chunks created for {pdf_path.name}")
+    
+    return True
 
 
 def generate_pdf_id(file_path: Path) -> str:
@@ -65,8 +92,27 @@ def generate_pdf_id(file_path: Path) -> str:
     return hash_obj.hexdigest()[:32]
 
 
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Ingest PDFs from the data directory")
+    parser.add_argument("--profile", action="store_true", help="Record per-stage timing and memory")
+    parser.add_argument(
+        "--profile-output",
+        default="ingest_profile.json",
+        help="Where --profile writes its JSON report (default: ingest_profile.json)"
+    )
+    parser.add_argument(
+        "--cprofile-dir",
+        default=None,
+        help="With --profile, also dump cProfile stats per PDF and stage into this directory"
+    )
+    return parser.parse_args()
+
+
 async def main():
     """Main function to ingest all PDFs from data directory."""
+    args = parse_args()
+    profiler = StageProfiler(enabled=args.profile, cprofile_dir=args.cprofile_dir)
     data_dir = Path(__file__).parent.parent / "data"
     
     if not data_dir.exists():
@@ -82,24 +128,42 @@ async def main():
     print(f"Found {len(pdf_files)} PDF file(s) to process\n")
     
     registry = PDFRegistry()
+    pdf_parser = PDFParser()
+    chunking_service = ChunkingService()
+    vector_store = VectorStoreService()
     results = []
+    ingested = []
     skipped = 0
     
-    for pdf_file in pdf_files:
-        # Check if PDF is already registered
-        if registry.is_pdf_registered(str(pdf_file.resolve())):
-            existing_pdf_id = registry.get_pdf_id_by_path(str(pdf_file.resolve()))
-            print(f"⏭ Skipping {pdf_file.name} (already ingested with ID: {existing_pdf_id})")
-            results.append((pdf_file.name, None))  # None indicates skipped
-            skipped += 1
+    with vector_store.write_session() as session:
+        for pdf_file in pdf_files:
+            # Check if PDF is already registered
+            if registry.is_pdf_registered(str(pdf_file.resolve())):
+                existing_pdf_id = registry.get_pdf_id_by_path(str(pdf_file.resolve()))
+                print(f"⏭ Skipping {pdf_file.name} (already ingested with ID: {existing_pdf_id})")
+                results.append((pdf_file.name, None))  # None indicates skipped
+                skipped += 1
+                print()
+                continue
+            
+            # Generate deterministic ID based on file path
+            pdf_id = generate_pdf_id(pdf_file)
+            success = await ingest_pdf_file(
+                pdf_file, pdf_id, profiler, pdf_parser, chunking_service, vector_store, session
+            )
+            results.append((pdf_file.name, success))
+            if success:
+                ingested.append((pdf_id, pdf_file))
             print()
-            continue
         
-        # Generate deterministic ID based on file path
-        pdf_id = generate_pdf_id(pdf_file)
-        success = await ingest_pdf_file(pdf_file, pdf_id)
-        results.append((pdf_file.name, success))
-        print()
+        with profiler.stage("commit", "all PDFs"):
+            version = session.commit()
+    print(f"Committed corpus version {version}")
+    
+    # Register only what was committed, so a failed run is retried next time
+    for pdf_id, pdf_file in ingested:
+        registry.register_pdf(pdf_id, str(pdf_file), pdf_file.name)
+    print()
     
     # Summary
     print("=" * 50)
@@ -122,6 +186,18 @@ async def main():
             status = "✗"
             note = ""
         print(f"  {status} {filename}{note}")
+    
+    if args.profile:
+        report = profiler.write_report(args.profile_output)
+        print()
+        print(f"Profile written to {args.profile_output}")
+        for stage, totals in report["stages"].items():
+            print(
+                f"  {stage:<6} wall {totals['wall_s']:8.2f}s  cpu {totals['cpu_s']:8.2f}s  "
+                f"peak alloc {totals['peak_alloc_mb']:8.1f} MiB  items {totals['items']}"
+            )
+        if report["process_peak_rss_mb"] is not None:
+            print(f"  process peak RSS {report['process_peak_rss_mb']:.1f} MiB")
 
 
 if __name__ == "__main__":
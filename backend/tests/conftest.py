@@ -0,0 +1,5 @@
+"""Shared test setup."""
+import os
+
+# Settings require an API key on first use; no test makes API calls
+os.environ.setdefault("OPENAI_API_KEY", "test")
@@ -0,0 +1,99 @@
+"""Tests for LLM admission control."""
+import asyncio
+import threading
+import time
+import pytest
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def test_slots_are_released():
+    controller = AdmissionController(max_concurrent=2, max_queue=0, queue_timeout_s=1)
+    with controller.slot("a"), controller.slot("b"):
+        with pytest.raises(AdmissionRejected):
+            controller.acquire("c")
+    with controller.slot("c"):
+        pass
+
+
+def test_release_is_idempotent():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout_s=1)
+    slot = controller.acquire()
+    slot.release()
+    slot.release()
+    with controller.slot(), pytest.raises(AdmissionRejected):
+        controller.acquire()
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_s=5)
+    held = controller.acquire("a")
+    waiter = threading.Thread(target=lambda: controller.acquire("b").release())
+    waiter.start()
+    while controller.queue_depth == 0:
+        time.sleep(0.001)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check()
+    assert rejected.value.retry_after >= 1
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("c")
+
+    held.release()
+    waiter.join()
+    assert controller.queue_depth == 0
+    controller.check()
+
+
+def test_wait_times_out():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout_s=0.05)
+    with controller.slot():
+        with pytest.raises(AdmissionRejected, match="Timed out"):
+            controller.acquire()
+    assert controller.queue_depth == 0
+    controller.acquire().release()
+
+
+def test_freed_slots_rotate_between_clients():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, queue_timeout_s=5)
+    order = []
+
+    def work(client_id, tag):
+        with controller.slot(client_id):
+            order.append(tag)
+
+    held = controller.acquire("busy")
+    threads = []
+    for client_id, tag in [("busy", "busy1"), ("busy", "busy2"), ("busy", "busy3"), ("other", "other1")]:
+        thread = threading.Thread(target=work, args=(client_id, tag))
+        thread.start()
+        threads.append(thread)
+        while controller.queue_depth < len(threads):
+            time.sleep(0.001)
+    held.release()
+    for thread in threads:
+        thread.join()
+
+    # The other client is served before the busy client's later requests
+    assert order == ["busy1", "other1", "busy2", "busy3"]
+
+
+def test_async_wait_is_granted_and_cancelled():
+    async def main():
+        controller = AdmissionController(max_concurrent=1, max_queue=2, queue_timeout_s=5)
+        held = await controller.aacquire("a")
+        granted = asyncio.create_task(controller.aacquire("b"))
+        cancelled = asyncio.create_task(controller.aacquire("c"))
+        await asyncio.sleep(0.01)
+        assert controller.queue_depth == 2
+
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert controller.queue_depth == 1
+
+        held.release()
+        (await granted).release()
+        async with controller.aslot("d"):
+            pass
+
+    asyncio.run(main())
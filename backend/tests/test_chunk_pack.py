@@ -0,0 +1,94 @@
+"""Tests for publishing chunk packs and switching readers to new versions."""
+import pytest
+from app.config import settings
+from app.models.chunk import Atom, BBox, Chunk
+from app.services.chunk_pack import ChunkPackStore
+from app.services.chunk_storage import ChunkStorageService, ReadOnlyStorageError
+
+
+def make_chunk(chunk_id: str, text: str, pdf_id: str = "rules") -> Chunk:
+    """Chunk with one atom per word."""
+    atoms = []
+    position = 0
+    for index, word in enumerate(text.split()):
+        atoms.append(Atom(
+            text=word,
+            page_num=0,
+            bbox=BBox(x0=index * 20, y0=100, x1=index * 20 + 18, y1=110),
+            char_start=position,
+            char_end=position + len(word)
+        ))
+        position += len(word) + 1
+    return Chunk(chunk_id=chunk_id, text=text, atoms=atoms, pdf_id=pdf_id, page_start=0, page_end=0)
+
+
+def test_publish_applies_updates_to_the_current_pack(tmp_path):
+    store = ChunkPackStore(tmp_path, keep=2)
+    assert store.current_version() == 0
+    assert store.open(0) is None
+
+    first = store.publish({"a": ("rules", b'{"n":1}')}, seed=lambda: [("seed", "old", b'{"n":0}')])
+    assert first.version == 1
+    assert sorted(first.chunk_ids()) == ["a", "seed"]
+
+    second = store.publish({"a": ("rules", b'{"n":2}'), "b": ("rules", b'{"n":3}')}, seed=lambda: [])
+    assert store.current_version() == 2
+    assert second.get_bytes("a") == b'{"n":2}'
+    assert second.get_bytes("seed") == b'{"n":0}'
+    assert second.chunk_ids("rules") == ["a", "b"]
+    # The older pack is still readable through its own mapping
+    assert first.get_bytes("a") == b'{"n":1}'
+
+    store.publish({}, seed=lambda: [])
+    assert store.open(1) is None
+    assert store.open(2) is not None
+
+
+def test_reader_switches_to_a_published_version(tmp_path):
+    writer = ChunkStorageService(str(tmp_path), read_only=False)
+    writer.save_chunks([make_chunk("a", "Roll the dice"), make_chunk("b", "Move the robber")])
+    assert writer.publish() == 1
+
+    reader = ChunkStorageService(str(tmp_path), read_only=True)
+    assert reader.version == 1
+    assert reader.get_chunk("a").text == "Roll the dice"
+    assert set(reader.get_chunks(["a", "b", "missing"])) == {"a", "b"}
+
+    writer.save_chunk(make_chunk("a", "Roll both dice"))
+    writer.save_chunk(make_chunk("c", "Build a road", pdf_id="expansion"))
+    assert writer.publish() == 2
+
+    # Until it refreshes, the reader keeps serving the version it has
+    assert reader.get_chunk("a").text == "Roll the dice"
+    assert reader.get_chunk("c") is None
+    assert reader.refresh(force=True)
+    assert reader.version == 2
+    assert reader.get_chunk("a").text == "Roll both dice"
+    assert [chunk.chunk_id for chunk in reader.get_chunks_by_pdf("expansion")] == ["c"]
+    assert not reader.refresh(force=True)
+
+
+def test_reader_checks_for_new_versions_at_most_once_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "version_check_interval_s", 3600)
+    writer = ChunkStorageService(str(tmp_path), read_only=False)
+    writer.save_chunk(make_chunk("a", "Roll the dice"))
+    writer.publish()
+    reader = ChunkStorageService(str(tmp_path), read_only=True)
+
+    writer.save_chunk(make_chunk("b", "Move the robber"))
+    writer.publish()
+    assert not reader.refresh()
+    assert reader.version == 1
+    assert reader.refresh(force=True)
+
+
+def test_reader_rejects_writes(tmp_path):
+    writer = ChunkStorageService(str(tmp_path), read_only=False)
+    writer.save_chunk(make_chunk("a", "Roll the dice"))
+    writer.publish()
+    reader = ChunkStorageService(str(tmp_path), read_only=True)
+
+    with pytest.raises(ReadOnlyStorageError):
+        reader.save_chunk(make_chunk("b", "Move the robber"))
+    with pytest.raises(ReadOnlyStorageError):
+        reader.publish()
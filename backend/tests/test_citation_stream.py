@@ -0,0 +1,45 @@
+"""Tests for incremental citation marker parsing."""
+import pytest
+from app.services.citation_stream import CitationStreamParser
+
+ANSWER = "Roll the dice. [[CITE:abc-1]]Each player rolls two dice[[/CITE]] Then trade."
+
+
+def parse(tokens):
+    """Feed tokens one by one; return the released text and the citations."""
+    parser = CitationStreamParser()
+    events = [event for token in tokens for event in parser.feed(token)] + parser.flush()
+    text = "".join(data for kind, data in events if kind == "token")
+    citations = [data for kind, data in events if kind == "citation"]
+    return text, citations
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(ANSWER)])
+def test_markers_are_stripped_however_the_stream_is_split(size):
+    tokens = [ANSWER[i:i + size] for i in range(0, len(ANSWER), size)]
+    text, citations = parse(tokens)
+    assert text == "Roll the dice. Each player rolls two dice Then trade."
+    assert citations == [("abc-1", "Each player rolls two dice")]
+
+
+def test_text_is_released_as_soon_as_it_cannot_be_a_marker():
+    parser = CitationStreamParser()
+    assert parser.feed("Roll [[") == [("token", "Roll ")]
+    assert parser.feed("x") == [("token", "[[x")]
+
+
+def test_stray_closing_marker_is_dropped():
+    assert parse(["a [[/CITE]]b"]) == ("a b", [])
+
+
+def test_overlong_chunk_id_is_passed_through_as_text():
+    answer = "[[CITE:" + "x" * 200
+    assert parse([answer]) == (answer, [])
+
+
+def test_flush_releases_an_unterminated_opening_marker():
+    assert parse(["See [[CITE:abc"]) == ("See [[CITE:abc", [])
+
+
+def test_flush_releases_an_unterminated_quote_without_a_citation():
+    assert parse(["See [[CITE:abc]]the quote [[/CI"]) == ("See the quote [[/CI", [])
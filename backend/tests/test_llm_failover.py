@@ -0,0 +1,105 @@
+"""Tests for hedged requests and circuit breakers across LLM providers."""
+import asyncio
+import time
+import pytest
+from langchain_core.messages import AIMessageChunk
+from app.services.llm_failover import CircuitBreaker, FailoverLLM, ProvidersUnavailable
+
+
+class FakeModel:
+    """Chat model that streams fixed chunks, optionally after delays, or fails."""
+
+    def __init__(self, chunks=("answer",), first_delay=0.0, stall_after=None, error=None):
+        self.chunks = list(chunks)
+        self.first_delay = first_delay
+        # Index of the chunk before which the model stalls for a long time
+        self.stall_after = stall_after
+        self.error = error
+        self.calls = 0
+
+    def _delay(self, index):
+        if index == 0:
+            return self.first_delay
+        return 5.0 if index == self.stall_after else 0.0
+
+    def stream(self, prompt):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        for index, content in enumerate(self.chunks):
+            time.sleep(self._delay(index))
+            yield AIMessageChunk(content=content)
+
+    async def astream(self, prompt):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        for index, content in enumerate(self.chunks):
+            await asyncio.sleep(self._delay(index))
+            yield AIMessageChunk(content=content)
+
+
+def failover(*models, hedge_after_ms=50, failure_threshold=2, reset_timeout_s=60):
+    return FailoverLLM(
+        [(f"provider{index}", model) for index, model in enumerate(models)],
+        hedge_after_ms, failure_threshold, reset_timeout_s
+    )
+
+
+def test_breaker_opens_and_admits_one_trial():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout_s=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_provider_is_replaced_and_skipped_once_open():
+    broken = FakeModel(error=RuntimeError("503"))
+    healthy = FakeModel(chunks=["ok"])
+    llm = failover(broken, healthy)
+    for _ in range(3):
+        assert llm.invoke("q").content == "ok"
+    assert broken.calls == 2
+    assert llm.providers[0].breaker.state == "open"
+
+
+def test_last_error_is_raised_when_no_provider_is_left():
+    llm = failover(FakeModel(error=RuntimeError("first")), FakeModel(error=RuntimeError("second")), failure_threshold=1)
+    with pytest.raises(RuntimeError, match="second"):
+        llm.invoke("q")
+    with pytest.raises(ProvidersUnavailable):
+        llm.invoke("q")
+
+
+def test_slow_provider_is_hedged():
+    slow = FakeModel(chunks=["slow"], first_delay=2.0)
+    fast = FakeModel(chunks=["fast"])
+    llm = failover(slow, fast)
+    started = time.perf_counter()
+    assert llm.invoke("q").content == "fast"
+    assert time.perf_counter() - started < 1.0
+
+
+def test_empty_first_chunk_does_not_win_the_race():
+    # Sends headers at once, then stalls before any content
+    stalls = FakeModel(chunks=["", "late"], stall_after=1)
+    fast = FakeModel(chunks=["", "fast"], first_delay=0.01)
+    llm = failover(stalls, fast)
+    started = time.perf_counter()
+    assert llm.invoke("q").content == "fast"
+    assert time.perf_counter() - started < 1.0
+
+    async def main():
+        return [chunk.content async for chunk in failover(stalls, fast).astream("q")]
+
+    # The winner's empty chunks are passed on ahead of its content
+    assert asyncio.run(main()) == ["", "fast"]
@@ -0,0 +1,180 @@
+"""Tests for single-flight coalescing of identical requests."""
+import asyncio
+import threading
+import pytest
+from app.services.single_flight import EventStream, SingleFlight
+
+
+def events_then_error(events, error):
+    """Producer that publishes some events and then fails."""
+    yield from events
+    raise error
+
+
+def test_call_shares_the_leaders_result():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.call("key", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.call("key", work))) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join()
+
+    assert calls == [1]
+    assert results == ["answer"] * 4
+    # Nothing is cached once the flight has landed
+    assert flights.call("key", lambda: "fresh") == "fresh"
+
+
+def test_call_shares_the_leaders_error():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    errors = []
+
+    def ask():
+        try:
+            flights.call("key", fail)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=ask)]
+    threads[0].start()
+    started.wait(5)
+    threads.append(threading.Thread(target=ask))
+    threads[1].start()
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ["boom", "boom"]
+
+
+def test_event_stream_replays_to_late_subscribers():
+    stream = EventStream()
+    stream.join()
+    stream.publish("a")
+    stream.publish("b")
+    stream.join()
+    late = stream.subscribe()
+    assert next(late) == "a"
+    stream.publish("c")
+    stream.close()
+    assert list(late) == ["b", "c"]
+    assert list(stream.subscribe()) == ["a", "b", "c"]
+
+
+def test_event_stream_reraises_the_producer_error():
+    stream = EventStream()
+    stream.join()
+    stream.run(events_then_error(["a"], RuntimeError("lost")))
+    events = stream.subscribe()
+    assert next(events) == "a"
+    with pytest.raises(RuntimeError, match="lost"):
+        next(events)
+
+
+def test_thread_producer_is_read_on_the_event_loop():
+    async def main():
+        stream = EventStream()
+        stream.join()
+        release = threading.Event()
+
+        def produce():
+            yield "retrieved"
+            release.wait(5)
+            yield "done"
+
+        producer = threading.Thread(target=stream.run, args=(produce(),))
+        producer.start()
+        events = stream.asubscribe()
+        assert await events.__anext__() == "retrieved"
+        release.set()
+        assert [event async for event in events] == ["done"]
+        producer.join()
+
+    asyncio.run(main())
+
+
+def test_stream_leader_hands_off_to_followers():
+    async def main():
+        flights = SingleFlight()
+        release = asyncio.Event()
+        starts = []
+
+        async def produce():
+            yield "retrieved"
+            await release.wait()
+            yield "token"
+            yield "done"
+
+        def start(stream):
+            starts.append(stream)
+            return asyncio.get_running_loop().create_task(stream.arun(produce()))
+
+        async def read():
+            return [event async for event in flights.stream("key", start).asubscribe()]
+
+        leader = asyncio.create_task(read())
+        await asyncio.sleep(0.01)
+        followers = [asyncio.create_task(read()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        results = await asyncio.gather(leader, *followers)
+
+        assert len(starts) == 1
+        assert results == [["retrieved", "token", "done"]] * 4
+        # A finished stream is not joined by new requests
+        flights.stream("key", start)
+        assert len(starts) == 2
+
+    asyncio.run(main())
+
+
+def test_stream_is_cancelled_only_when_every_reader_leaves():
+    async def main():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def produce():
+            try:
+                yield "first"
+                await asyncio.sleep(10)
+            finally:
+                cancelled.set()
+
+        def start(stream):
+            return asyncio.get_running_loop().create_task(stream.arun(produce()))
+
+        first = flights.stream("key", start).asubscribe()
+        second = flights.stream("key", start).asubscribe()
+        assert await first.__anext__() == "first"
+        assert await second.__anext__() == "first"
+
+        await first.aclose()
+        await asyncio.sleep(0.01)
+        assert not cancelled.is_set()
+
+        await second.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+    asyncio.run(main())
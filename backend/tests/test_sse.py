@@ -0,0 +1,89 @@
+"""Tests for SSE framing and token coalescing."""
+import asyncio
+import json
+from app.api.routes.query import QueryRequest, SSEEventEncoder, generate_sse_events
+from app.models.response import SourceReference
+from app.utils.sse import TokenCoalescer, format_sse_event
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def parse_frame(frame: str) -> tuple:
+    """Event name and data of one SSE frame, joining data lines as a client does."""
+    lines = frame.rstrip("\n").split("\n")
+    event = lines[0][len("event: "):]
+    return event, "\n".join(line[len("data: "):] for line in lines[1:])
+
+
+def test_multiline_data_is_framed_per_line():
+    frame = format_sse_event("token", "first\nsecond\r\nthird")
+    assert frame == "event: token\ndata: first\ndata: second\ndata: third\n\n"
+    assert parse_frame(frame) == ("token", "first\nsecond\nthird")
+
+
+def test_coalescer_flushes_on_size():
+    coalescer = TokenCoalescer(max_bytes=6, max_delay_ms=1000, clock=FakeClock())
+    assert coalescer.add("ab") is None
+    assert coalescer.add("") is None
+    # Counted in UTF-8 bytes: "é" is two
+    assert coalescer.add("éé") == "abéé"
+    assert coalescer.flush() is None
+
+
+def test_coalescer_flushes_on_delay():
+    clock = FakeClock()
+    coalescer = TokenCoalescer(max_bytes=100, max_delay_ms=20, clock=clock)
+    assert coalescer.time_until_flush() is None
+    assert coalescer.add("a") is None
+    clock.now = 0.015
+    assert abs(coalescer.time_until_flush() - 0.005) < 1e-9
+    assert coalescer.add("b") is None
+    clock.now = 0.025
+    assert coalescer.time_until_flush() == 0.0
+    assert coalescer.add("c") == "abc"
+
+
+def test_encoder_flushes_tokens_before_other_events():
+    encoder = SSEEventEncoder(QueryRequest(question="q", stream_flush_bytes=100, stream_flush_ms=1000))
+    assert encoder.encode("token", "Roll ") == []
+    assert encoder.encode("token", "the dice") == []
+    source = SourceReference(chunk_id="c1", quote_char_start=0, quote_char_end=4)
+    frames = [parse_frame(frame) for frame in encoder.encode("sources", [source])]
+    assert frames[0] == ("token", "Roll the dice")
+    assert frames[1][0] == "sources"
+    assert json.loads(frames[1][1]) == [{"chunk_id": "c1", "quote_char_start": 0, "quote_char_end": 4}]
+
+    event, data = parse_frame(encoder.encode("done", None)[0])
+    assert (event, json.loads(data)) == ("done", {"frames": 3})
+
+
+def test_zero_flush_bytes_sends_every_token():
+    encoder = SSEEventEncoder(QueryRequest(question="q", stream_flush_bytes=0, stream_flush_ms=1000))
+    assert len(encoder.encode("token", "a")) == 1
+    assert len(encoder.encode("token", "b")) == 1
+
+
+def test_buffered_tokens_are_sent_when_the_next_event_is_slow():
+    async def main():
+        request = QueryRequest(question="q", stream_flush_bytes=100, stream_flush_ms=20)
+        release = asyncio.Event()
+
+        async def events():
+            yield ("token", "early")
+            await release.wait()
+            yield ("done", None)
+
+        frames = generate_sse_events(events(), request)
+        first = await asyncio.wait_for(frames.__anext__(), 1)
+        assert parse_frame(first) == ("token", "early")
+        release.set()
+        rest = [parse_frame(frame)[0] async for frame in frames]
+        assert rest == ["done"]
+
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""Tests for journaled write sessions and their rollback."""
+import pytest
+from app.config import settings
+from app.models.chunk import Chunk
+from app.services.vector_store import VectorStoreService
+from app.services.write_session import journal_path, recover_write_session
+
+
+def make_chunk(chunk_id: str, text: str) -> Chunk:
+    return Chunk(chunk_id=chunk_id, text=text, atoms=[], pdf_id="rules", page_start=0, page_end=0)
+
+
+def embeddings(count: int) -> list:
+    return [[0.1, 0.2, 0.3, float(index)] for index in range(count)]
+
+
+@pytest.fixture
+def vector_store(tmp_path, monkeypatch):
+    """Writer with four seed chunks published as version 1."""
+    monkeypatch.setattr(settings, "chroma_persist_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "worker_role", "standalone")
+    store = VectorStoreService(collection_name="write_session_test")
+    with store.write_session() as session:
+        session.add([make_chunk(f"seed{i}", f"seed {i}") for i in range(4)], embeddings(4))
+    return store
+
+
+def stored(store: VectorStoreService) -> dict:
+    """Chunk ID -> text, read from Chroma and checked against the chunk store."""
+    collection = store.collection_for_write()
+    got = collection.get(include=["documents"])
+    documents = dict(zip(got["ids"], got["documents"]))
+    files = {path.stem for path in store.chunk_storage.storage_dir.glob("*.json")}
+    assert files == set(documents)
+    return documents
+
+
+def test_commit_publishes_one_version(vector_store):
+    with vector_store.write_session(batch_size=2) as session:
+        session.add([make_chunk(f"new{i}", f"new {i}") for i in range(5)], embeddings(5))
+    assert vector_store.chunk_storage.packs.current_version() == 2
+    assert len(stored(vector_store)) == 9
+    assert not journal_path().exists()
+
+
+def test_rollback_restores_both_stores(vector_store):
+    before = stored(vector_store)
+    with pytest.raises(RuntimeError):
+        with vector_store.write_session(batch_size=2) as session:
+            session.add(
+                [make_chunk("seed1", "replaced")] + [make_chunk(f"new{i}", f"new {i}") for i in range(4)],
+                embeddings(5)
+            )
+            raise RuntimeError("ingest failed")
+
+    assert stored(vector_store) == before
+    assert vector_store.chunk_storage.get_chunk("seed1").text == "seed 1"
+    assert vector_store.chunk_storage.packs.current_version() == 1
+    assert not journal_path().exists()
+
+
+def test_recovery_rolls_back_an_interrupted_session(vector_store):
+    before = stored(vector_store)
+    session = vector_store.write_session(batch_size=2).__enter__()
+    chunks = [make_chunk("seed2", "replaced"), make_chunk("new0", "new 0"), make_chunk("new1", "new 1")]
+    session.add(chunks, embeddings(3))
+    # The process dies here: two chunks were written, nothing was published
+    session._journal.close()
+    vector_store._write_lock.release()
+    assert journal_path().exists()
+
+    assert recover_write_session(vector_store) == "rolled_back"
+    assert stored(vector_store) == before
+    assert vector_store.chunk_storage.get_chunk("seed2").text == "seed 2"
+    assert not journal_path().exists()
+    assert recover_write_session(vector_store) is None
+
+
+def test_recovery_keeps_a_published_session(vector_store):
+    session = vector_store.write_session().__enter__()
+    session.add([make_chunk("new0", "new 0")], embeddings(1))
+    session.flush()
+    vector_store.chunk_storage.publish()
+    # The process dies after publishing, before removing the journal
+    session._journal.close()
+    vector_store._write_lock.release()
+
+    assert recover_write_session(vector_store) == "committed"
+    assert "new0" in stored(vector_store)
+    assert not journal_path().exists()
@@ -6,14 +6,20 @@ import ChatMessage from './components/ChatMessage';
 import CatanLogo from './components/CatanLogo';
 import PDFModal from './components/PDFModal';
 import Card from './components/ui/Card';
-import { queryQuestionStream, getChunk, ConversationMessage } from '@/lib/api';
-import { computePDFHighlights } from '@/lib/pdfHighlights';
+import {
+  queryQuestionStream,
+  getChunk,
+  getChunks,
+  getHighlight,
+  ConversationMessage,
+} from '@/lib/api';
 import type {
   SourceReference,
   ChunkResponse,
   CitationRange,
   BBox,
   Message,
+  RetrievedChunk,
 } from '@/lib/types';
 
 const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -30,14 +36,44 @@ export default function Home() {
   const [pdfHighlights, setPdfHighlights] = useState<BBox[]>([]);
 
   const answerRef = useRef<string>('');
+  // Keys the server's history summary cache; created on the first question
+  const conversationIdRef = useRef<string | null>(null);
+  const chunkCacheRef = useRef(new Map<string, Promise<ChunkResponse>>());
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   };
 
+  const fetchChunk = (chunkId: string): Promise<ChunkResponse> => {
+    const cached = chunkCacheRef.current.get(chunkId);
+    if (cached) return cached;
+    const request = getChunk(chunkId);
+    chunkCacheRef.current.set(chunkId, request);
+    request.catch(() => chunkCacheRef.current.delete(chunkId));
+    return request;
+  };
+
+  const prefetchChunks = (chunkIds: string[]) => {
+    const missingIds = chunkIds.filter((id) => !chunkCacheRef.current.has(id));
+    if (missingIds.length === 0) return;
+
+    // One batch request fills the cache entry of every missing chunk
+    const batch = getChunks(missingIds);
+    missingIds.forEach((chunkId) => {
+      const request = batch.then((chunks) => {
+        const chunk = chunks.find((c) => c.chunk_id === chunkId);
+        if (!chunk) throw new Error(`Chunk ${chunkId} not found`);
+        return chunk;
+      });
+      chunkCacheRef.current.set(chunkId, request);
+      request.catch(() => chunkCacheRef.current.delete(chunkId));
+    });
+  };
+
   const handleQuery = async (question: string) => {
     const messageId = Date.now().toString();
+    conversationIdRef.current ??= crypto.randomUUID();
 
     // Build conversation history from previous messages
     const conversationHistory: ConversationMessage[] = messages.flatMap((msg) => [
@@ -71,7 +107,7 @@ export default function Home() {
             if (receivedSources.length > 0) {
               try {
                 const chunkPromises = receivedSources.map((source) =>
-                  getChunk(source.chunk_id)
+                  fetchChunk(source.chunk_id)
                 );
                 const fetchedChunks = await Promise.all(chunkPromises);
 
@@ -87,6 +123,32 @@ export default function Home() {
               }
             }
           },
+          onRetrieved: (retrievedChunks: RetrievedChunk[]) => {
+            // Warm the chunk cache while the answer is still generating
+            prefetchChunks(retrievedChunks.map((chunk) => chunk.chunk_id));
+          },
+          onCitation: async (source: SourceReference) => {
+            // Fetch each cited chunk as soon as its citation closes so
+            // highlights are ready before the answer finishes
+            try {
+              const chunk = await fetchChunk(source.chunk_id);
+              setMessages((prev) =>
+                prev.map((msg) =>
+                  msg.id === messageId
+                    ? {
+                        ...msg,
+                        sources: [...msg.sources, source],
+                        chunks: msg.chunks.some((c) => c.chunk_id === chunk.chunk_id)
+                          ? msg.chunks
+                          : [...msg.chunks, chunk],
+                      }
+                    : msg
+                )
+              );
+            } catch (err) {
+              console.error('Error fetching chunk:', err);
+            }
+          },
           onToken: (token: string) => {
             answerRef.current += token;
             setMessages((prev) =>
@@ -120,7 +182,8 @@ export default function Home() {
           },
         },
         5,
-        conversationHistory
+        conversationHistory,
+        conversationIdRef.current ?? undefined
       );
     } catch (err) {
       setError(
@@ -138,17 +201,29 @@ export default function Home() {
   };
 
   const handleCitationClick = useCallback(
-    (range: CitationRange) => {
+    async (range: CitationRange) => {
+      const { chunk_id, quote_char_start, quote_char_end } = range.source;
       // Find the message containing this source
       for (const message of messages) {
-        const chunk = message.chunks.find((c) => c.chunk_id === range.source.chunk_id);
+        const chunk = message.chunks.find((c) => c.chunk_id === chunk_id);
         if (chunk) {
-          const highlights = computePDFHighlights(range.source, chunk);
-          const pageHighlight = highlights.find((h) => h.pageNum === chunk.page_start);
+          // The server resolves the quote to merged per-line rectangles
+          let bboxes: BBox[] = [];
+          let pageNum = chunk.page_start;
+          try {
+            const highlight = await getHighlight(chunk_id, quote_char_start, quote_char_end);
+            const pageHighlight = highlight.highlights[0];
+            if (pageHighlight) {
+              pageNum = pageHighlight.page_num;
+              bboxes = pageHighlight.bboxes.map(([x0, y0, x1, y1]) => ({ x0, y0, x1, y1 }));
+            }
+          } catch (err) {
+            console.error('Error fetching highlight:', err);
+          }
 
           setPdfUrl(`${apiUrl}/api/pdf/${chunk.pdf_id}`);
-          setPdfPage(chunk.page_start + 1);
-          setPdfHighlights(pageHighlight?.bboxes || []);
+          setPdfPage(pageNum + 1);
+          setPdfHighlights(bboxes);
           setPdfModalOpen(true);
           break;
         }
@@ -5,7 +5,10 @@ import type {
   QueryResponse,
   IngestionResponse,
   ChunkResponse,
+  ChunkBatchResponse,
+  HighlightResponse,
   SourceReference,
+  RetrievedChunk,
 } from './types';
 
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
@@ -35,6 +38,8 @@ export interface ConversationMessage {
 
 export interface StreamCallbacks {
   onSources: (sources: SourceReference[]) => void;
+  onCitation?: (source: SourceReference) => void;
+  onRetrieved?: (chunks: RetrievedChunk[]) => void;
   onToken: (token: string) => void;
   onDone: () => void;
   onError: (error: string) => void;
@@ -44,7 +49,8 @@ export const queryQuestionStream = async (
   question: string,
   callbacks: StreamCallbacks,
   k: number = 5,
-  conversationHistory: ConversationMessage[] = []
+  conversationHistory: ConversationMessage[] = [],
+  conversationId?: string
 ): Promise<void> => {
   const response = await fetch(`${API_BASE_URL}/api/query/stream`, {
     method: 'POST',
@@ -55,6 +61,7 @@ export const queryQuestionStream = async (
       question,
       k,
       conversation_history: conversationHistory,
+      conversation_id: conversationId,
     }),
   });
 
@@ -79,34 +86,13 @@ export const queryQuestionStream = async (
       }
 
       buffer += decoder.decode(value, { stream: true });
-      
-      // Process complete SSE events from the buffer
-      const lines = buffer.split('\n');
-      buffer = '';
-
-      let currentEvent = '';
-      let currentData = '';
-
-      for (const line of lines) {
-        if (line.startsWith('event: ')) {
-          currentEvent = line.slice(7).trim();
-        } else if (line.startsWith('data: ')) {
-          currentData = line.slice(6);
-        } else if (line === '' && currentEvent && currentData !== '') {
-          // Empty line signals end of event
-          handleSSEEvent(currentEvent, currentData, callbacks);
-          currentEvent = '';
-          currentData = '';
-        } else if (line !== '') {
-          // Incomplete event, keep in buffer
-          buffer = line;
-        }
-      }
 
-      // Keep any incomplete event in the buffer
-      if (currentEvent || currentData) {
-        if (currentEvent) buffer = `event: ${currentEvent}\n`;
-        if (currentData) buffer += `data: ${currentData}\n`;
+      // Events are terminated by a blank line; keep any partial event buffered
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        dispatchSSEEvent(buffer.slice(0, boundary), callbacks);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
       }
     }
   } finally {
@@ -114,6 +100,27 @@ export const queryQuestionStream = async (
   }
 };
 
+const dispatchSSEEvent = (
+  rawEvent: string,
+  callbacks: StreamCallbacks
+): void => {
+  let event = 'message';
+  const dataLines: string[] = [];
+
+  for (const line of rawEvent.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      // Multi-line payloads arrive as consecutive data lines
+      dataLines.push(line.slice(5).replace(/^ /, ''));
+    }
+  }
+
+  if (dataLines.length > 0) {
+    handleSSEEvent(event, dataLines.join('\n'), callbacks);
+  }
+};
+
 const handleSSEEvent = (
   event: string,
   data: string,
@@ -128,10 +135,24 @@ const handleSSEEvent = (
         console.error('Failed to parse sources:', e);
       }
       break;
+    case 'retrieved':
+      try {
+        const chunks = JSON.parse(data) as RetrievedChunk[];
+        callbacks.onRetrieved?.(chunks);
+      } catch (e) {
+        console.error('Failed to parse retrieved chunks:', e);
+      }
+      break;
+    case 'citation':
+      try {
+        const source = JSON.parse(data) as SourceReference;
+        callbacks.onCitation?.(source);
+      } catch (e) {
+        console.error('Failed to parse citation:', e);
+      }
+      break;
     case 'token':
-      // Unescape newlines that were escaped for SSE transport
-      const unescapedToken = data.replace(/\\n/g, '\n');
-      callbacks.onToken(unescapedToken);
+      callbacks.onToken(data);
       break;
     case 'done':
       callbacks.onDone();
@@ -152,6 +173,25 @@ export const getChunk = async (chunkId: string): Promise<ChunkResponse> => {
   return response.data;
 };
 
+export const getChunks = async (chunkIds: string[]): Promise<ChunkResponse[]> => {
+  const response = await apiClient.post<ChunkBatchResponse>('/api/chunks', {
+    ids: chunkIds,
+  });
+  return response.data.chunks;
+};
+
+export const getHighlight = async (
+  chunkId: string,
+  start: number,
+  end: number
+): Promise<HighlightResponse> => {
+  const response = await apiClient.get<HighlightResponse>(
+    `/api/chunks/${chunkId}/highlight`,
+    { params: { start, end } }
+  );
+  return response.data;
+};
+
 export const ingestPDF = async (file: File): Promise<IngestionResponse> => {
   const formData = new FormData();
   formData.append('file', file);
@@ -31,14 +31,44 @@ export interface SourceReference {
   quote_char_end: number;
 }
 
+export interface RetrievalFilter {
+  pdf_ids?: string[];
+  page_min?: number;
+  page_max?: number;
+  section_prefix?: string;
+}
+
 export interface QueryRequest {
   question: string;
   k?: number;
+  filters?: RetrievalFilter;
+}
+
+export interface RetrievedChunk {
+  chunk_id: string;
+  pdf_id: string;
+  page_start: number;
+  page_end: number;
+  section_title?: string;
+  /** [page_num, x0, y0, x1, y1, char_start, char_end] per atom, when requested */
+  atoms?: number[][];
+}
+
+export interface ContextUsage {
+  context_tokens: number;
+  token_budget: number;
+  chunks_retrieved: number;
+  chunks_included: number;
+  chunks_truncated: number;
+  /** Reported by the LLM provider after a non-streamed answer */
+  prompt_tokens?: number | null;
+  cached_prompt_tokens?: number | null;
 }
 
 export interface QueryResponse {
   answer: string;
   sources: SourceReference[];
+  usage?: ContextUsage;
 }
 
 export interface IngestionResponse {
@@ -58,6 +88,22 @@ export interface ChunkResponse {
   atoms: Atom[];
 }
 
+export interface ChunkBatchResponse {
+  chunks: ChunkResponse[];
+  missing: string[];
+}
+
+export interface PageHighlight {
+  page_num: number;
+  bboxes: number[][];
+}
+
+export interface HighlightResponse {
+  chunk_id: string;
+  pdf_id: string;
+  highlights: PageHighlight[];
+}
+
 export interface CitationRange {
   sourceIndex: number;
   source: SourceReference;
@@ -66,11 +112,6 @@ export interface CitationRange {
   quoteText: string;
 }
 
-export interface PDFHighlight {
-  pageNum: number;
-  bboxes: BBox[];
-}
-
 export interface Message {
   id: string;
   question: string;